@@ -50,7 +50,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'services.authentication.ClaimsJWTAuthentication',
     ],
 }
 
@@ -60,8 +60,29 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'USER_ID_FIELD': 'username',
     'USER_ID_CLAIM': 'username',
+    'TOKEN_REFRESH_SERIALIZER': 'services.authentication.RevocableTokenRefreshSerializer',
 }
 
+# Views that read and write through services.repositories (pymongo) instead
+# of the ORM. Set FIXMATE_REPOSITORY_VIEWS to a comma-separated subset, or to
+# an empty string to put every view back on the ORM.
+REPOSITORY_VIEWS = set(filter(None, os.environ.get('FIXMATE_REPOSITORY_VIEWS', ','.join([
+    'get_user_profile', 'provider_detail', 'create_booking',
+    'get_user_bookings', 'provider_bookings', 'provider_reviews', 'provider_profile',
+])).split(',')))
+
+# Per-request query counts and timings (Server-Timing header, log line), and a
+# warning when one query shape runs more than QUERY_REPEAT_THRESHOLD times
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', 'True') == 'True'
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+
+# Translated SELECT templates kept per process by services.translation_cache
+# (0 turns the cache off)
+DJONGO_TRANSLATION_CACHE_SIZE = int(os.environ.get('DJONGO_TRANSLATION_CACHE_SIZE', 512))
+
+# How long a worker trusts its last read of the token revocation list
+JWT_REVOCATION_MEMO_SECONDS = 30
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     'http://127.0.0.1:3000',
@@ -73,6 +94,7 @@ if FRONTEND_URL:
 CORS_ALLOW_CREDENTIALS = True
 
 MIDDLEWARE = [
+    'services.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,6 +102,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'services.middleware.ProviderMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -119,6 +142,49 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Local memory by default; point FIXMATE_CACHE_BACKEND/LOCATION at a shared
+# store (file-based, Redis, memcached...) so workers share cached data and
+# version stamps (services.W003 warns about local memory outside DEBUG)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('FIXMATE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('FIXMATE_CACHE_LOCATION', 'fixmate'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Per-process tier of services.provider_cache (entries) and how long the
+# shared tier keeps a provider (seconds; versions handle invalidation)
+PROVIDER_CACHE_SIZE = int(os.environ.get('PROVIDER_CACHE_SIZE', 2048))
+PROVIDER_CACHE_TIMEOUT = int(os.environ.get('PROVIDER_CACHE_TIMEOUT', 60 * 60))
+
+# Shared listing pages (services.listing): how long the server keeps an
+# unused page, and the Cache-Control max-age sent with anonymous pages
+LISTING_CACHE_TIMEOUT = int(os.environ.get('LISTING_CACHE_TIMEOUT', 10 * 60))
+LISTING_MAX_AGE = int(os.environ.get('LISTING_MAX_AGE', 5 * 60))
+
+# Longest a process keeps its category catalog (services.catalog) without
+# reloading, in seconds; saves through the ORM reload it straight away
+CATEGORY_CATALOG_TTL = int(os.environ.get('CATEGORY_CATALOG_TTL', 5 * 60))
+
+# Cache rebuilds (services.singleflight): whether processes coordinate through
+# a lock in the cache backend, how long a lock may be held and how long a
+# caller waits for someone else's result before computing it itself (seconds)
+SINGLEFLIGHT_DISTRIBUTED = os.environ.get('SINGLEFLIGHT_DISTRIBUTED', 'True') == 'True'
+SINGLEFLIGHT_LOCK_TIMEOUT = int(os.environ.get('SINGLEFLIGHT_LOCK_TIMEOUT', 30))
+SINGLEFLIGHT_WAIT = float(os.environ.get('SINGLEFLIGHT_WAIT', 5))
+
+# ETags on the read endpoints (services.conditional): True, False, or unset
+# to send them only with a shared cache backend, whose version stamps they
+# digest
+CONDITIONAL_ETAGS = {'True': True, 'False': False}.get(os.environ.get('CONDITIONAL_ETAGS', ''))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
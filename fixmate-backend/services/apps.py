@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ServicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'services'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        
+        if settings.QUERY_INSTRUMENTATION:
+            from . import instrumentation
+            instrumentation.install()
+        
+        if settings.DJONGO_TRANSLATION_CACHE_SIZE > 0:
+            from . import translation_cache
+            translation_cache.install(settings.DJONGO_TRANSLATION_CACHE_SIZE)
+        
+        from . import catalog
+        catalog.preload()
@@ -0,0 +1,169 @@
+"""
+JWT authentication without a database read per request
+
+Tokens issued at login/register carry the caller's identity as claims: the
+canonical user_id, user_type, is_provider and the provider _id. Requests
+authenticated with such a token get a ClaimsUser built from those claims
+instead of a User loaded from Mongo. Tokens issued before the claims
+existed still authenticate the old way.
+
+Tokens can be revoked one at a time (by jti) or all at once for a user
+(everything issued before a point in time). Revocations are stored in the
+token_revocation collection, shared by every worker, until the tokens they
+cover expire (TTL index). Each worker remembers what it read for
+REVOCATION_MEMO_SECONDS, so a revocation reaches other workers within that
+delay and the revoking worker straight away.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import identity
+from .models import TokenRevocation
+
+REVOCATION_MEMO_SECONDS = getattr(settings, 'JWT_REVOCATION_MEMO_SECONDS', 30)
+
+# Bounds the memo; it is cleared outright when full
+REVOCATION_MEMO_SIZE = 10000
+
+# revocation _id -> (read at, document or None)
+_revocation_memo = {}
+
+
+class IdentityRefreshToken(RefreshToken):
+    """Refresh token carrying the identity claims"""
+
+    @classmethod
+    def for_user(cls, user, user_id=None, user_type='customer', is_provider=False, provider_id=None):
+        token = super().for_user(user)
+        token['user_id'] = user_id if user_id is not None else identity.user_id_for(user)
+        token['user_type'] = user_type
+        token['is_provider'] = is_provider
+        token['provider_id'] = str(provider_id) if provider_id is not None else None
+        token['is_staff'] = user.is_staff
+        return token
+
+
+class ClaimsUser(TokenUser):
+    """Authenticated user backed only by the token's claims"""
+
+    def __init__(self, token):
+        super().__init__(token)
+        # Read by identity.user_id_for, so no UserIdentity lookup either
+        self._canonical_user_id = token['user_id']
+
+    @property
+    def user_type(self):
+        return self.token.get('user_type', 'customer')
+
+    @property
+    def is_provider(self):
+        return self.token.get('is_provider', False)
+
+    @property
+    def provider_id(self):
+        return self.token.get('provider_id')
+
+
+def _jti_key(jti):
+    return f'jti:{jti}'
+
+
+def _user_key(username):
+    return f'user:{username}'
+
+
+def _remaining_lifetime(token):
+    return max(int(token['exp'] - time.time()), 1)
+
+
+def _expires_at(seconds):
+    # Naive UTC, as djongo stores DateTimeFields
+    return timezone.now().replace(tzinfo=None) + timedelta(seconds=seconds)
+
+
+def revoke_token(token):
+    """Revoke one token until it would have expired anyway"""
+    key = _jti_key(token[api_settings.JTI_CLAIM])
+    TokenRevocation.objects.mongo_update_one(
+        {'_id': key},
+        {'$set': {'expires_at': _expires_at(_remaining_lifetime(token))}},
+        upsert=True,
+    )
+    _revocation_memo.pop(key, None)
+
+
+def revoke_user_tokens(username):
+    """Revoke every token issued to a user up to now"""
+    key = _user_key(username)
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    TokenRevocation.objects.mongo_update_one(
+        {'_id': key},
+        {'$max': {'revoked_before': int(time.time())}, '$set': {'expires_at': _expires_at(lifetime)}},
+        upsert=True,
+    )
+    _revocation_memo.pop(key, None)
+
+
+def _stored_revocations(keys):
+    now = time.monotonic()
+    values = {}
+    stale = []
+    for key in keys:
+        memo = _revocation_memo.get(key)
+        if memo is not None and now - memo[0] < REVOCATION_MEMO_SECONDS:
+            values[key] = memo[1]
+        else:
+            stale.append(key)
+    if stale:
+        if len(_revocation_memo) >= REVOCATION_MEMO_SIZE:
+            _revocation_memo.clear()
+        fetched = {doc['_id']: doc for doc in TokenRevocation.objects.mongo_find({'_id': {'$in': stale}})}
+        for key in stale:
+            values[key] = fetched.get(key)
+            _revocation_memo[key] = (now, values[key])
+    return values
+
+
+def is_revoked(token):
+    jti_key = _jti_key(token[api_settings.JTI_CLAIM])
+    user_key = _user_key(token.get(api_settings.USER_ID_CLAIM))
+    revocations = _stored_revocations([jti_key, user_key])
+    if revocations[jti_key] is not None:
+        return True
+    revoked_before = (revocations[user_key] or {}).get('revoked_before')
+    return revoked_before is not None and token.get('iat', 0) <= revoked_before
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication returning a ClaimsUser when the token has the identity claims"""
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token):
+            raise InvalidToken('Token has been revoked')
+        return validated_token
+
+    def get_user(self, validated_token):
+        if 'user_id' not in validated_token or api_settings.USER_ID_CLAIM not in validated_token:
+            # Issued before the identity claims - load the user as before
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses to mint access tokens from a revoked refresh token"""
+    token_class = IdentityRefreshToken
+
+    def validate(self, attrs):
+        if is_revoked(self.token_class(attrs['refresh'])):
+            raise InvalidToken('Token has been revoked')
+        return super().validate(attrs)
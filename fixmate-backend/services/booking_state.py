@@ -0,0 +1,90 @@
+"""
+Booking state machine
+
+Every transition is a single find_one_and_update whose filter includes the
+statuses the booking is allowed to move from. Two concurrent actions on the
+same booking can't both succeed, and nothing is read before the write.
+"""
+from bson import ObjectId
+from django.utils import timezone
+from pymongo import ReturnDocument
+
+from .models import Booking, from_document
+from . import conditional, rollups
+
+
+class TransitionError(Exception):
+    pass
+
+
+class BookingNotFound(TransitionError):
+    """No booking with this id in the caller's scope"""
+
+
+class InvalidTransition(TransitionError):
+    """The booking exists but its current status doesn't allow the transition"""
+
+    def __init__(self, current_status):
+        super().__init__(current_status)
+        self.current_status = current_status
+
+
+# name -> (statuses it may move from, status it moves to)
+TRANSITIONS = {
+    'accept': (('pending',), 'accepted'),
+    'reject': (('pending',), 'rejected'),
+    'complete': (('pending', 'accepted'), 'completed'),
+    'cancel': (('pending', 'accepted'), 'cancelled'),
+}
+
+
+def _transition(name, booking_id, scope, changes):
+    """
+    Apply a transition atomically and return the updated Booking
+    Raises InvalidId for a malformed booking_id.
+    """
+    allowed, target = TRANSITIONS[name]
+    object_id = ObjectId(booking_id)
+    changes = dict(changes, status=target)
+
+    previous = Booking.objects.mongo_find_one_and_update(
+        {'_id': object_id, **scope, 'status': {'$in': list(allowed)}},
+        {'$set': changes},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if previous is None:
+        # Only the failure path pays for a second query, to tell the two cases apart
+        current = Booking.objects.mongo_find_one({'_id': object_id, **scope}, {'status': 1})
+        if current is None:
+            raise BookingNotFound(booking_id)
+        raise InvalidTransition(current.get('status'))
+
+    booking = from_document(Booking, dict(previous, **changes))
+    rollups.record_status_change(booking, previous['status'])
+    conditional.invalidate_bookings(booking)
+    return booking
+
+
+def accept(booking_id, provider_id):
+    return _transition('accept', booking_id, {'provider_id': str(provider_id)}, {
+        'provider_status': 'accepted',
+    })
+
+
+def reject(booking_id, provider_id):
+    return _transition('reject', booking_id, {'provider_id': str(provider_id)}, {
+        'provider_status': 'rejected',
+    })
+
+
+def complete(booking_id, provider_id, completion_notes=''):
+    return _transition('complete', booking_id, {'provider_id': str(provider_id)}, {
+        'provider_status': 'completed',
+        'completion_notes': completion_notes,
+        'completed_at': timezone.now(),
+    })
+
+
+def cancel(booking_id, user_id):
+    """Customer-side cancellation"""
+    return _transition('cancel', booking_id, {'user_id': user_id}, {})
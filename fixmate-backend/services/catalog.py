@@ -0,0 +1,112 @@
+"""
+In-memory catalog of service categories
+
+The category table is a handful of rows that almost never change, so every
+process keeps all of them in memory. The catalog is loaded in
+ServicesConfig.ready() when serving, or on first use otherwise. It's reloaded
+when the 'categories' version stamp moves (ServiceCategory saves and deletes
+bump it, see signals) and, as a backstop for writes that bypass the ORM, at
+least every CATEGORY_CATALOG_TTL seconds. A lookup costs one cache read and
+no queries.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DatabaseError
+from pymongo.errors import PyMongoError
+
+from . import versions
+from .models import ServiceCategory, normalize_key
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAMESPACE = 'categories'
+TTL = getattr(settings, 'CATEGORY_CATALOG_TTL', 5 * 60)
+
+_Snapshot = namedtuple('_Snapshot', ['version', 'loaded_at', 'categories', 'by_key'])
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _load(version):
+    global _snapshot
+    categories = tuple(ServiceCategory.objects.all())
+    snapshot = _Snapshot(
+        version=version,
+        loaded_at=time.monotonic(),
+        categories=categories,
+        by_key={category.category_key: category for category in categories},
+    )
+    _snapshot = snapshot
+    logger.info(f"📚 Category catalog loaded: {len(categories)} categories")
+    return snapshot
+
+
+def _current():
+    # The version is read before the table, so a write racing with the load
+    # leaves the catalog under the older version and it's reloaded next time
+    version = versions.get_version(VERSION_NAMESPACE)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.loaded_at < TTL:
+        return snapshot
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.loaded_at < TTL:
+            return snapshot
+        return _load(version)
+
+
+def version():
+    """Current version stamp of the category table"""
+    return versions.get_version(VERSION_NAMESPACE)
+
+
+def invalidate():
+    """The category table changed: every process reloads on its next lookup"""
+    versions.bump_version(VERSION_NAMESPACE)
+
+
+def categories():
+    """All categories, in table order"""
+    return _current().categories
+
+
+def get(category_name):
+    """
+    A category by name or key (normalized as category_key), raising
+    ServiceCategory.DoesNotExist like objects.get()
+    """
+    category = _current().by_key.get(normalize_key(category_name))
+    if category is None:
+        raise ServiceCategory.DoesNotExist(f'No category "{category_name}"')
+    return category
+
+
+def clear():
+    """Forget this process's catalog; the next lookup reloads it"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def _serving():
+    """False for manage.py commands other than runserver (migrate, collectstatic, ...)"""
+    argv = sys.argv
+    if not argv or not argv[0].endswith('manage.py'):
+        return True
+    return argv[1:2] == ['runserver']
+
+
+def preload():
+    """Load the catalog at startup; a failure only defers loading to the first lookup"""
+    if not _serving():
+        return
+    try:
+        _current()
+    except (DatabaseError, PyMongoError) as e:
+        logger.warning(f"⚠️ Category catalog not preloaded: {e}")
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.checks import Warning, register, Tags
+from pymongo.errors import PyMongoError
+
+from . import versions
+from .indexes import missing_indexes
+
+
+@register(Tags.database)
+def check_indexes(app_configs, databases=None, **kwargs):
+    """
+    Warn about declared indexes missing from MongoDB
+    Database checks only run on `migrate` and `check --database default`
+    """
+    if not databases or 'default' not in databases:
+        return []
+
+    try:
+        missing = missing_indexes()
+    except PyMongoError as e:
+        return [Warning(f'Could not verify MongoDB indexes: {e}', id='services.W002')]
+
+    return [
+        Warning(
+            f'Index "{name}" on {model._meta.db_table} {[key for key, _ in keys]} is missing.',
+            hint='Run "python manage.py ensure_indexes" to build it in the background.',
+            obj=model,
+            id='services.W001',
+        )
+        for model, name, keys in missing
+    ]
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when version stamps live in a per-process cache outside DEBUG
+    Writes on one worker would never reach the providers, listing pages and
+    social proof cached by the others, and their ETags would stay valid.
+    """
+    if settings.DEBUG or versions.shared():
+        return []
+    return [
+        Warning(
+            f"CACHES['default'] ({settings.CACHES['default']['BACKEND']}) is per process, so cached "
+            "providers, listing pages and social proof aren't invalidated across workers.",
+            hint='Point FIXMATE_CACHE_BACKEND at a shared cache (Redis, memcached, file-based) '
+                 'when running more than one worker process.',
+            id='services.W003',
+        )
+    ]
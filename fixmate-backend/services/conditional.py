@@ -0,0 +1,156 @@
+"""
+ETags for the read endpoints the frontend re-fetches after every action
+
+Each ETag is a digest of the version counters (services.versions) of
+everything its response is built from, so it costs a few cache reads. Used
+through revalidated() below @api_view, after authentication, permissions
+and content negotiation have run, a matching If-None-Match is answered 304
+before the view queries or serializes anything.
+
+Counters and their writers:
+- categories: see services.catalog
+- listing, provider: see services.listing and services.provider_cache
+- social_proof: the per-user overlay on listings and detail pages
+- bookings_user, bookings_provider: booking inserts and status changes;
+  bookings for everyone on bulk writes (generate_dataset)
+
+Customer names and addresses on a provider's bookings aren't versioned;
+they only change at registration.
+
+The counters are only shared between workers with a shared cache backend;
+with a per-process one, another worker could answer 304 for data that
+changed, so ETags are left out unless CONDITIONAL_ETAGS says otherwise.
+"""
+import hashlib
+from functools import wraps
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import etag
+
+from . import catalog, identity, listing, provider_cache, singleflight, versions
+from .models import Booking, ServiceProvider, normalize_key
+
+USER_BOOKINGS = 'bookings_user'
+PROVIDER_BOOKINGS = 'bookings_provider'
+ALL_BOOKINGS = 'bookings'
+
+BOOKED_PROVIDERS_TIMEOUT = 60 * 60
+
+
+def etags_enabled():
+    enabled = getattr(settings, 'CONDITIONAL_ETAGS', None)
+    return versions.shared() if enabled is None else enabled
+
+
+def revalidated(etag_func):
+    """
+    etag() plus "Cache-Control: no-cache", so browsers keep the response and
+    send If-None-Match on every re-fetch. Personalized responses are private.
+    Views that set their own Cache-Control, and 304s (which refresh the
+    stored response's headers), are left alone. Responses built from stale
+    values (services.singleflight) go out without an ETag, and so does
+    everything when etags_enabled() is False.
+    """
+    def decorator(view):
+        conditional_view = etag(etag_func)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            singleflight.reset_stale()
+            if etags_enabled():
+                response = conditional_view(request, *args, **kwargs)
+            else:
+                response = view(request, *args, **kwargs)
+            if singleflight.served_stale() and response.has_header('ETag'):
+                del response['ETag']
+            if response.status_code != 304 and not response.has_header('Cache-Control'):
+                if request.user.is_authenticated:
+                    patch_cache_control(response, private=True, no_cache=True)
+                else:
+                    patch_cache_control(response, no_cache=True)
+            return response
+        return inner
+    return decorator
+
+
+def invalidate_bookings(booking):
+    """A booking was created or changed status"""
+    if booking.user_id is not None:
+        versions.bump_version(USER_BOOKINGS, booking.user_id)
+    if booking.provider_id:
+        versions.bump_version(PROVIDER_BOOKINGS, str(booking.provider_id))
+
+
+def invalidate_all_bookings():
+    """For bulk writes that can't name the users and providers they touched"""
+    versions.bump_version(ALL_BOOKINGS)
+
+
+def _etag(request, *parts):
+    # The same URL is rendered as JSON or the browsable API (Vary: Accept)
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = (getattr(renderer, 'format', None),) + parts
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _viewer(request):
+    """The user a response is personalized for, with their social proof version"""
+    if not request.user.is_authenticated:
+        return None
+    user_id = identity.request_user_id(request)
+    return user_id, versions.get_version('social_proof', user_id)
+
+
+def home_etag(request):
+    return _etag(request, catalog.version())
+
+
+def service_providers_etag(request, category_name):
+    category_key = normalize_key(category_name)
+    return _etag(
+        request, catalog.version(), listing.listing_version(category_key), _viewer(request),
+    )
+
+
+def provider_detail_etag(request, provider_id):
+    try:
+        provider_id = str(ObjectId(provider_id))
+    except (InvalidId, TypeError):
+        return None
+    return _etag(
+        request, versions.get_version(provider_cache.VERSION_NAMESPACE, provider_id), _viewer(request),
+    )
+
+
+def _booked_provider_ids(user_id, booking_versions):
+    """Providers the user has bookings with, kept until their booking set changes"""
+    key = f"booked_providers:{user_id}:{':'.join(str(version) for version in booking_versions)}"
+    provider_ids = cache.get(key)
+    if provider_ids is None:
+        provider_ids = sorted(str(provider_id) for provider_id in
+                              Booking.objects.mongo_distinct('provider_id', {'user_id': user_id}))
+        cache.set(key, provider_ids, BOOKED_PROVIDERS_TIMEOUT)
+    return provider_ids
+
+
+def user_bookings_etag(request):
+    # Bookings show their provider's name, category and phone
+    user_id = identity.request_user_id(request)
+    booking_versions = (versions.get_version(ALL_BOOKINGS), versions.get_version(USER_BOOKINGS, user_id))
+    provider_ids = _booked_provider_ids(user_id, booking_versions)
+    provider_versions = versions.get_versions(provider_cache.VERSION_NAMESPACE, provider_ids)
+    return _etag(request, booking_versions, sorted(provider_versions.items()))
+
+
+def provider_bookings_etag(request):
+    try:
+        provider_id = str(request.provider._id)
+    except ServiceProvider.DoesNotExist:
+        return None
+    return _etag(
+        request, versions.get_version(ALL_BOOKINGS), versions.get_version(PROVIDER_BOOKINGS, provider_id),
+    )
@@ -0,0 +1,167 @@
+"""
+Streaming exports of bookings and reviews
+
+Documents are read from a server-side Mongo cursor batch by batch and
+written out as NDJSON or CSV as they arrive, optionally gzipped on the fly,
+so an export holds one batch in memory no matter how many documents match.
+Used by the export_data view and management command.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from bson import ObjectId
+
+from .models import Booking, Review, from_document
+
+FORMATS = ('ndjson', 'csv')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+MAX_BATCH_SIZE = 10000
+
+# dataset -> (model, exported fields, filters accepted besides the date range)
+DATASETS = {
+    'bookings': (Booking, [
+        '_id', 'user_id', 'provider_id', 'booking_date', 'booking_time', 'status', 'provider_status',
+        'notes', 'completion_notes', 'created_at', 'completed_at',
+    ], {'status', 'provider_id'}),
+    'reviews': (Review, [
+        'id', 'user_id', 'provider_id', 'rating', 'comment', 'is_trusted', 'service_date', 'created_at',
+    ], {'provider_id'}),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def build_query(dataset, params):
+    """
+    Mongo filter for an export
+    params: 'from'/'to' (inclusive created_at dates), plus 'status' (comma
+    separated) and 'provider_id' where the dataset has them.
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown export '{dataset}'; expected one of {', '.join(DATASETS)}")
+    _, _, filters = DATASETS[dataset]
+
+    query = {}
+    created = {}
+    if params.get('from'):
+        created['$gte'] = datetime.datetime.combine(_parse_date(params['from'], 'from'), datetime.time.min)
+    if params.get('to'):
+        # created_at is stored as naive UTC; 'to' takes in the whole day
+        next_day = _parse_date(params['to'], 'to') + datetime.timedelta(days=1)
+        created['$lt'] = datetime.datetime.combine(next_day, datetime.time.min)
+    if created:
+        query['created_at'] = created
+
+    if 'status' in filters and params.get('status'):
+        statuses = [status.strip() for status in params['status'].split(',') if status.strip()]
+        known = {status for status, _ in Booking.STATUS_CHOICES}
+        unknown = set(statuses) - known
+        if unknown:
+            raise ExportError(f"Unknown status: {', '.join(sorted(unknown))}")
+        query['status'] = {'$in': statuses}
+    if 'provider_id' in filters and params.get('provider_id'):
+        query['provider_id'] = params['provider_id']
+    return query
+
+
+def parse_batch_size(value, default=1000):
+    if value in (None, ''):
+        return default
+    try:
+        batch_size = int(value)
+    except (TypeError, ValueError):
+        raise ExportError('batch_size must be a number')
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise ExportError(f'batch_size must be between 1 and {MAX_BATCH_SIZE}')
+    return batch_size
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def _rows(model, field_names, query, batch_size):
+    fields = [model._meta.get_field(name) for name in field_names]
+    projection = {field.column: 1 for field in fields}
+    cursor = model.objects.mongo_find(query, projection).batch_size(batch_size)
+    for document in cursor:
+        instance = from_document(model, document)
+        yield [_plain(instance.__dict__.get(field.attname)) for field in fields]
+
+
+def _ndjson(field_names, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(field_names, row)), separators=(',', ':')) + '\n'
+
+
+def _csv(field_names, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(field_names)
+    for row in rows:
+        yield line(['' if value is None else value for value in row])
+
+
+def _batched(lines, batch_size):
+    """Join lines into one chunk per batch, so the response isn't written row by row"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= batch_size:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream(dataset, query, export_format='ndjson', batch_size=1000, gzip=False):
+    """Iterator of encoded chunks of the export; nothing is read until it's consumed"""
+    model, field_names, _ = DATASETS[dataset]
+    rows = _rows(model, field_names, query, batch_size)
+    lines = _csv(field_names, rows) if export_format == 'csv' else _ndjson(field_names, rows)
+    chunks = _batched(lines, batch_size)
+    return _gzipped(chunks) if gzip else chunks
+
+
+def filename(dataset, export_format, gzip=False):
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    name = f'{dataset}-{datetime.date.today().isoformat()}.{extension}'
+    return f'{name}.gz' if gzip else name
@@ -0,0 +1,155 @@
+"""
+Canonical integer user ids
+
+Profiles, providers, bookings and reviews all store an integer user_id.
+It used to be re-derived from user.pk on every call, with a fallback on
+the per-process salted hash(). Now it is derived once per user, stored in
+UserIdentity (unique on both columns) and read back from there, so every
+worker agrees on it. When the derived id already belongs to another user,
+the next of a few alternates is stored instead.
+"""
+import functools
+import hashlib
+import logging
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+
+from .models import UserIdentity
+
+logger = logging.getLogger(__name__)
+
+# Derived id plus alternates tried when another user holds it
+MAX_ATTEMPTS = 5
+
+
+class UserIdUnavailable(Exception):
+    """Every candidate user_id for a user pk belongs to another user"""
+
+
+def _derive_user_id(user_pk):
+    """
+    Integer id for a user that doesn't have one yet
+    Same rules the old per-call conversion used, so ids already stored in
+    profiles and providers keep matching.
+    """
+    if isinstance(user_pk, int):
+        return user_pk
+
+    if isinstance(user_pk, ObjectId):
+        return int(str(user_pk)[-9:], 16)
+
+    if isinstance(user_pk, str):
+        try:
+            return int(str(ObjectId(user_pk))[-9:], 16)
+        except (InvalidId, TypeError):
+            pass
+        try:
+            return int(user_pk)
+        except ValueError:
+            pass
+
+    # Stable across processes, unlike hash()
+    return int(hashlib.sha1(str(user_pk).encode('utf-8')).hexdigest(), 16) % (10 ** 10)
+
+
+def _candidate_user_ids(user_pk):
+    yield _derive_user_id(user_pk)
+    for attempt in range(1, MAX_ATTEMPTS):
+        yield int(hashlib.sha1(f'{user_pk}:{attempt}'.encode('utf-8')).hexdigest(), 16) % (10 ** 10)
+
+
+@functools.lru_cache(maxsize=10000)
+def _stored_user_id(key):
+    # Only successful lookups are cached; a mapping never changes once stored
+    return UserIdentity.objects.get(user_pk=key).user_id
+
+
+def user_id_for_pk(user_pk):
+    """Canonical user_id for a Django user pk, created on first use"""
+    key = str(user_pk)
+    try:
+        return _stored_user_id(key)
+    except UserIdentity.DoesNotExist:
+        pass
+
+    for user_id in _candidate_user_ids(user_pk):
+        try:
+            UserIdentity.objects.create(user_pk=key, user_id=user_id)
+            logger.info(f"✅ Stored user_id {user_id} for user pk {key}")
+            return _stored_user_id(key)
+        except DatabaseError:
+            try:
+                stored = _stored_user_id(key)
+            except UserIdentity.DoesNotExist:
+                stored = None
+            if stored is not None:
+                # Another worker stored it first - theirs is the canonical one
+                logger.info(f"ℹ️ user_id for user pk {key} already stored")
+                return stored
+            if UserIdentity.objects.mongo_find_one({'user_id': user_id}, {'_id': 1}) is None:
+                raise
+            logger.warning(f"⚠️ user_id {user_id} belongs to another user, trying another for user pk {key}")
+    raise UserIdUnavailable(f'No free user_id for user pk {key} after {MAX_ATTEMPTS} attempts')
+
+
+def user_pks_for(user_ids):
+    """
+    {user_id: User pk (or None)} for canonical user ids, in one query
+    An id with no stored mapping belongs to a user who hasn't been resolved
+    since UserIdentity was introduced, and was derived from their integer pk.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    pks = {}
+    stored = UserIdentity.objects.mongo_find({'user_id': {'$in': list(user_ids)}}, {'user_id': 1, 'user_pk': 1})
+    for document in stored:
+        try:
+            pks[document['user_id']] = User._meta.pk.to_python(document['user_pk'])
+        except ValidationError:
+            # Held by something that isn't a Django user (e.g. imported data)
+            pks[document['user_id']] = None
+    for user_id in user_ids - pks.keys():
+        pks[user_id] = user_id
+    return pks
+
+
+def users_by_user_id(user_ids):
+    """
+    {user_id: User} for canonical user ids, in two queries
+    Alternate ids (see _candidate_user_ids) aren't a User.id, so user ids
+    are never looked up as User ids directly.
+    """
+    pks = user_pks_for(user_ids)
+    if not pks:
+        return {}
+    users = {user.pk: user for user in User.objects.filter(pk__in=list(set(pks.values()) - {None}))}
+    return {user_id: users[pk] for user_id, pk in pks.items() if pk in users}
+
+
+def user_for_user_id(user_id):
+    """The User with a canonical user_id, or None"""
+    return users_by_user_id([user_id]).get(user_id)
+
+
+def user_id_for(user):
+    """Canonical user_id for a User, memoized on the user object"""
+    user_id = getattr(user, '_canonical_user_id', None)
+    if user_id is None:
+        user_id = user_id_for_pk(user.pk)
+        user._canonical_user_id = user_id
+    return user_id
+
+
+def request_user_id(request):
+    """Canonical user_id of the authenticated user, resolved once per request"""
+    http_request = getattr(request, '_request', request)
+    user_id = getattr(http_request, '_canonical_user_id', None)
+    if user_id is None:
+        user_id = user_id_for(request.user)
+        http_request._canonical_user_id = user_id
+    return user_id
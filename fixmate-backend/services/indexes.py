@@ -0,0 +1,73 @@
+"""
+MongoDB indexes declared in each model's Meta.indexes, and the unique
+indexes behind its Meta.constraints
+
+Migration 0002 creates them through djongo (a foreground build). On a
+large production collection run `python manage.py ensure_indexes` first:
+it builds the same indexes, under the same names, in the background, and
+the migration then finds them already in place.
+"""
+import pymongo
+from django.apps import apps
+from django.db import connections
+from django.db.models import UniqueConstraint
+
+
+def _collection(model):
+    connection = connections['default']
+    connection.ensure_connection()
+    return connection.connection[model._meta.db_table]
+
+
+def _index_keys(model, index):
+    keys = []
+    for field_name in index.fields:
+        direction = pymongo.ASCENDING
+        if field_name.startswith('-'):
+            field_name = field_name[1:]
+            direction = pymongo.DESCENDING
+        keys.append((model._meta.get_field(field_name).column, direction))
+    return keys
+
+
+def _declared():
+    for model in apps.get_app_config('services').get_models():
+        for index in model._meta.indexes:
+            yield model, index.name, _index_keys(model, index), False
+        for constraint in model._meta.constraints:
+            if isinstance(constraint, UniqueConstraint):
+                yield model, constraint.name, _index_keys(model, constraint), True
+
+
+def expected_indexes():
+    """(model, index name, key list) for every index declared in the services app"""
+    for model, name, keys, _ in _declared():
+        yield model, name, keys
+
+
+def _missing():
+    existing_by_table = {}
+    for model, name, keys, unique in _declared():
+        table = model._meta.db_table
+        if table not in existing_by_table:
+            existing_by_table[table] = [
+                ([(key, int(direction)) for key, direction in info['key']], info.get('unique', False))
+                for info in _collection(model).index_information().values()
+            ]
+        if not any(existing_keys == keys and (existing_unique or not unique)
+                   for existing_keys, existing_unique in existing_by_table[table]):
+            yield model, name, keys, unique
+
+
+def missing_indexes():
+    """Declared indexes that don't exist (with the same keys) in MongoDB"""
+    return [(model, name, keys) for model, name, keys, _ in _missing()]
+
+
+def ensure_indexes(background=True):
+    """Create every missing declared index; returns the ones created"""
+    created = []
+    for model, name, keys, unique in list(_missing()):
+        _collection(model).create_index(keys, name=name, unique=unique, background=background)
+        created.append((model, name, keys))
+    return created
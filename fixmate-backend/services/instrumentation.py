@@ -0,0 +1,151 @@
+"""
+Per-request database instrumentation
+
+A pymongo command listener times every command sent to MongoDB, whether it
+came through djongo or a raw mongo_* call, and files it under the request
+being served (tracked in a context variable). QueryInstrumentationMiddleware
+reports the totals in a Server-Timing header and one log line per request,
+and warns when the same query shape ran more than
+settings.QUERY_REPEAT_THRESHOLD times in a request - the usual sign of an
+N+1 loop.
+"""
+import contextvars
+import json
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Parts of a command that say nothing about its shape
+_IGNORED_KEYS = {'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'documents', 'cursor'}
+
+# Follow-ups of an earlier command rather than queries of their own
+_CONTINUATIONS = {'getMore', 'killCursors', 'endSessions'}
+
+_current = contextvars.ContextVar('query_stats', default=None)
+
+
+class RequestQueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self._pending = {}
+
+    def add(self, shape, duration_ms):
+        self.duration += duration_ms
+        if shape is not None:
+            self.count += 1
+            self.shapes[shape] += 1
+
+    def repeated_shapes(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+def _mask(value):
+    """The structure of a command with every value replaced by ?"""
+    if isinstance(value, dict):
+        return {key: _mask(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in lists of any length, pipelines of any stage count... keep the first
+        return [_mask(value[0])] if value and isinstance(value[0], (dict, list, tuple)) else '[?]'
+    return '?'
+
+
+def query_shape(command_name, command):
+    body = {key: item for key, item in command.items() if key not in _IGNORED_KEYS and key != command_name}
+    collection = command.get(command_name)
+    return f"{command_name} {collection} {json.dumps(_mask(body), sort_keys=True)}"
+
+
+class QueryListener(monitoring.CommandListener):
+    """Files each command's duration under the current request, if any"""
+
+    def started(self, event):
+        stats = _current.get()
+        if stats is None:
+            return
+        shape = None
+        if event.command_name not in _CONTINUATIONS:
+            shape = query_shape(event.command_name, event.command)
+        stats._pending[event.request_id] = shape
+
+    def _finished(self, event):
+        stats = _current.get()
+        if stats is None or event.request_id not in stats._pending:
+            return
+        stats.add(stats._pending.pop(event.request_id), event.duration_micros / 1000.0)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+def install():
+    """Register the listener; must run before the MongoClient is created"""
+    monitoring.register(QueryListener())
+
+
+def record(shape, duration_ms):
+    """
+    File one command under the current request, for clients that don't
+    publish command events (the benchmark suite's in-process stand-in)
+    """
+    stats = _current.get()
+    if stats is not None:
+        stats.add(shape, duration_ms)
+
+
+def current_stats():
+    """Query stats of the request being served, or None outside a request"""
+    return _current.get()
+
+
+class QueryInstrumentationMiddleware:
+    """Server-Timing header, per-request query log line and N+1 warnings"""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = settings.QUERY_REPEAT_THRESHOLD
+
+    def __call__(self, request):
+        stats = RequestQueryStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = (time.perf_counter() - started) * 1000.0
+
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration:.1f};desc="{stats.count} queries", total;dur={total:.1f}'
+        )
+
+        repeated = stats.repeated_shapes(self.threshold)
+        logger.info(
+            f"📊 {request.method} {request.path} status={response.status_code} "
+            f"queries={stats.count} db_ms={stats.duration:.1f} total_ms={total:.1f}",
+            extra={'query_stats': {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_ms': round(stats.duration, 1),
+                'total_ms': round(total, 1),
+                'repeated_shapes': len(repeated),
+            }},
+        )
+        for shape, count in repeated:
+            logger.warning(f"⚠️ Possible N+1 on {request.method} {request.path}: {count}x {shape}")
+
+        return response
@@ -0,0 +1,199 @@
+"""
+Provider listing for service/<category>/
+
+Pages are fetched with keyset pagination straight from the service_provider
+collection: sorted by the chosen field then _id (both descending), filtered
+past the cursor, and projected down to the fields the listing shows. Cost per
+page stays the same however many providers a city has.
+
+The page itself is the same for every visitor, so shared_page() caches it
+under the category's listing version; writes to a provider bump that
+version (invalidate()). Pages are rebuilt through services.singleflight, so
+a burst of requests after a write runs the query once and the rest get the
+previous page meanwhile. Only trusted_by depends on the visitor and is
+merged in by the view afterwards.
+"""
+import base64
+import hashlib
+import json
+
+import pymongo
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+
+from . import catalog, singleflight, social_proof, versions
+from .models import ServiceProvider
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# ?sort= value -> document field
+SORT_FIELDS = {
+    'rating': 'rating',
+    'experience': 'experience_years',
+    'reviews': 'total_reviews',
+}
+
+LISTING_PROJECTION = {
+    '_id': 1,
+    'name': 1,
+    'phone_number': 1,
+    'email': 1,
+    'rating': 1,
+    'total_reviews': 1,
+    'experience_years': 1,
+    'address': 1,
+    'city': 1,
+    'service_area': 1,
+}
+
+VERSION_NAMESPACE = 'listing'
+
+# Versions make stale pages unreachable; this only bounds how long unused ones linger
+CACHE_TIMEOUT = getattr(settings, 'LISTING_CACHE_TIMEOUT', 10 * 60)
+
+
+class InvalidListingQuery(ValueError):
+    """Bad sort, limit or cursor parameter"""
+
+
+def encode_cursor(sort, sort_value, provider_id):
+    payload = json.dumps([sort, sort_value, str(provider_id)]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    """
+    (sort value, provider _id) from a cursor issued for the same ?sort=.
+    The sort value goes straight into the Mongo filter, so anything but a
+    number or null (e.g. {"$ne": null}) is rejected.
+    """
+    try:
+        cursor_sort, sort_value, provider_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        provider_id = ObjectId(provider_id)
+    except (ValueError, TypeError, InvalidId):
+        raise InvalidListingQuery('Invalid cursor')
+    if isinstance(sort_value, bool) or not isinstance(sort_value, (int, float, type(None))):
+        raise InvalidListingQuery('Invalid cursor')
+    if cursor_sort != sort:
+        raise InvalidListingQuery('cursor was issued for another sort')
+    return sort_value, provider_id
+
+
+def parse_listing_params(params):
+    """Validate ?sort=, ?limit= and ?cursor= from the query string"""
+    sort = params.get('sort') or 'rating'
+    if sort not in SORT_FIELDS:
+        raise InvalidListingQuery(f'sort must be one of: {", ".join(SORT_FIELDS)}')
+
+    try:
+        limit = int(params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise InvalidListingQuery('limit must be a number')
+    if limit < 1:
+        raise InvalidListingQuery('limit must be at least 1')
+    limit = min(limit, MAX_LIMIT)
+
+    cursor = params.get('cursor') or None
+    if cursor is not None:
+        cursor = decode_cursor(cursor, sort)
+
+    return sort, limit, cursor
+
+
+def fetch_provider_page(category_key, city_key=None, sort='rating', limit=DEFAULT_LIMIT, cursor=None):
+    """
+    One page of providers as raw documents, plus the cursor for the next page
+    (None on the last page). Filters on the normalized lookup keys, so both
+    filters are exact matches on the provider_category_* indexes. Providers
+    missing the sort field (rows written outside the ORM) come last.
+    """
+    sort_field = SORT_FIELDS[sort]
+
+    query = {'category_key': category_key}
+    if city_key:
+        query['city_key'] = city_key
+    if cursor is not None:
+        sort_value, last_id = cursor
+        if sort_value is None:
+            # Documents without the field sort last (null is the lowest value)
+            query[sort_field] = None
+            query['_id'] = {'$lt': last_id}
+        else:
+            query['$or'] = [
+                {sort_field: {'$lt': sort_value}},
+                {sort_field: sort_value, '_id': {'$lt': last_id}},
+                {sort_field: None},
+            ]
+
+    documents = list(
+        ServiceProvider.objects.mongo_find(query, LISTING_PROJECTION)
+        .sort([(sort_field, pymongo.DESCENDING), ('_id', pymongo.DESCENDING)])
+        .limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor(sort, last.get(sort_field), last['_id'])
+
+    return documents, next_cursor
+
+
+def listing_version(category_key):
+    return versions.get_version(VERSION_NAMESPACE, category_key)
+
+
+def invalidate(category_key):
+    """A provider in this category changed: cached pages of the category are stale"""
+    if category_key is not None:
+        versions.bump_version(VERSION_NAMESPACE, category_key)
+
+
+def invalidate_all():
+    """After bulk writes that may touch any category"""
+    for category in catalog.categories():
+        invalidate(category.category_key)
+
+
+def listing_item(document):
+    """A provider as the listing shows it, with the anonymous trusted_by"""
+    return {
+        'id': str(document['_id']),
+        'name': document.get('name'),
+        'phone': document.get('phone_number'),
+        'email': document.get('email'),
+        'rating': document.get('rating'),
+        'total_reviews': document.get('total_reviews'),
+        'experience_years': document.get('experience_years'),
+        'address': document.get('address'),
+        'city': document.get('city'),
+        'service_area': document.get('service_area'),
+        'trusted_by': social_proof.summarize_trusted([]),
+    }
+
+
+def _page_key(category_key, city_key, sort, limit, cursor):
+    if cursor is not None:
+        cursor = [cursor[0], str(cursor[1])]
+    # Hashed: city names and cursors aren't safe in every cache backend's keys
+    digest = hashlib.sha1(json.dumps([category_key, city_key, sort, limit, cursor]).encode('utf-8')).hexdigest()
+    return f'listing:{digest}'
+
+
+def shared_page(category_key, city_key=None, sort='rating', limit=DEFAULT_LIMIT, cursor=None):
+    """
+    (listing items, next cursor) for a page, identical for every visitor
+    Built once per category/city/sort/page and cached until the category's
+    listing version changes.
+    """
+    def build():
+        documents, next_cursor = fetch_provider_page(
+            category_key, city_key=city_key, sort=sort, limit=limit, cursor=cursor
+        )
+        return [listing_item(document) for document in documents], next_cursor
+
+    key = _page_key(category_key, city_key, sort, limit, cursor)
+    return singleflight.cached(key, listing_version(category_key), build, CACHE_TIMEOUT)
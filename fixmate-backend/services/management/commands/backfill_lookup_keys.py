@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from services.models import ServiceCategory, ServiceProvider, normalize_key
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute category_key/city_key on existing categories and providers '
+        '(migration 0003 fills them in; this repairs rows written outside the ORM)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Documents updated per bulk write (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        updated = self._backfill(
+            ServiceCategory,
+            {'name': 1, 'category_key': 1},
+            lambda doc: {'category_key': normalize_key(doc.get('name'))},
+            batch_size,
+        )
+        self.stdout.write(f'Categories updated: {updated}')
+
+        updated = self._backfill(
+            ServiceProvider,
+            {'category_name': 1, 'city': 1, 'category_key': 1, 'city_key': 1},
+            lambda doc: {
+                'category_key': normalize_key(doc.get('category_name')),
+                'city_key': normalize_key(doc.get('city')),
+            },
+            batch_size,
+        )
+        self.stdout.write(f'Providers updated: {updated}')
+
+        self.stdout.write(self.style.SUCCESS('Lookup keys backfilled'))
+
+    def _backfill(self, model, projection, compute_keys, batch_size):
+        """Stream the collection and only rewrite documents whose keys are stale"""
+        updated = 0
+        operations = []
+        for doc in model.objects.mongo_find({}, projection).batch_size(batch_size):
+            keys = compute_keys(doc)
+            if all(doc.get(field) == value for field, value in keys.items()):
+                continue
+            operations.append(UpdateOne({'_id': doc['_id']}, {'$set': keys}))
+            if len(operations) >= batch_size:
+                updated += model.objects.mongo_bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += model.objects.mongo_bulk_write(operations, ordered=False).modified_count
+        return updated
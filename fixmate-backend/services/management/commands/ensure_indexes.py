@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from services.indexes import ensure_indexes, missing_indexes
+
+
+class Command(BaseCommand):
+    help = 'Create the MongoDB indexes declared in Meta.indexes (background builds)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the indexes that are missing',
+        )
+        parser.add_argument(
+            '--foreground', action='store_true',
+            help='Build in the foreground (faster, blocks the collection on old MongoDB versions)',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            missing = missing_indexes()
+            for model, name, keys in missing:
+                self.stdout.write(f'Missing: {model._meta.db_table}.{name} {keys}')
+            self.stdout.write(self.style.SUCCESS(f'{len(missing)} index(es) missing'))
+            return
+
+        created = ensure_indexes(background=not options['foreground'])
+        for model, name, keys in created:
+            self.stdout.write(f'Created: {model._meta.db_table}.{name} {keys}')
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} index(es) created'))
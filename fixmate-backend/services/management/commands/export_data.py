@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings or reviews to a file (or stdout) as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--format', choices=exports.FORMATS, default='ndjson', help='Default: ndjson')
+        parser.add_argument('--from', dest='from', help='Only documents created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--to', help='Only documents created on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Comma separated booking statuses')
+        parser.add_argument('--provider', dest='provider_id', help='Only this provider')
+        parser.add_argument('--batch-size', default=1000, help='Documents per cursor batch (default: 1000)')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--output', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            query = exports.build_query(options['dataset'], options)
+            batch_size = exports.parse_batch_size(options['batch_size'])
+        except exports.ExportError as e:
+            raise CommandError(str(e))
+
+        chunks = exports.stream(options['dataset'], query, options['format'], batch_size=batch_size,
+                                gzip=options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Exported {options['dataset']} to {options['output']}"))
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,415 @@
+"""
+Synthetic dataset for development and load testing
+
+Generates users (with identities and profiles), contacts, providers across
+CITIES and the service categories, reviews and bookings, and writes them
+with unordered insert_many batches, skipping the ORM. The work is cut into
+fixed-size chunks spread over worker processes; each chunk draws from its
+own generator seeded with (--seed, kind, chunk start), so the same seed and
+counts produce the same data whatever the worker count. Ids are the one
+exception: AutoField ids come from djongo's sequence and ObjectIds carry
+the run's timestamp, so repeated runs add to the collections instead of
+colliding.
+
+Rating aggregates and daily booking rollups are rebuilt at the end.
+"""
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, time as dtime, timedelta
+
+import django
+from bson import ObjectId
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from pymongo.errors import BulkWriteError
+
+from services import conditional, listing, provider_cache, ratings, rollups, social_proof
+from services.models import (
+    ServiceCategory, ServiceProvider, UserIdentity, UserProfile, Contact, Review, Booking, ProviderDailyStats,
+    normalize_key, reserve_ids, to_document,
+)
+
+# Documents generated per task; fixed so the output doesn't depend on the batch size
+CHUNK_SIZE = 10000
+
+CATEGORIES = {
+    'Plumber': 'Expert plumbing services for leaks, installations, and repairs.',
+    'Barber': 'Professional hairstyling and grooming services at your convenience.',
+    'Carpenter': 'Skilled carpenters for furniture, repairs, and custom projects.',
+    'Electrician': 'Certified electricians for installations, repairs, and maintenance.',
+    'AC Service': 'Professional AC maintenance, servicing, and repair solutions.',
+    'Appliance Repair': 'Expert repair services for all your home appliances.',
+}
+
+BUSINESS_NAMES = {
+    'Plumber': ['Plumbing Services', 'Plumbing Works', 'Plumbers', 'Pipe Fitters'],
+    'Barber': ['Hair Studio', 'Gents Salon', 'Barber Shop', 'Cuts & Style'],
+    'Carpenter': ['Wood Works', 'Carpentry', 'Furniture Makers', 'Woodcraft'],
+    'Electrician': ['Electric Works', 'Electricals', 'Power Solutions', 'Wiring Services'],
+    'AC Service': ['AC Services', 'Cooling Solutions', 'AC Repair', 'Cool Care'],
+    'Appliance Repair': ['Appliance Care', 'Repairs Hub', 'Home Appliance Experts', 'Fix All Appliances'],
+}
+
+CITIES = [
+    'Patiala', 'Chandigarh', 'Ludhiana', 'Amritsar', 'Jalandhar', 'Mohali', 'Bathinda', 'Delhi',
+    'Gurugram', 'Noida', 'Jaipur', 'Lucknow', 'Kanpur', 'Agra', 'Dehradun', 'Shimla', 'Mumbai',
+    'Pune', 'Nagpur', 'Ahmedabad', 'Surat', 'Vadodara', 'Indore', 'Bhopal', 'Kolkata', 'Patna',
+    'Bhubaneswar', 'Guwahati', 'Hyderabad', 'Bengaluru', 'Mysuru', 'Chennai', 'Coimbatore',
+    'Kochi', 'Thiruvananthapuram', 'Visakhapatnam', 'Vijayawada', 'Goa', 'Ranchi', 'Raipur',
+]
+
+LOCALITIES = [
+    'Sector 22', 'Model Town', 'Civil Lines', 'Mall Road', 'Urban Estate', 'Old City', 'Station Road',
+    'Gandhi Nagar', 'Shastri Nagar', 'Rajpura Road', 'Green Park', 'Nehru Colony', 'Tripuri Town',
+]
+
+FIRST_NAMES = [
+    'Raj', 'Amit', 'Suresh', 'Rohit', 'Vikram', 'Ankit', 'Rakesh', 'Vijay', 'Ramesh', 'Sunil', 'Deepak',
+    'Manoj', 'Arjun', 'Karan', 'Harpreet', 'Gurpreet', 'Priya', 'Neha', 'Pooja', 'Anjali', 'Simran',
+    'Kavita', 'Sunita', 'Meena', 'Ritu', 'Aarti', 'Sanjay', 'Naveen', 'Imran', 'Farhan', 'Joseph', 'Arun',
+]
+
+LAST_NAMES = [
+    'Kumar', 'Singh', 'Sharma', 'Verma', 'Gupta', 'Mehta', 'Patel', 'Reddy', 'Nair', 'Iyer', 'Das',
+    'Khan', 'Joshi', 'Malhotra', 'Kapoor', 'Chopra', 'Bansal', 'Sandhu', 'Gill', 'Yadav', 'Mishra',
+]
+
+AVAILABILITY = ['Mon-Sat, 9AM-6PM', 'Mon-Sun, 8AM-8PM', 'Mon-Fri, 10AM-7PM', '24x7']
+
+REVIEW_COMMENTS = {
+    1: ['Did not show up on time.', 'Poor work, had to call someone else.'],
+    2: ['Work was okay but overpriced.', 'Took much longer than promised.'],
+    3: ['Average service.', 'Got the job done.'],
+    4: ['Good work, satisfied with the service.', 'Reliable and reasonably priced.'],
+    5: ['Excellent service! Very professional and punctual.', 'Highly recommended!'],
+}
+RATING_WEIGHTS = [4, 6, 15, 35, 40]
+
+# Past bookings have mostly run their course; upcoming ones are still open
+PAST_STATUSES = (['completed', 'cancelled', 'rejected', 'accepted'], [70, 15, 10, 5])
+UPCOMING_STATUSES = (['pending', 'accepted', 'cancelled'], [50, 40, 10])
+PROVIDER_STATUSES = {'accepted', 'rejected', 'completed'}
+
+DUPLICATE_KEY = 11000
+
+# Second id byte of generated ObjectIds, so each kind gets its own range
+PROVIDER_TAG, BOOKING_TAG = 1, 2
+
+
+def _object_id(plan, tag, index):
+    """ObjectId for the index-th generated document of a kind: run timestamp, tag, index"""
+    return ObjectId(plan['epoch'].to_bytes(4, 'big') + bytes([tag]) + index.to_bytes(7, 'big'))
+
+
+def _insert(model, documents):
+    """
+    Returns the number of documents inserted; those that collide with a
+    unique index (a second review by the same user of a provider) are skipped
+    """
+    connection = connections['default']
+    connection.ensure_connection()
+    try:
+        connection.connection[model._meta.db_table].insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(error['code'] != DUPLICATE_KEY for error in e.details['writeErrors']):
+            raise
+        return e.details['nInserted']
+    return len(documents)
+
+
+def _insert_batched(model, documents, batch_size):
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            inserted += _insert(model, batch)
+            batch = []
+    if batch:
+        inserted += _insert(model, batch)
+    return inserted
+
+
+def _popular(rng, count):
+    """Index in range(count) skewed towards the low end, so some providers are busy"""
+    return int(count * rng.random() ** 2)
+
+
+def _customer_user_id(plan, rng):
+    return plan['user_base'] + rng.randrange(plan['customers'])
+
+
+def _provider_user_id(plan, index):
+    return plan['user_base'] + plan['customers'] + index
+
+
+def _phone(plan, user_id):
+    # Customers 8xxxxxxxxx, providers 9xxxxxxxxx; unique as long as the user id is
+    prefix = '9' if user_id >= plan['user_base'] + plan['customers'] else '8'
+    return f'+91-{prefix}{user_id % 10 ** 9:09d}'
+
+
+def _users(plan, rng, start, stop):
+    """Users, identities, profiles and (for customers) contacts for user indexes [start, stop)"""
+    count = stop - start
+    identity_ids = iter(reserve_ids(UserIdentity, count))
+    profile_ids = iter(reserve_ids(UserProfile, count))
+    now = timezone.now()
+    users, identities, profiles, contacts = [], [], [], []
+    for index in range(start, stop):
+        user_id = plan['user_base'] + index
+        is_provider = index >= plan['customers']
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f'{first}{last}{user_id}'.lower()
+        users.append(to_document(User(
+            id=user_id, username=username, password=plan['password'], first_name=first, last_name=last,
+            email=f'{username}@example.com', date_joined=now - timedelta(days=rng.randint(0, 730)),
+        ), add=True))
+        identities.append(to_document(UserIdentity(
+            id=next(identity_ids), user_pk=str(user_id), user_id=user_id,
+        ), add=True))
+        profiles.append(to_document(UserProfile(
+            id=next(profile_ids), user_id=user_id, phone_number=_phone(plan, user_id),
+            address=f'{rng.choice(LOCALITIES)}, {rng.choice(CITIES)}',
+            user_type='provider' if is_provider else 'customer', is_provider=is_provider,
+        ), add=True))
+        if not is_provider:
+            # Friends among the other users, so trusted-by social proof has something to match
+            for _ in range(rng.randint(0, 5)):
+                friend_id = plan['user_base'] + rng.randrange(plan['customers'] + plan['providers'])
+                contacts.append(Contact(
+                    user_id=user_id, name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    phone_number=_phone(plan, friend_id),
+                ))
+    for contact, contact_id in zip(contacts, reserve_ids(Contact, len(contacts))):
+        contact.id = contact_id
+
+    batch_size = plan['batch_size']
+    _insert_batched(User, users, batch_size)
+    _insert_batched(UserIdentity, identities, batch_size)
+    _insert_batched(UserProfile, profiles, batch_size)
+    _insert_batched(Contact, (to_document(contact, add=True) for contact in contacts), batch_size)
+    return {'users': count, 'contacts': len(contacts)}
+
+
+def _providers(plan, rng, start, stop):
+    def documents():
+        for index in range(start, stop):
+            category = plan['categories'][index % len(plan['categories'])]
+            city = rng.choice(CITIES)
+            user_id = _provider_user_id(plan, index)
+            if rng.random() < 0.5:
+                name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            else:
+                name = f'{rng.choice(LAST_NAMES)} {rng.choice(BUSINESS_NAMES.get(category, ["Services"]))}'
+            rating = round(rng.uniform(3.5, 5.0), 1)
+            provider = ServiceProvider(
+                _id=_object_id(plan, PROVIDER_TAG, index), user_id=user_id, name=name,
+                phone_number=_phone(plan, user_id), email=f'provider{user_id}@example.com',
+                category_name=category, category_key=normalize_key(category),
+                rating=rating, original_rating=rating, total_reviews=ratings.SEED_REVIEW_COUNT,
+                experience_years=rng.randint(1, 25), address=f'{rng.choice(LOCALITIES)}, {city}',
+                description=f'{category} serving {city} and nearby areas.',
+                is_verified=rng.random() < 0.6, availability=rng.choice(AVAILABILITY),
+                service_area=city, city=city, city_key=normalize_key(city),
+            )
+            document = to_document(provider, add=True)
+            document['joined_date'] -= timedelta(days=rng.randint(0, 1000))
+            yield document
+
+    return {'providers': _insert_batched(ServiceProvider, documents(), plan['batch_size'])}
+
+
+def _reviews(plan, rng, start, stop):
+    today = plan['today']
+
+    def documents():
+        for review_id in reserve_ids(Review, stop - start):
+            rating = rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+            service_date = today - timedelta(days=rng.randint(1, 365))
+            review = Review(
+                id=review_id, user_id=_customer_user_id(plan, rng),
+                provider_id=str(_object_id(plan, PROVIDER_TAG, _popular(rng, plan['providers']))),
+                rating=rating, comment=rng.choice(REVIEW_COMMENTS[rating]),
+                is_trusted=rating >= 4 and rng.random() < 0.3, service_date=service_date,
+            )
+            document = to_document(review, add=True)
+            document['created_at'] = datetime.combine(service_date, dtime(rng.randint(8, 22), rng.randint(0, 59)))
+            yield document
+
+    return {'reviews': _insert_batched(Review, documents(), plan['batch_size'])}
+
+
+def _bookings(plan, rng, start, stop):
+    today = plan['today']
+
+    def documents():
+        for index in range(start, stop):
+            booking_date = today + timedelta(days=rng.randint(-180, 30))
+            statuses, weights = PAST_STATUSES if booking_date < today else UPCOMING_STATUSES
+            booking_status = rng.choices(statuses, weights)[0]
+            booking_time = dtime(rng.randint(8, 19), rng.choice((0, 30)))
+            booking = Booking(
+                _id=_object_id(plan, BOOKING_TAG, index), user_id=_customer_user_id(plan, rng),
+                provider_id=str(_object_id(plan, PROVIDER_TAG, _popular(rng, plan['providers']))),
+                booking_date=booking_date, booking_time=booking_time, status=booking_status, notes='',
+                provider_status=booking_status if booking_status in PROVIDER_STATUSES else 'pending',
+            )
+            document = to_document(booking, add=True)
+            booked_at = datetime.combine(booking_date, booking_time)
+            document['created_at'] = booked_at - timedelta(days=rng.randint(1, 14), hours=rng.randint(0, 12))
+            if booking_status == 'completed':
+                document['completed_at'] = booked_at + timedelta(hours=2)
+                document['completion_notes'] = 'Job completed.'
+            yield document
+
+    return {'bookings': _insert_batched(Booking, documents(), plan['batch_size'])}
+
+
+GENERATORS = {
+    'users': _users,
+    'providers': _providers,
+    'reviews': _reviews,
+    'bookings': _bookings,
+}
+
+
+def _init_worker():
+    django.setup()
+    # Connections copied from a forked parent can't be shared; open fresh ones
+    connections.close_all()
+
+
+def _run_chunk(task):
+    kind, start, stop, plan = task
+    rng = random.Random(f"{plan['seed']}:{kind}:{start}")
+    return GENERATORS[kind](plan, rng, start, stop)
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset (users, providers, contacts, reviews, bookings) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=5000, help='Customer accounts (default: 5000)')
+        parser.add_argument(
+            '--providers', type=int, default=1000,
+            help='Providers, each with its own account (default: 1000)',
+        )
+        parser.add_argument('--reviews', type=int, default=20000, help='Reviews (default: 20000)')
+        parser.add_argument('--bookings', type=int, default=50000, help='Bookings (default: 50000)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Documents inserted per insert_many (default: 1000)',
+        )
+        parser.add_argument(
+            '--password', default='fixmate123',
+            help='Password of every generated account (default: fixmate123)',
+        )
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Delete existing users (except superusers), providers, contacts, reviews and bookings first',
+        )
+
+    def handle(self, *args, **options):
+        customers, providers = options['customers'], options['providers']
+        if customers < 1 or providers < 1:
+            raise CommandError('--customers and --providers must be at least 1')
+        if min(options['reviews'], options['bookings']) < 0:
+            raise CommandError('--reviews and --bookings cannot be negative')
+        started = time.monotonic()
+
+        if options['flush']:
+            self._flush()
+
+        for name, description in CATEGORIES.items():
+            ServiceCategory.objects.get_or_create(name=name, defaults={'description': description, 'icon': ''})
+
+        users = reserve_ids(User, customers + providers)
+        plan = {
+            'seed': options['seed'],
+            'epoch': int(time.time()),
+            'today': timezone.localdate(),
+            'customers': customers,
+            'providers': providers,
+            'user_base': users.start,
+            # One hash for every account; hashing per user would dominate the run
+            'password': make_password(options['password']),
+            'categories': sorted(ServiceCategory.objects.values_list('name', flat=True)),
+            'batch_size': options['batch_size'],
+        }
+
+        tasks = []
+        for kind, count in (('users', customers + providers), ('providers', providers),
+                            ('reviews', options['reviews']), ('bookings', options['bookings'])):
+            for start in range(0, count, CHUNK_SIZE):
+                tasks.append((kind, start, min(start + CHUNK_SIZE, count), plan))
+
+        totals = {}
+        workers = max(1, min(options['workers'], len(tasks)))
+        self.stdout.write(f'Generating in {len(tasks)} chunk(s) on {workers} worker(s)...')
+        if workers == 1:
+            results = map(_run_chunk, tasks)
+            self._collect(results, totals, len(tasks))
+        else:
+            # Children open their own connections
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+                self._collect(pool.imap_unordered(_run_chunk, tasks), totals, len(tasks))
+
+        self.stdout.write('Rebuilding rating aggregates and booking rollups...')
+        ratings.rebuild_aggregates(batch_size=options['batch_size'])
+        rollups.rebuild(batch_size=options['batch_size'])
+        conditional.invalidate_all_bookings()
+
+        elapsed = time.monotonic() - started
+        summary = ', '.join(f'{count} {kind}' for kind, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary} in {elapsed:.1f}s'))
+
+    def _collect(self, results, totals, task_count):
+        for done, counts in enumerate(results, start=1):
+            for kind, count in counts.items():
+                totals[kind] = totals.get(kind, 0) + count
+            self.stdout.write(f'  {done}/{task_count} chunks done')
+
+    def _flush(self):
+        connection = connections['default']
+        connection.ensure_connection()
+        db = connection.connection
+
+        kept = [str(user['id']) for user in db[User._meta.db_table].find({'is_superuser': True}, {'id': 1})]
+        kept_user_ids = [
+            identity['user_id']
+            for identity in db[UserIdentity._meta.db_table].find({'user_pk': {'$in': kept}}, {'user_id': 1})
+        ]
+        flushed_user_ids = [
+            identity['user_id']
+            for identity in db[UserIdentity._meta.db_table].find({'user_pk': {'$nin': kept}}, {'user_id': 1})
+        ]
+        flushed_providers = list(db[ServiceProvider._meta.db_table].find({}, {'_id': 1, 'user_id': 1}))
+
+        db[User._meta.db_table].delete_many({'is_superuser': {'$ne': True}})
+        db[UserIdentity._meta.db_table].delete_many({'user_pk': {'$nin': kept}})
+        for model in (UserProfile, Contact):
+            db[model._meta.db_table].delete_many({'user_id': {'$nin': kept_user_ids}})
+        for model in (ServiceProvider, Review, Booking, ProviderDailyStats):
+            db[model._meta.db_table].delete_many({})
+
+        # Deleted without signals: bump what the Contact, Review, ServiceProvider
+        # and Booking receivers would have
+        for provider in flushed_providers:
+            provider_cache.invalidate(provider['_id'], provider.get('user_id'))
+        for user_id in kept_user_ids + flushed_user_ids:
+            social_proof.invalidate_user(user_id)
+        listing.invalidate_all()
+        conditional.invalidate_all_bookings()
+        self.stdout.write('Existing data flushed')
@@ -0,0 +1,86 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.provider_import import FORMATS, ProviderImport, ProviderImportError, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import providers from a CSV or JSONL file, resuming from a checkpoint if one exists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or JSONL file')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Providers inserted per bulk write (default: 1000)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Progress file, updated after every batch (default: <path>.checkpoint)',
+        )
+        parser.add_argument(
+            '--errors',
+            help='Rejected rows, one JSON object per line (default: <path>.errors.jsonl)',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore an existing checkpoint and start from the first record',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        errors_path = options['errors'] or f'{path}.errors.jsonl'
+        try:
+            file_format = options['format'] or detect_format(path)
+        except ProviderImportError as e:
+            raise CommandError(str(e))
+
+        checkpoint = {}
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('source') != os.path.abspath(path):
+                raise CommandError(f'{checkpoint_path} belongs to {checkpoint.get("source")}; use --restart')
+            self.stdout.write(f'Resuming after record {checkpoint["records"]}')
+        skip = checkpoint.get('records', 0)
+
+        with open(errors_path, 'a' if skip else 'w') as errors_file:
+            def on_error(record, errors):
+                errors_file.write(json.dumps({'record': record, 'errors': errors}) + '\n')
+
+            try:
+                importer = ProviderImport(batch_size=options['batch_size'], on_error=on_error)
+            except ProviderImportError as e:
+                raise CommandError(str(e))
+            importer.counts.update(checkpoint.get('counts', {}))
+
+            def on_batch(records):
+                errors_file.flush()
+                self._save_checkpoint(checkpoint_path, path, records, importer.counts)
+                self.stdout.write(f'  {records} records, {importer.counts["inserted"]} inserted')
+
+            with open(path, newline='', encoding='utf-8-sig') as stream:
+                counts = importer.run(read_rows(stream, file_format), skip=skip, on_batch=on_batch)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        rejected = counts['duplicates'] + counts['invalid'] + counts['failed']
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['inserted']} provider(s); {counts['duplicates']} duplicate(s), "
+            f"{counts['invalid']} invalid, {counts['failed']} failed"
+        ))
+        if rejected:
+            self.stdout.write(f'Rejected rows are listed in {errors_path}')
+
+    def _save_checkpoint(self, checkpoint_path, path, records, counts):
+        # Written aside and renamed, so an interruption never leaves half a file
+        temporary = f'{checkpoint_path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'source': os.path.abspath(path), 'records': records, 'counts': dict(counts)}, f)
+        os.replace(temporary, checkpoint_path)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from services.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-provider daily booking rollups from the bookings collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--provider', dest='provider_id',
+            help='Only rebuild this provider (default: all providers)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rollup documents replaced per bulk write (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild(options['provider_id'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Booking rollups rebuilt, {written} day(s) written'))
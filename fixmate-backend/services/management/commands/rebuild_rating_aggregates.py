@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from services.ratings import rebuild_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating_sum, rating_count and rating_histogram for providers from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'provider_ids', nargs='*',
+            help='Only rebuild these providers (default: all)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Providers updated per bulk write (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        updated = rebuild_aggregates(options['provider_ids'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rating aggregates rebuilt, {updated} provider(s) changed'))
@@ -0,0 +1,20 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import provider_cache
+
+
+class ProviderMiddleware:
+    """
+    Sets request.provider: the authenticated user's ServiceProvider,
+    resolved on first use through services.provider_cache. Using it raises
+    ServiceProvider.DoesNotExist when the user has no provider profile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # DRF authenticates inside the view and copies the user back onto
+        # this request, so the lookup has to wait until then
+        request.provider = SimpleLazyObject(lambda: provider_cache.request_provider(request))
+        return self.get_response(request)
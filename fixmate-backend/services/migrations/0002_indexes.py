@@ -0,0 +1,53 @@
+# Generated by Django 4.1.13 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['provider_id', 'booking_date'], name='booking_provider_date'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user_id', 'created_at'], name='booking_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['user_id'], name='contact_user'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['phone_number'], name='contact_phone'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['provider_id', 'created_at'], name='review_provider_created'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user_id', 'provider_id'], name='review_user_provider'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_name', 'rating', '_id'], name='provider_category_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_name', 'city', 'rating', '_id'], name='provider_category_city_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['user_id'], name='provider_user'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['phone_number'], name='profile_phone'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.1.13 on 2026-10-17 20:38
+
+from django.db import migrations, models
+from pymongo import UpdateOne
+
+
+def _key(value):
+    # services.models.normalize_key as of this migration
+    return ' '.join((value or '').split()).lower()
+
+
+def _backfill(collection, projection, compute_keys, batch_size=1000):
+    operations = []
+    for doc in collection.find({}, projection).batch_size(batch_size):
+        keys = compute_keys(doc)
+        if all(doc.get(field) == value for field, value in keys.items()):
+            continue
+        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': keys}))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+
+def backfill_lookup_keys(apps, schema_editor):
+    db = schema_editor.connection.connection
+    _backfill(
+        db[apps.get_model('services', 'ServiceCategory')._meta.db_table],
+        {'name': 1, 'category_key': 1},
+        lambda doc: {'category_key': _key(doc.get('name'))},
+    )
+    _backfill(
+        db[apps.get_model('services', 'ServiceProvider')._meta.db_table],
+        {'category_name': 1, 'city': 1, 'category_key': 1, 'city_key': 1},
+        lambda doc: {'category_key': _key(doc.get('category_name')), 'city_key': _key(doc.get('city'))},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='serviceprovider',
+            name='provider_category_rating',
+        ),
+        migrations.RemoveIndex(
+            model_name='serviceprovider',
+            name='provider_category_city_rating',
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='category_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='category_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='city_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(backfill_lookup_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='servicecategory',
+            index=models.Index(fields=['category_key'], name='category_key'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_key', 'rating', '_id'], name='provider_category_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_key', 'city_key', 'rating', '_id'], name='provider_category_city_rating'),
+        ),
+    ]
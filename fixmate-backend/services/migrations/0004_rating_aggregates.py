@@ -0,0 +1,112 @@
+# Generated by Django 4.1.13 on 2026-10-17 20:39
+
+from django.db import migrations, models
+import djongo.models.fields
+from pymongo import DeleteMany, UpdateOne
+
+# services.ratings as of this migration
+SEED_REVIEW_COUNT = 10
+
+
+def _weighted_rating_fields():
+    total = {'$add': [SEED_REVIEW_COUNT, '$rating_count']}
+    return {
+        'rating': {'$cond': [
+            {'$gt': ['$rating_count', 0]},
+            {'$round': [
+                {'$divide': [
+                    {'$add': [{'$multiply': ['$original_rating', SEED_REVIEW_COUNT]}, '$rating_sum']},
+                    total,
+                ]},
+                1,
+            ]},
+            '$rating',
+        ]},
+        'total_reviews': total,
+    }
+
+
+def dedupe_reviews(reviews):
+    """Keep each user's latest review of a provider, ahead of the unique index"""
+    duplicates = reviews.aggregate([
+        {'$sort': {'created_at': -1, 'id': -1}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'provider_id': '$provider_id'},
+            'ids': {'$push': '$_id'},
+            'count': {'$sum': 1},
+        }},
+        {'$match': {'count': {'$gt': 1}}},
+    ], allowDiskUse=True)
+    operations = [DeleteMany({'_id': {'$in': row['ids'][1:]}}) for row in duplicates]
+    if operations:
+        reviews.bulk_write(operations, ordered=False)
+
+
+def backfill_rating_counters(apps, schema_editor, batch_size=1000):
+    db = schema_editor.connection.connection
+    reviews = db[apps.get_model('services', 'Review')._meta.db_table]
+    providers = db[apps.get_model('services', 'ServiceProvider')._meta.db_table]
+
+    dedupe_reviews(reviews)
+
+    counters = {}
+    for row in reviews.aggregate([
+        {'$group': {'_id': {'provider_id': '$provider_id', 'rating': '$rating'}, 'count': {'$sum': 1}}},
+    ]):
+        star = row['_id']['rating']
+        entry = counters.setdefault(row['_id']['provider_id'], {'rating_sum': 0, 'rating_count': 0, 'rating_histogram': {}})
+        entry['rating_sum'] += star * row['count']
+        entry['rating_count'] += row['count']
+        entry['rating_histogram'][str(star)] = row['count']
+
+    empty = {'rating_sum': 0, 'rating_count': 0, 'rating_histogram': {}}
+    operations = []
+    for doc in providers.find({}, {'_id': 1}).batch_size(batch_size):
+        entry = counters.get(str(doc['_id']), empty)
+        operations.append(UpdateOne({'_id': doc['_id']}, [
+            {'$set': {
+                'rating_sum': entry['rating_sum'],
+                'rating_count': entry['rating_count'],
+                'rating_histogram': {'$literal': entry['rating_histogram']},
+            }},
+            {'$set': _weighted_rating_fields()},
+        ]))
+        if len(operations) >= batch_size:
+            providers.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        providers.bulk_write(operations, ordered=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_lookup_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='rating_histogram',
+            field=djongo.models.fields.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_user_provider',
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('user_id', 'provider_id'), name='review_user_provider'),
+        ),
+    ]
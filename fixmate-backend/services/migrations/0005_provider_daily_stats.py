@@ -0,0 +1,69 @@
+# Generated by Django 4.1.13 on 2026-10-17 20:40
+
+from django.db import migrations, models
+from pymongo import ReplaceOne
+
+# services.rollups as of this migration
+STATUSES = ['pending', 'accepted', 'completed', 'cancelled', 'rejected']
+
+
+def populate_rollups(apps, schema_editor, batch_size=1000):
+    db = schema_editor.connection.connection
+    bookings = db[apps.get_model('services', 'Booking')._meta.db_table]
+    rollups = db[apps.get_model('services', 'ProviderDailyStats')._meta.db_table]
+
+    group = {
+        '_id': {'provider_id': '$provider_id', 'day': '$booking_date'},
+        'total': {'$sum': 1},
+    }
+    for status in STATUSES:
+        group[status] = {'$sum': {'$cond': [{'$eq': ['$status', status]}, 1, 0]}}
+
+    operations = []
+    for row in bookings.aggregate([{'$group': group}], allowDiskUse=True):
+        day = row['_id']['day']
+        document = {
+            '_id': f"{row['_id']['provider_id']}:{day.date().isoformat()}",
+            'provider_id': row['_id']['provider_id'],
+            'day': day,
+            'total': row['total'],
+        }
+        document.update({status: row[status] for status in STATUSES})
+        operations.append(ReplaceOne({'_id': document['_id']}, document, upsert=True))
+        if len(operations) >= batch_size:
+            rollups.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        rollups.bulk_write(operations, ordered=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderDailyStats',
+            fields=[
+                ('_id', models.CharField(db_column='_id', max_length=40, primary_key=True, serialize=False)),
+                ('provider_id', models.CharField(max_length=24)),
+                ('day', models.DateField()),
+                ('total', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('accepted', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('cancelled', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'provider_daily_stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='providerdailystats',
+            index=models.Index(fields=['provider_id', 'day'], name='daily_stats_provider_day'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-17 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0005_provider_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserIdentity',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('user_pk', models.CharField(max_length=40, unique=True)),
+                ('user_id', models.IntegerField(unique=True)),
+            ],
+            options={
+                'db_table': 'user_identity',
+            },
+        ),
+    ]
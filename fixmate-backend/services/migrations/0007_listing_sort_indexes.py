@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0006_user_identity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_key', 'experience_years', '_id'], name='provider_category_experience'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_key', 'city_key', 'experience_years', '_id'], name='provider_cat_city_experience'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_key', 'total_reviews', '_id'], name='provider_category_reviews'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprovider',
+            index=models.Index(fields=['category_key', 'city_key', 'total_reviews', '_id'], name='provider_category_city_reviews'),
+        ),
+    ]
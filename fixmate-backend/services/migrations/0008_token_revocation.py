@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-17 21:50
+
+from django.db import migrations, models
+
+
+def create_expiry_index(apps, schema_editor):
+    db = schema_editor.connection.connection
+    db[apps.get_model('services', 'TokenRevocation')._meta.db_table].create_index(
+        'expires_at', name='token_revocation_expiry', expireAfterSeconds=0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0007_listing_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenRevocation',
+            fields=[
+                ('_id', models.CharField(db_column='_id', max_length=200, primary_key=True, serialize=False)),
+                ('revoked_before', models.IntegerField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'token_revocation',
+            },
+        ),
+        migrations.RunPython(create_expiry_index, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,111 @@
 from djongo import models
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
 from bson import ObjectId
+from pymongo import ReturnDocument
+import datetime
+
+
+def normalize_key(value):
+    """Lookup key for names users type in URLs: case and whitespace insensitive"""
+    return ' '.join((value or '').split()).lower()
+
+
+def _from_stored(field, value):
+    """Undo djongo's storage conversions for date, time and datetime fields"""
+    if not isinstance(value, datetime.datetime):
+        return value
+    if isinstance(field, models.DateTimeField):
+        if settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+        return value
+    if isinstance(field, models.DateField):
+        return value.date()
+    if isinstance(field, models.TimeField):
+        return value.time()
+    return value
+
+
+def from_document(model, document):
+    """
+    Build a model instance from a raw MongoDB document (e.g. one returned by
+    a mongo_* call) as if it had been loaded through the ORM
+    Fields missing from the document are left deferred.
+    """
+    fields = [field for field in model._meta.concrete_fields if field.column in document]
+    return model.from_db(
+        DEFAULT_DB_ALIAS,
+        [field.attname for field in fields],
+        [_from_stored(field, document[field.column]) for field in fields],
+    )
+
+
+def _to_stored(field, value):
+    """Apply djongo's storage conversions for date, time and datetime fields"""
+    if isinstance(field, models.DateTimeField):
+        if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+            value = timezone.make_naive(value, datetime.timezone.utc)
+        return value
+    if isinstance(field, models.DateField) and isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time.min)
+    if isinstance(field, models.TimeField) and isinstance(value, datetime.time):
+        return datetime.datetime.combine(datetime.date(1900, 1, 1), value)
+    return value
+
+
+def to_document(instance, add=False, field_names=None):
+    """
+    Raw MongoDB document for a model instance (or just the primary key and
+    field_names), stored the way djongo would store it. Runs the fields'
+    pre_save (auto_now and friends); a primary key that is still unset is
+    left out.
+    """
+    document = {}
+    for field in instance._meta.concrete_fields:
+        if field_names is not None and not field.primary_key and field.name not in field_names:
+            continue
+        value = field.pre_save(instance, add)
+        if field.primary_key and value is None:
+            continue
+        document[field.column] = _to_stored(field, value)
+    return document
+
+
+
+def reserve_ids(model, count):
+    """
+    Claim `count` consecutive AutoField ids from djongo's sequence, as its
+    own inserts do, for documents written with mongo_insert_many
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    connection.ensure_connection()
+    auto = connection.connection['__schema__'].find_one_and_update(
+        {'name': model._meta.db_table, 'auto': {'$exists': True}},
+        {'$inc': {'auto.seq': count}},
+        return_document=ReturnDocument.AFTER,
+    )
+    return range(auto['auto']['seq'] - count + 1, auto['auto']['seq'] + 1)
+
 
 class ServiceCategory(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
+    category_key = models.CharField(max_length=100, blank=True, default='')
     description = models.TextField()
     icon = models.CharField(max_length=50, blank=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'service_category'
+        indexes = [
+            models.Index(fields=['category_key'], name='category_key'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.category_key = normalize_key(self.name)
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.name
@@ -23,10 +119,8 @@ class ServiceProvider(models.Model):
     def user(self):
         """Get user object from user_id"""
         if self.user_id:
-            try:
-                return User.objects.get(id=self.user_id)
-            except User.DoesNotExist:
-                return None
+            from .identity import user_for_user_id
+            return user_for_user_id(self.user_id)
         return None
     
     name = models.CharField(max_length=200)
@@ -36,6 +130,10 @@ class ServiceProvider(models.Model):
     rating = models.FloatField(default=0.0)
     original_rating = models.FloatField(default=0.0)
     total_reviews = models.IntegerField(default=0)
+    # Running aggregates over real reviews, maintained by services.ratings
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_histogram = models.JSONField(default=dict, blank=True)
     experience_years = models.IntegerField(default=0)
     address = models.TextField()
     description = models.TextField(blank=True, default='')
@@ -46,8 +144,25 @@ class ServiceProvider(models.Model):
     service_area = models.CharField(max_length=200, blank=True, default='')
     city = models.CharField(max_length=100, blank=True, default='')
     
+    # Normalized copies of category_name/city for exact-match indexed lookups
+    category_key = models.CharField(max_length=100, blank=True, default='')
+    city_key = models.CharField(max_length=100, blank=True, default='')
+    
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'service_provider'
+        indexes = [
+            models.Index(fields=['category_key', 'rating', '_id'], name='provider_category_rating'),
+            models.Index(fields=['category_key', 'city_key', 'rating', '_id'], name='provider_category_city_rating'),
+            models.Index(fields=['category_key', 'experience_years', '_id'], name='provider_category_experience'),
+            models.Index(fields=['category_key', 'city_key', 'experience_years', '_id'],
+                         name='provider_cat_city_experience'),
+            models.Index(fields=['category_key', 'total_reviews', '_id'], name='provider_category_reviews'),
+            models.Index(fields=['category_key', 'city_key', 'total_reviews', '_id'],
+                         name='provider_category_city_reviews'),
+            models.Index(fields=['user_id'], name='provider_user'),
+        ]
     
     @property
     def id(self):
@@ -56,12 +171,34 @@ class ServiceProvider(models.Model):
     def save(self, *args, **kwargs):
         if not self._id:
             self._id = ObjectId()
+        self.category_key = normalize_key(self.category_name)
+        self.city_key = normalize_key(self.city)
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.name} - {self.category_name}"
 
 
+class UserIdentity(models.Model):
+    """
+    Canonical integer user_id for each Django User
+    Everything keyed by user_id (profiles, providers, bookings, reviews)
+    uses this value. It is derived once and stored, so every worker
+    resolves the same id for the same user.
+    """
+    id = models.AutoField(primary_key=True)
+    user_pk = models.CharField(max_length=40, unique=True)
+    user_id = models.IntegerField(unique=True)
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'user_identity'
+    
+    def __str__(self):
+        return f"User pk {self.user_pk} -> user_id {self.user_id}"
+
+
 class UserProfile(models.Model):
     id = models.AutoField(primary_key=True)
     user_id = models.IntegerField(unique=True, db_column='user_id')
@@ -70,10 +207,8 @@ class UserProfile(models.Model):
     def user(self):
         """Get user object from user_id"""
         if self.user_id:
-            try:
-                return User.objects.get(id=self.user_id)
-            except User.DoesNotExist:
-                return None
+            from .identity import user_for_user_id
+            return user_for_user_id(self.user_id)
         return None
     
     phone_number = models.CharField(max_length=20)
@@ -89,6 +224,9 @@ class UserProfile(models.Model):
     
     class Meta:
         db_table = 'user_profile'
+        indexes = [
+            models.Index(fields=['phone_number'], name='profile_phone'),
+        ]
     
     def __str__(self):
         return f"Profile for user_id {self.user_id} ({self.user_type})"
@@ -101,10 +239,8 @@ class Contact(models.Model):
     @property
     def user(self):
         if self.user_id:
-            try:
-                return User.objects.get(id=self.user_id)
-            except User.DoesNotExist:
-                return None
+            from .identity import user_for_user_id
+            return user_for_user_id(self.user_id)
         return None
     
     name = models.CharField(max_length=200)
@@ -112,6 +248,10 @@ class Contact(models.Model):
     
     class Meta:
         db_table = 'contact'
+        indexes = [
+            models.Index(fields=['user_id'], name='contact_user'),
+            models.Index(fields=['phone_number'], name='contact_phone'),
+        ]
     
     def __str__(self):
         return f"{self.name} (user_id: {self.user_id})"
@@ -124,10 +264,8 @@ class Review(models.Model):
     @property
     def user(self):
         if self.user_id:
-            try:
-                return User.objects.get(id=self.user_id)
-            except User.DoesNotExist:
-                return None
+            from .identity import user_for_user_id
+            return user_for_user_id(self.user_id)
         return None
     
     provider_id = models.CharField(max_length=24)
@@ -137,8 +275,17 @@ class Review(models.Model):
     service_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'review'
+        indexes = [
+            models.Index(fields=['provider_id', 'created_at'], name='review_provider_created'),
+        ]
+        constraints = [
+            # One review per user and provider; resubmits update it (ratings.save_review)
+            models.UniqueConstraint(fields=['user_id', 'provider_id'], name='review_user_provider'),
+        ]
     
     def __str__(self):
         return f"user_id {self.user_id} - Provider {self.provider_id} ({self.rating}★)"
@@ -160,10 +307,8 @@ class Booking(models.Model):
     @property
     def user(self):
         if self.user_id:
-            try:
-                return User.objects.get(id=self.user_id)
-            except User.DoesNotExist:
-                return None
+            from .identity import user_for_user_id
+            return user_for_user_id(self.user_id)
         return None
     
     provider_id = models.CharField(max_length=24)
@@ -176,8 +321,14 @@ class Booking(models.Model):
     completion_notes = models.TextField(blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'services_booking'
+        indexes = [
+            models.Index(fields=['provider_id', 'booking_date'], name='booking_provider_date'),
+            models.Index(fields=['user_id', 'created_at'], name='booking_user_created'),
+        ]
     
     @property
     def id(self):
@@ -189,4 +340,50 @@ class Booking(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"user_id {self.user_id} - Provider {self.provider_id} ({self.booking_date})"
\ No newline at end of file
+        return f"user_id {self.user_id} - Provider {self.provider_id} ({self.booking_date})"
+
+class ProviderDailyStats(models.Model):
+    """
+    Per-provider, per-day booking counters, maintained by services.rollups
+    _id is "<provider_id>:<YYYY-MM-DD>" so upserts can't create duplicates
+    """
+    _id = models.CharField(primary_key=True, max_length=40, db_column='_id')
+    provider_id = models.CharField(max_length=24)
+    day = models.DateField()
+    total = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    accepted = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'provider_daily_stats'
+        indexes = [
+            models.Index(fields=['provider_id', 'day'], name='daily_stats_provider_day'),
+        ]
+    
+    def __str__(self):
+        return f"Provider {self.provider_id} - {self.day} ({self.total} bookings)"
+
+
+class TokenRevocation(models.Model):
+    """
+    A revoked JWT (_id "jti:<jti>") or a user's revoke-everything-before
+    point (_id "user:<username>"), maintained by services.authentication
+    The TTL index on expires_at drops each entry once the tokens it covers
+    have expired anyway.
+    """
+    _id = models.CharField(primary_key=True, max_length=200, db_column='_id')
+    revoked_before = models.IntegerField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'token_revocation'
+    
+    def __str__(self):
+        return f"{self._id} (until {self.expires_at})"
@@ -0,0 +1,254 @@
+"""
+Two-tier cache of ServiceProvider documents
+
+Tier 1 is a per-process LRU; tier 2 is Django's cache framework, shared
+between workers whenever the configured backend is (see CACHES in
+settings). Tier 1 entries are checked against the current version on every
+read, so they are exactly as fresh as the version stamps: with a
+per-process backend, another worker's writes go unseen (services.W003). Providers are cached by _id, with a second mapping from user_id
+to the provider's _id for the provider portal. Values derived from a
+provider (e.g. the review list on its detail page) can be cached alongside
+it with cached_for_provider(), whose shared tier is filled through
+services.singleflight.
+
+Every entry is stamped with a version from services.versions: 'provider'
+per _id, 'provider_user' per user_id. ServiceProvider saves and deletes
+(signals) and raw Mongo writes (ratings, repositories) call invalidate(),
+which bumps the versions, so older entries in either tier are never served
+again. Users without a provider profile are cached too, as None.
+
+Hit, miss and eviction counts are available from stats().
+"""
+import copy
+import threading
+from collections import Counter, OrderedDict
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.cache import cache
+
+from . import authentication, identity, singleflight, versions
+from .models import ServiceProvider, from_document
+
+VERSION_NAMESPACE = 'provider'
+USER_VERSION_NAMESPACE = 'provider_user'
+
+MAX_ENTRIES = getattr(settings, 'PROVIDER_CACHE_SIZE', 2048)
+TIMEOUT = getattr(settings, 'PROVIDER_CACHE_TIMEOUT', 60 * 60)
+
+# Stands for "this user has no provider profile" in both tiers
+_NO_PROVIDER = ''
+
+# key -> (version, value), least recently used first
+_entries = OrderedDict()
+_lock = threading.Lock()
+_metrics = Counter()
+
+
+def _local_get(key, version):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        _entries.move_to_end(key)
+        _metrics['local_hits'] += 1
+        return entry
+
+
+def _local_set(key, version, value):
+    with _lock:
+        _entries[key] = (version, value)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _metrics['evictions'] += 1
+
+
+def _shared_key(key, version):
+    return ':'.join(str(part) for part in key) + f':{version}'
+
+
+def _instance(document):
+    # A copy, so nothing a view does to the instance (JSON fields included) reaches the cache
+    return from_document(ServiceProvider, copy.deepcopy(document))
+
+
+def invalidate(provider_id=None, user_id=None):
+    """Make cached copies of a provider (by _id) and/or a user's mapping stale"""
+    if provider_id is not None:
+        provider_id = str(provider_id)
+        versions.bump_version(VERSION_NAMESPACE, provider_id)
+        with _lock:
+            _entries.pop(('provider', provider_id), None)
+    if user_id is not None:
+        versions.bump_version(USER_VERSION_NAMESPACE, user_id)
+        with _lock:
+            _entries.pop(('provider_user', user_id), None)
+
+
+def _documents(provider_ids):
+    """{str(_id): document or None} for the given ids, through both tiers"""
+    provider_ids = [str(provider_id) for provider_id in provider_ids]
+    # Versions are read before the documents: a write racing with the fetch
+    # leaves the document under the older version, and it's refetched next time
+    current = versions.get_versions(VERSION_NAMESPACE, provider_ids)
+
+    documents = {}
+    missing = []
+    for provider_id in provider_ids:
+        entry = _local_get(('provider', provider_id), current[provider_id])
+        if entry is not None:
+            documents[provider_id] = entry[1]
+        else:
+            missing.append(provider_id)
+    if not missing:
+        return documents
+
+    shared_keys = {_shared_key(('provider', provider_id), current[provider_id]): provider_id
+                   for provider_id in missing}
+    for shared_key, document in cache.get_many(list(shared_keys)).items():
+        provider_id = shared_keys[shared_key]
+        documents[provider_id] = document
+        _local_set(('provider', provider_id), current[provider_id], document)
+        _metrics['shared_hits'] += 1
+
+    missing = [provider_id for provider_id in missing if provider_id not in documents]
+    if not missing:
+        return documents
+
+    _metrics['misses'] += len(missing)
+    fetched = {
+        str(document['_id']): document
+        for document in ServiceProvider.objects.mongo_find({'_id': {'$in': [ObjectId(i) for i in missing]}})
+    }
+    to_share = {}
+    for provider_id in missing:
+        document = fetched.get(provider_id)
+        documents[provider_id] = document
+        _local_set(('provider', provider_id), current[provider_id], document)
+        to_share[_shared_key(('provider', provider_id), current[provider_id])] = document
+    cache.set_many(to_share, timeout=TIMEOUT)
+    return documents
+
+
+def provider_by_id(provider_id):
+    """
+    A provider by _id, raising InvalidId for a malformed id and
+    ServiceProvider.DoesNotExist for an unknown one. Each call builds a new
+    instance, so views can modify and save it.
+    """
+    provider_id = str(ObjectId(provider_id))
+    document = _documents([provider_id])[provider_id]
+    if document is None:
+        raise ServiceProvider.DoesNotExist(f'No provider with _id {provider_id}')
+    return _instance(document)
+
+
+def providers_by_id(provider_ids):
+    """{str(_id): provider} for the ids that exist"""
+    if not provider_ids:
+        return {}
+    documents = _documents(provider_ids)
+    return {
+        provider_id: _instance(document)
+        for provider_id, document in documents.items() if document is not None
+    }
+
+
+def _provider_id_for_user(user_id, refresh=False):
+    version = versions.get_version(USER_VERSION_NAMESPACE, user_id)
+    key = ('provider_user', user_id)
+    if not refresh:
+        entry = _local_get(key, version)
+        if entry is not None:
+            return entry[1]
+        provider_id = cache.get(_shared_key(key, version))
+        if provider_id is not None:
+            _metrics['shared_hits'] += 1
+            _local_set(key, version, provider_id)
+            return provider_id
+
+    _metrics['misses'] += 1
+    document = ServiceProvider.objects.mongo_find_one({'user_id': user_id}, {'_id': 1})
+    provider_id = str(document['_id']) if document is not None else _NO_PROVIDER
+    _local_set(key, version, provider_id)
+    cache.set(_shared_key(key, version), provider_id, timeout=TIMEOUT)
+    return provider_id
+
+
+def provider_for_user_id(user_id):
+    """
+    The provider profile of a user, raising ServiceProvider.DoesNotExist
+    like objects.get()
+    """
+    provider_id = _provider_id_for_user(user_id)
+    if provider_id != _NO_PROVIDER:
+        provider = providers_by_id([provider_id]).get(provider_id)
+        if provider is not None and provider.user_id == user_id:
+            return provider
+        # The mapping outlived the provider or its owner changed
+        provider_id = _provider_id_for_user(user_id, refresh=True)
+        if provider_id != _NO_PROVIDER:
+            provider = providers_by_id([provider_id]).get(provider_id)
+            if provider is not None and provider.user_id == user_id:
+                return provider
+    raise ServiceProvider.DoesNotExist(f'No provider profile for user_id {user_id}')
+
+
+def request_provider(request):
+    """
+    The authenticated user's provider profile
+    A token with the identity claims settles it without the user_id lookup:
+    is_provider false means there is none, and provider_id names it. A
+    claimed provider that no longer belongs to the user falls back to the
+    lookup; a profile created after login shows up on the next login.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        raise ServiceProvider.DoesNotExist('Anonymous request has no provider profile')
+    user_id = identity.user_id_for(user)
+    if isinstance(user, authentication.ClaimsUser):
+        if not user.is_provider:
+            raise ServiceProvider.DoesNotExist(f'user_id {user_id} is not a provider')
+        if user.provider_id:
+            provider = providers_by_id([user.provider_id]).get(user.provider_id)
+            if provider is not None and provider.user_id == user_id:
+                return provider
+    return provider_for_user_id(user_id)
+
+
+def cached_for_provider(provider_id, name, build):
+    """
+    build() cached in both tiers until the provider's version changes
+    For data that only changes together with the provider document. While
+    it's rebuilt, concurrent callers may get the previous version's value.
+    """
+    provider_id = str(provider_id)
+    version = versions.get_version(VERSION_NAMESPACE, provider_id)
+    key = ('provider', provider_id, name)
+    entry = _local_get(key, version)
+    if entry is not None:
+        return entry[1]
+    value = singleflight.cached(':'.join(key), version, build, TIMEOUT)
+    if not singleflight.served_stale():
+        _local_set(key, version, value)
+    return value
+
+
+def stats():
+    with _lock:
+        return {
+            'entries': len(_entries),
+            'max_entries': MAX_ENTRIES,
+            'local_hits': _metrics['local_hits'],
+            'shared_hits': _metrics['shared_hits'],
+            'misses': _metrics['misses'],
+            'evictions': _metrics['evictions'],
+        }
+
+
+def clear():
+    """Empty this process's tier and reset the counters (the shared tier expires by version)"""
+    with _lock:
+        _entries.clear()
+        _metrics.clear()
@@ -0,0 +1,159 @@
+"""
+Bulk provider import from CSV or JSONL
+
+Rows are streamed from the file, validated with ProviderImportSerializer and
+written in unordered insert_many batches, so memory use stays flat whatever
+the file size. Duplicate phone numbers are caught by the unique index on
+ServiceProvider.phone_number (including duplicates within the file) and by
+one $in lookup per batch against customer profiles, matching the checks
+provider_register makes. Rows that can't be imported are handed to a
+callback with their record number and the reasons.
+"""
+import csv
+import json
+from collections import Counter
+
+from bson import ObjectId
+from django.db import connections
+from pymongo.errors import BulkWriteError
+
+from . import listing
+from .models import ServiceProvider, UserProfile, to_document
+from .serializers import ProviderImportSerializer
+
+DUPLICATE_KEY = 11000
+
+FORMATS = ('csv', 'jsonl')
+
+
+class ProviderImportError(Exception):
+    pass
+
+
+def detect_format(path):
+    lowered = path.lower()
+    if lowered.endswith('.csv'):
+        return 'csv'
+    if lowered.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ProviderImportError(f"Can't tell the format of {path}; pass it explicitly ({', '.join(FORMATS)})")
+
+
+def read_rows(stream, file_format):
+    """Yield (row, error) per record; row is None when the record couldn't be parsed"""
+    if file_format == 'csv':
+        for row in csv.DictReader(stream):
+            # Blank cells mean "not given", as a missing key does in JSONL
+            yield {key: value.strip() for key, value in row.items() if key and value and value.strip()}, None
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield None, 'Expected a JSON object'
+            continue
+        yield row, None
+
+
+def phone_index_exists():
+    for info in ServiceProvider.objects.mongo_index_information().values():
+        if info.get('unique') and [key for key, _ in info['key']] == ['phone_number']:
+            return True
+    return False
+
+
+class ProviderImport:
+    """
+    Imports batches of rows; counts land in self.counts (inserted,
+    duplicates, invalid, failed). on_error(record, errors) is called for
+    every rejected row.
+    """
+
+    def __init__(self, batch_size=1000, on_error=None):
+        if not phone_index_exists():
+            raise ProviderImportError('The unique phone_number index is missing; run migrate first')
+        self.batch_size = batch_size
+        self.on_error = on_error or (lambda record, errors: None)
+        self.counts = Counter()
+
+    def run(self, rows, skip=0, on_batch=None):
+        """
+        Import (row, error) pairs as read_rows yields them, skipping the first
+        `skip` records. on_batch(records) is called after each batch is
+        written, with the number of records consumed so far.
+        """
+        batch = []
+        record = 0
+        for record, (row, error) in enumerate(rows, start=1):
+            if record <= skip:
+                continue
+            if error is not None:
+                self._reject(record, {'non_field_errors': [error]}, 'invalid')
+                continue
+            serializer = ProviderImportSerializer(data=row)
+            if not serializer.is_valid():
+                self._reject(record, serializer.errors, 'invalid')
+                continue
+            provider = serializer.to_provider()
+            provider._id = ObjectId()
+            batch.append((record, to_document(provider, add=True)))
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+                if on_batch:
+                    on_batch(record)
+        if batch:
+            self._write(batch)
+        if on_batch and record > skip:
+            on_batch(record)
+        if self.counts['inserted']:
+            listing.invalidate_all()
+        return self.counts
+
+    def _reject(self, record, errors, outcome):
+        self.counts[outcome] += 1
+        self.on_error(record, errors)
+
+    def _write(self, batch):
+        phones = [document['phone_number'] for _, document in batch]
+        taken = self._profile_phones(phones)
+
+        pending = []
+        for record, document in batch:
+            if document['phone_number'] in taken:
+                self._reject(record, {'phone_number': ['This phone number is already registered.']}, 'duplicates')
+            else:
+                pending.append((record, document))
+        if not pending:
+            return
+
+        try:
+            result = ServiceProvider.objects.mongo_insert_many(
+                [document for _, document in pending], ordered=False,
+            )
+            self.counts['inserted'] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            self.counts['inserted'] += e.details.get('nInserted', 0)
+            for write_error in e.details.get('writeErrors', []):
+                record = pending[write_error['index']][0]
+                if write_error.get('code') == DUPLICATE_KEY:
+                    self._reject(record, {
+                        'phone_number': ['This phone number is already registered as a provider.'],
+                    }, 'duplicates')
+                else:
+                    self._reject(record, {'non_field_errors': [write_error.get('errmsg', 'Write failed')]}, 'failed')
+
+    def _profile_phones(self, phones):
+        """Phones among `phones` that already belong to a user profile"""
+        connection = connections['default']
+        connection.ensure_connection()
+        profiles = connection.connection[UserProfile._meta.db_table].find(
+            {'phone_number': {'$in': phones}}, {'phone_number': 1},
+        )
+        return {profile['phone_number'] for profile in profiles}
@@ -0,0 +1,207 @@
+"""
+Running rating aggregates on the provider document
+
+Each provider keeps rating_sum, rating_count and a per-star rating_histogram
+({'1': n, ..., '5': n}) over its real reviews. A review write folds its delta
+into those counters and recomputes the weighted rating in the same atomic
+update, so the cost no longer grows with the number of reviews.
+
+MongoDB can't update the review and its provider in one atomic write, so
+save_review() takes the rating it replaces from the review write itself:
+concurrent resubmits each fold in their own delta. If the counter update
+fails after the review is stored, the provider's counters are recomputed
+from its reviews (rebuild_rating_aggregates repairs anything left over).
+"""
+import logging
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.db.models.signals import post_delete, post_save
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .models import ServiceProvider, Review, reserve_ids, to_document
+from . import listing, provider_cache
+
+logger = logging.getLogger(__name__)
+
+# original_rating stands in for this many reviews in the weighted average
+SEED_REVIEW_COUNT = 10
+
+STARS = (5, 4, 3, 2, 1)
+
+
+def _counter(field):
+    return {'$ifNull': [f'${field}', 0]}
+
+
+def _write_review(user_id, provider_id, fields):
+    """Upsert the review; returns the rating it replaced (None for a new one)"""
+    key = {'user_id': user_id, 'provider_id': str(provider_id)}
+    while True:
+        previous = Review.objects.mongo_find_one_and_update(
+            key, {'$set': fields}, projection={'rating': 1}, return_document=ReturnDocument.BEFORE,
+        )
+        if previous is not None:
+            return previous['rating']
+        review = Review(id=reserve_ids(Review, 1)[0], **key, **fields)
+        try:
+            Review.objects.mongo_insert_one(to_document(review, add=True))
+        except DuplicateKeyError:
+            # A concurrent submit inserted it first (review_user_provider)
+            continue
+        return None
+
+
+def save_review(user_id, provider_id, rating, comment='', is_trusted=False):
+    """
+    Create or update user_id's review of a provider and fold it into the
+    provider's counters. Returns (created, updated provider document or
+    None if the provider doesn't exist, in which case no review is kept).
+    """
+    fields = {'rating': rating, 'comment': comment, 'is_trusted': bool(is_trusted)}
+    review = Review(user_id=user_id, provider_id=str(provider_id), **fields)
+    previous_rating = _write_review(user_id, provider_id, fields)
+    # Written without save(): run the Review receivers (social proof, cached review list)
+    post_save.send(
+        sender=Review, instance=review,
+        created=previous_rating is None, update_fields=None, raw=False, using='default',
+    )
+    try:
+        updated = apply_review(provider_id, rating, previous_rating)
+    except PyMongoError as e:
+        logger.error(f"❌ Rating counters not updated for provider {provider_id}, rebuilding: {e}")
+        rebuild_aggregates([provider_id])
+        updated = ServiceProvider.objects.mongo_find_one({'_id': ObjectId(provider_id)})
+    if updated is None:
+        # The provider was deleted after the caller looked it up: don't leave an orphaned review
+        logger.warning(f"⚠️ Provider {provider_id} is gone, dropping the review by user_id {user_id}")
+        Review.objects.mongo_delete_one({'user_id': user_id, 'provider_id': str(provider_id)})
+        post_delete.send(sender=Review, instance=review, using='default')
+    return previous_rating is None, updated
+
+
+def apply_review(provider_id, rating, previous_rating=None):
+    """
+    Fold a new review (previous_rating=None) or an edited one into the
+    provider's counters. Returns the updated provider document, or None if
+    the provider doesn't exist.
+    """
+    if previous_rating is None:
+        sum_delta, count_delta = rating, 1
+        histogram_deltas = {str(rating): 1}
+    else:
+        sum_delta, count_delta = rating - previous_rating, 0
+        histogram_deltas = {str(rating): 1, str(previous_rating): -1}
+        if rating == previous_rating:
+            histogram_deltas = {}
+
+    counters = {
+        'rating_sum': {'$add': [_counter('rating_sum'), sum_delta]},
+        'rating_count': {'$add': [_counter('rating_count'), count_delta]},
+    }
+    for star, delta in histogram_deltas.items():
+        field = f'rating_histogram.{star}'
+        counters[field] = {'$add': [_counter(field), delta]}
+
+    pipeline = [
+        {'$set': counters},
+        {'$set': weighted_rating_fields()},
+    ]
+
+    updated = ServiceProvider.objects.mongo_find_one_and_update(
+        {'_id': ObjectId(provider_id)},
+        pipeline,
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated is not None:
+        # Bypasses save(), so drop the cached copy here
+        provider_cache.invalidate(updated['_id'], updated.get('user_id'))
+        listing.invalidate(updated.get('category_key'))
+    return updated
+
+
+def weighted_rating_fields():
+    """
+    $set stage deriving rating/total_reviews from the counters
+    original_rating counts as SEED_REVIEW_COUNT reviews; with no real
+    reviews the rating is left as it is.
+    """
+    total = {'$add': [SEED_REVIEW_COUNT, '$rating_count']}
+    return {
+        'rating': {'$cond': [
+            {'$gt': ['$rating_count', 0]},
+            {'$round': [
+                {'$divide': [
+                    {'$add': [{'$multiply': ['$original_rating', SEED_REVIEW_COUNT]}, '$rating_sum']},
+                    total,
+                ]},
+                1,
+            ]},
+            '$rating',
+        ]},
+        'total_reviews': total,
+    }
+
+
+def rating_breakdown(provider):
+    """Reviews per star, read from the histogram"""
+    histogram = provider.rating_histogram or {}
+    return {star: histogram.get(str(star), 0) for star in STARS}
+
+
+def rebuild_aggregates(provider_ids=None, batch_size=1000):
+    """
+    Recompute the counters from the review collection in one aggregation
+    Used to initialise existing providers and to repair drift. Returns the
+    number of providers updated.
+    """
+    match = {}
+    if provider_ids is not None:
+        match['provider_id'] = {'$in': [str(provider_id) for provider_id in provider_ids]}
+
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': {'provider_id': '$provider_id', 'rating': '$rating'},
+            'count': {'$sum': 1},
+        }},
+    ]
+    aggregates = {}
+    for row in Review.objects.mongo_aggregate(pipeline):
+        provider_id = row['_id']['provider_id']
+        star = row['_id']['rating']
+        entry = aggregates.setdefault(provider_id, {'rating_sum': 0, 'rating_count': 0, 'rating_histogram': {}})
+        entry['rating_sum'] += star * row['count']
+        entry['rating_count'] += row['count']
+        entry['rating_histogram'][str(star)] = row['count']
+
+    if provider_ids is None:
+        provider_ids = [str(doc['_id']) for doc in ServiceProvider.objects.mongo_find({}, {'_id': 1})]
+
+    updated = 0
+    operations = []
+    empty = {'rating_sum': 0, 'rating_count': 0, 'rating_histogram': {}}
+    for provider_id in provider_ids:
+        try:
+            object_id = ObjectId(provider_id)
+        except (InvalidId, TypeError):
+            continue
+        counters = aggregates.get(str(provider_id), empty)
+        operations.append(UpdateOne({'_id': object_id}, [
+            {'$set': {
+                'rating_sum': counters['rating_sum'],
+                'rating_count': counters['rating_count'],
+                'rating_histogram': {'$literal': counters['rating_histogram']},
+            }},
+            {'$set': weighted_rating_fields()},
+        ]))
+        if len(operations) >= batch_size:
+            updated += ServiceProvider.objects.mongo_bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += ServiceProvider.objects.mongo_bulk_write(operations, ordered=False).modified_count
+    for provider_id in provider_ids:
+        provider_cache.invalidate(provider_id)
+    listing.invalidate_all()
+    return updated
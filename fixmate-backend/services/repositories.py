@@ -0,0 +1,134 @@
+"""
+Direct pymongo reads and writes for the hot request paths
+
+Going through the ORM, djongo renders each query as SQL, parses it back and
+translates it into a Mongo operation. The functions here issue the Mongo
+operation directly and hand back ordinary model instances (built with
+models.from_document), so serializers and views treat them like ORM results.
+
+Which views use them is controlled per view by settings.REPOSITORY_VIEWS,
+so the two paths can be compared on live traffic.
+"""
+import pymongo
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+
+from . import conditional, identity, listing, provider_cache
+from .models import Review, UserProfile, Booking, from_document, to_document
+
+
+def enabled(view_name):
+    """Whether a view reads through this module rather than the ORM"""
+    return view_name in settings.REPOSITORY_VIEWS
+
+
+def _collection(model):
+    connection = connections['default']
+    connection.ensure_connection()
+    return connection.connection[model._meta.db_table]
+
+
+def _get(model, query):
+    document = _collection(model).find_one(query)
+    if document is None:
+        raise model.DoesNotExist(f'{model.__name__} matching {query} does not exist')
+    return from_document(model, document)
+
+
+def _find(model, query, sort=None):
+    cursor = _collection(model).find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    return [from_document(model, document) for document in cursor]
+
+
+# Providers
+
+def update_fields(instance, field_names):
+    """Write the given fields of an existing instance (like save(update_fields=...)) without signals"""
+    document = to_document(instance, field_names=field_names)
+    columns = [instance._meta.get_field(name).column for name in field_names]
+    pk_column = instance._meta.pk.column
+    # __class__ rather than type(): views pass the lazy request.provider
+    model = instance.__class__
+    _collection(model).update_one(
+        {pk_column: document[pk_column]},
+        {'$set': {column: document[column] for column in columns}},
+    )
+
+
+def update_provider_fields(provider, field_names):
+    """update_fields for a provider, dropping its cached copies as save() would"""
+    update_fields(provider, field_names)
+    provider_cache.invalidate(provider._id, provider.user_id)
+    listing.invalidate(provider.category_key)
+
+
+# Reviews
+
+def reviews_for_provider(provider_id):
+    """A provider's reviews, newest first"""
+    return _find(Review, {'provider_id': str(provider_id)}, sort=[('created_at', pymongo.DESCENDING)])
+
+
+# Bookings
+
+def bookings_for_user(user_id):
+    return _find(Booking, {'user_id': user_id})
+
+
+def bookings_for_provider(provider_id):
+    return _find(Booking, {'provider_id': str(provider_id)})
+
+
+def insert_booking(booking):
+    """Insert a new booking (like booking.save()); fills in _id and created_at"""
+    if not booking._id:
+        booking._id = ObjectId()
+    _collection(Booking).insert_one(to_document(booking, add=True))
+    booking._state.adding = False
+    conditional.invalidate_bookings(booking)
+    return booking
+
+
+# Users and profiles
+
+def users_by_id(user_ids):
+    """{user_id: User} for canonical user ids, mapped to User pks through UserIdentity"""
+    pks = identity.user_pks_for(user_ids)
+    if not pks:
+        return {}
+    users = {user.pk: user for user in _find(User, {'id': {'$in': list(set(pks.values()) - {None})}})}
+    return {user_id: users[pk] for user_id, pk in pks.items() if pk in users}
+
+
+def get_profile(user_id):
+    return _get(UserProfile, {'user_id': user_id})
+
+
+def profiles_by_user_id(user_ids):
+    if not user_ids:
+        return {}
+    profiles = _find(UserProfile, {'user_id': {'$in': list(user_ids)}})
+    return {profile.user_id: profile for profile in profiles}
+
+
+# Serializer relations, same shape as the ORM loaders in services.serializers
+
+def booking_relations(bookings):
+    provider_ids = set()
+    for booking in bookings:
+        try:
+            provider_ids.add(ObjectId(booking.provider_id))
+        except (InvalidId, TypeError):
+            pass
+    user_ids = {booking.user_id for booking in bookings if booking.user_id is not None}
+    return {'providers': provider_cache.providers_by_id(provider_ids), 'users': users_by_id(user_ids)}
+
+
+def customer_relations(bookings):
+    user_ids = {booking.user_id for booking in bookings if booking.user_id is not None}
+    return {'users': users_by_id(user_ids), 'profiles': profiles_by_user_id(user_ids)}
@@ -0,0 +1,109 @@
+"""
+Materialized per-provider daily booking counters
+
+One provider_daily_stats document per provider and booking day holds the
+number of bookings on that day (total) and how many are currently in each
+status. Booking writes keep them current with upserted $inc updates;
+rebuild() recomputes them from the bookings collection.
+
+Only the writes that call record_booking_created() / record_status_change()
+are counted: the create_booking view and services.booking_state. Anything
+else that writes bookings - a booking.save() or delete() elsewhere,
+QuerySet.update(), raw mongo_* writes, bulk imports, editing the collection
+by hand - leaves the rollups behind until they are rebuilt:
+
+    python manage.py rebuild_booking_rollups [--provider <id>]
+
+(generate_dataset rebuilds them itself.) There are deliberately no
+post_save/post_delete receivers: most booking writes bypass signals, and the
+ones that don't would be counted twice.
+"""
+from datetime import datetime, time
+
+from pymongo import ReplaceOne
+
+from .models import Booking, ProviderDailyStats
+
+STATUSES = [status for status, _ in Booking.STATUS_CHOICES]
+
+
+def as_stored(day):
+    # djongo stores DateField values as naive datetimes at midnight
+    return datetime.combine(day, time.min)
+
+
+def rollup_id(provider_id, day):
+    return f"{provider_id}:{day.isoformat()}"
+
+
+def _apply(provider_id, day, deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ProviderDailyStats.objects.mongo_update_one(
+        {'_id': rollup_id(provider_id, day)},
+        {
+            '$inc': deltas,
+            '$setOnInsert': {'provider_id': str(provider_id), 'day': as_stored(day)},
+        },
+        upsert=True,
+    )
+
+
+def record_booking_created(booking):
+    _apply(booking.provider_id, booking.booking_date, {'total': 1, booking.status: 1})
+
+
+def record_status_change(booking, previous_status):
+    """Move one booking from previous_status to its current status"""
+    if previous_status == booking.status:
+        return
+    _apply(booking.provider_id, booking.booking_date, {previous_status: -1, booking.status: 1})
+
+
+def rebuild(provider_id=None, batch_size=1000):
+    """
+    Recompute rollups from the bookings collection
+    Each day's rollup is replaced in place (upserted), so the live $inc
+    updates keep landing on a document throughout; rollups of days that no
+    longer have bookings are deleted afterwards. A booking written while its
+    day is being replaced can still be missed, run it again to settle.
+    Returns the number of rollup documents written.
+    """
+    match = {}
+    if provider_id is not None:
+        match['provider_id'] = str(provider_id)
+
+    group = {
+        '_id': {'provider_id': '$provider_id', 'day': '$booking_date'},
+        'total': {'$sum': 1},
+    }
+    for status in STATUSES:
+        group[status] = {'$sum': {'$cond': [{'$eq': ['$status', status]}, 1, 0]}}
+
+    stale_ids = {doc['_id'] for doc in ProviderDailyStats.objects.mongo_find(match, {'_id': 1})}
+
+    written = 0
+    operations = []
+    for row in Booking.objects.mongo_aggregate([{'$match': match}, {'$group': group}], allowDiskUse=True):
+        day = row['_id']['day']
+        document = {
+            '_id': rollup_id(row['_id']['provider_id'], day.date()),
+            'provider_id': row['_id']['provider_id'],
+            'day': day,
+            'total': row['total'],
+        }
+        document.update({status: row[status] for status in STATUSES})
+        stale_ids.discard(document['_id'])
+        operations.append(ReplaceOne({'_id': document['_id']}, document, upsert=True))
+        if len(operations) >= batch_size:
+            ProviderDailyStats.objects.mongo_bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        ProviderDailyStats.objects.mongo_bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    if stale_ids:
+        ProviderDailyStats.objects.mongo_delete_many({'_id': {'$in': list(stale_ids)}})
+    return written
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import UserProfile, ServiceCategory, ServiceProvider, Review, Booking
+from django.db.models import Manager
+from . import catalog, identity, provider_cache
+from .models import UserProfile, ServiceCategory, ServiceProvider, Review, Booking, normalize_key
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,78 +24,35 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = UserProfile
         fields = ['username', 'email', 'first_name', 'last_name', 'phone_number', 'address', 'user_type', 'is_provider']
     
+    def _user(self, obj):
+        # One lookup for all four fields, through the user_id mapping
+        if getattr(self, '_user_cache', (None,))[0] != obj.user_id:
+            self._user_cache = (obj.user_id, identity.user_for_user_id(obj.user_id))
+        return self._user_cache[1]
+    
     def get_username(self, obj):
-        try:
-            user = User.objects.get(id=obj.user_id)
-            return user.username
-        except User.DoesNotExist:
-            return ""
+        user = self._user(obj)
+        return user.username if user else ""
     
     def get_email(self, obj):
-        try:
-            user = User.objects.get(id=obj.user_id)
-            return user.email
-        except User.DoesNotExist:
-            return ""
+        user = self._user(obj)
+        return user.email if user else ""
     
     def get_first_name(self, obj):
-        try:
-            user = User.objects.get(id=obj.user_id)
-            return user.first_name
-        except User.DoesNotExist:
-            return ""
+        user = self._user(obj)
+        return user.first_name if user else ""
     
     def get_last_name(self, obj):
-        try:
-            user = User.objects.get(id=obj.user_id)
-            return user.last_name
-        except User.DoesNotExist:
-            return ""
+        user = self._user(obj)
+        return user.last_name if user else ""
 
 
 def convert_pk_to_user_id(user_pk):
     """
     Centralized function to convert Django user.pk to integer user_id
-    This ensures consistency across all registration and authentication
+    Backed by the stored UserIdentity mapping, so all workers agree
     """
-    from bson import ObjectId
-    
-    logger.info(f"Converting pk: {user_pk} (type: {type(user_pk).__name__})")
-    
-    # If already an integer, return it
-    if isinstance(user_pk, int):
-        logger.info(f"✅ Already integer: {user_pk}")
-        return user_pk
-    
-    # If it's an ObjectId
-    if isinstance(user_pk, ObjectId):
-        user_id = int(str(user_pk)[-9:], 16)
-        logger.info(f"✅ Converted ObjectId {user_pk} to {user_id}")
-        return user_id
-    
-    # If it's a string
-    if isinstance(user_pk, str):
-        # Try to parse as ObjectId
-        try:
-            oid = ObjectId(user_pk)
-            user_id = int(str(oid)[-9:], 16)
-            logger.info(f"✅ Converted string ObjectId {user_pk} to {user_id}")
-            return user_id
-        except:
-            pass
-        
-        # Try direct integer conversion
-        try:
-            user_id = int(user_pk)
-            logger.info(f"✅ Converted string to int: {user_id}")
-            return user_id
-        except:
-            pass
-    
-    # Last resort: use hash
-    user_id = abs(hash(str(user_pk))) % (10 ** 10)
-    logger.warning(f"⚠️ Using hash for {user_pk}: {user_id}")
-    return user_id
+    return identity.user_id_for_pk(user_pk)
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -207,6 +166,45 @@ class RegisterSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(f"Registration failed: {str(e)}")
 
 
+def load_booking_relations(bookings):
+    """
+    Resolve the providers and users referenced by a batch of bookings
+    One $in query per collection, no matter how many bookings there are
+    """
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    
+    provider_ids = set()
+    user_ids = set()
+    for booking in bookings:
+        try:
+            provider_ids.add(ObjectId(booking.provider_id))
+        except (InvalidId, TypeError):
+            pass
+        if booking.user_id is not None:
+            user_ids.add(booking.user_id)
+    
+    providers = provider_cache.providers_by_id(provider_ids)
+    
+    users = identity.users_by_user_id(user_ids)
+    
+    return {'providers': providers, 'users': users}
+
+
+class BookingListSerializer(serializers.ListSerializer):
+    """
+    Resolves relations for the whole list before rendering any booking
+    context['load_relations'] replaces the loader (see services.repositories).
+    """
+    
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        bookings = list(iterable)
+        load_relations = self.context.get('load_relations', load_booking_relations)
+        self.child.relations = load_relations(bookings)
+        return [self.child.to_representation(item) for item in bookings]
+
+
 class BookingSerializer(serializers.ModelSerializer):
     provider_id = serializers.CharField(max_length=24)
     user_name = serializers.SerializerMethodField(read_only=True)
@@ -214,47 +212,38 @@ class BookingSerializer(serializers.ModelSerializer):
     provider_category = serializers.SerializerMethodField(read_only=True)
     provider_phone = serializers.SerializerMethodField(read_only=True)
     
+    relations = None
+    
     class Meta:
         model = Booking
         fields = ['id', 'user_id', 'user_name', 'provider_id', 'provider_name',
                   'provider_category', 'provider_phone', 'booking_date', 'booking_time', 
                   'status', 'notes', 'created_at']
         read_only_fields = ['user_id', 'created_at', 'status']
+        list_serializer_class = BookingListSerializer
+    
+    def _get_provider(self, obj):
+        return self.relations['providers'].get(str(obj.provider_id))
     
     def get_user_name(self, obj):
         """Get username from user_id"""
-        try:
-            user = User.objects.get(id=obj.user_id)
-            return user.username
-        except User.DoesNotExist:
-            return "Unknown"
+        user = self.relations['users'].get(obj.user_id)
+        return user.username if user else "Unknown"
     
     def get_provider_name(self, obj):
         """Get provider name from provider_id"""
-        from bson import ObjectId
-        try:
-            provider = ServiceProvider.objects.get(_id=ObjectId(obj.provider_id))
-            return provider.name
-        except:
-            return "Unknown Provider"
+        provider = self._get_provider(obj)
+        return provider.name if provider else "Unknown Provider"
     
     def get_provider_category(self, obj):
         """Get provider category from provider_id"""
-        from bson import ObjectId
-        try:
-            provider = ServiceProvider.objects.get(_id=ObjectId(obj.provider_id))
-            return provider.category_name
-        except:
-            return "Unknown"
+        provider = self._get_provider(obj)
+        return provider.category_name if provider else "Unknown"
     
     def get_provider_phone(self, obj):
         """Get provider phone from provider_id"""
-        from bson import ObjectId
-        try:
-            provider = ServiceProvider.objects.get(_id=ObjectId(obj.provider_id))
-            return provider.phone_number
-        except:
-            return ""
+        provider = self._get_provider(obj)
+        return provider.phone_number if provider else ""
 
     def validate_provider_id(self, value):
         """Validate that provider_id is a valid ObjectId"""
@@ -268,6 +257,10 @@ class BookingSerializer(serializers.ModelSerializer):
     
     def to_representation(self, instance):
         """Return _id as the id field"""
+        # A single booking serialized on its own still resolves in one query per collection
+        if self.relations is None:
+            load_relations = self.context.get('load_relations', load_booking_relations)
+            self.relations = load_relations([instance])
         representation = super().to_representation(instance)
         if hasattr(instance, '_id') and instance._id:
             representation['id'] = str(instance._id)
@@ -328,6 +321,13 @@ class ProviderRegisterSerializer(serializers.ModelSerializer):
         
         return value
     
+    def validate_category_name(self, value):
+        """Must be a known category; stored under its canonical name"""
+        try:
+            return catalog.get(value).name
+        except ServiceCategory.DoesNotExist:
+            raise serializers.ValidationError(f"Unknown category '{value}'.")
+    
     def validate(self, attrs):
         if attrs['password'] != attrs['password2']:
             raise serializers.ValidationError({"password": "Passwords don't match."})
@@ -409,6 +409,7 @@ class ProviderRegisterSerializer(serializers.ModelSerializer):
             logger.info(f"   - ServiceProvider.user_id: {verify_provider.user_id}")
             logger.info(f"   - All IDs match: {user_id == verify_profile.user_id == verify_provider.user_id}")
             
+            self.provider = provider
             return user
             
         except Exception as e:
@@ -443,6 +444,50 @@ class ProviderRegisterSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(f"Provider registration failed: {str(e)}")
 
 
+class ProviderImportSerializer(serializers.Serializer):
+    """
+    One row of a bulk provider import (services.provider_import)
+    Same provider fields and rules as ProviderRegisterSerializer, minus the
+    account fields. Uniqueness isn't checked here: the importer checks whole
+    batches at once and leaves phone numbers to the unique index.
+    """
+    name = serializers.CharField(max_length=200)
+    phone_number = serializers.CharField(max_length=20)
+    email = serializers.EmailField(required=False, allow_blank=True)
+    category_name = serializers.CharField()
+    experience_years = serializers.IntegerField(min_value=0)
+    service_area = serializers.CharField()
+    city = serializers.CharField(max_length=100)
+    address = serializers.CharField(required=False, allow_blank=True)
+    description = serializers.CharField(required=False, allow_blank=True)
+    availability = serializers.CharField(required=False, allow_blank=True, max_length=200)
+
+    def validate_category_name(self, value):
+        try:
+            return catalog.get(value).name
+        except ServiceCategory.DoesNotExist:
+            raise serializers.ValidationError(f"Unknown category '{value}'.")
+
+    def to_provider(self):
+        data = self.validated_data
+        return ServiceProvider(
+            name=data['name'],
+            phone_number=data['phone_number'],
+            email=data.get('email', ''),
+            category_name=data['category_name'],
+            category_key=normalize_key(data['category_name']),
+            experience_years=data['experience_years'],
+            address=data.get('address') or data['service_area'],
+            service_area=data['service_area'],
+            city=data['city'],
+            city_key=normalize_key(data['city']),
+            description=data.get('description', ''),
+            availability=data.get('availability') or 'Mon-Sat, 9AM-6PM',
+            rating=0.0,
+            original_rating=0.0,
+            total_reviews=0,
+        )
+
 
 class ServiceProviderSerializer(serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
@@ -458,39 +503,89 @@ class ServiceProviderSerializer(serializers.ModelSerializer):
         return str(obj._id) if obj._id else None
 
 
+def load_customer_relations(bookings):
+    """
+    Resolve customers and their profiles for a batch of provider bookings
+    One query for users and one for profiles, no matter how many bookings there are
+    """
+    user_ids = list({booking.user_id for booking in bookings if booking.user_id is not None})
+    if not user_ids:
+        return {'users': {}, 'profiles': {}}
+    
+    users = identity.users_by_user_id(user_ids)
+    profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user_id__in=user_ids)}
+    return {'users': users, 'profiles': profiles}
+
+
+class ProviderBookingListSerializer(serializers.ListSerializer):
+    """
+    Resolves customers for the whole list before rendering any booking
+    context['load_relations'] replaces the loader (see services.repositories).
+    """
+    
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        bookings = list(iterable)
+        load_relations = self.context.get('load_relations', load_customer_relations)
+        self.child.relations = load_relations(bookings)
+        return [self.child.to_representation(item) for item in bookings]
+
+
 class ProviderBookingSerializer(serializers.ModelSerializer):
     id = serializers.SerializerMethodField()
     customer_name = serializers.SerializerMethodField(read_only=True)
     customer_phone = serializers.SerializerMethodField()
     customer_address = serializers.SerializerMethodField()
     
+    relations = None
+    
     class Meta:
         model = Booking
         fields = ['id', 'customer_name', 'customer_phone', 'customer_address',
                   'booking_date', 'booking_time', 'status', 'provider_status',
                   'notes', 'completion_notes', 'created_at', 'completed_at']
+        list_serializer_class = ProviderBookingListSerializer
+    
+    def to_representation(self, instance):
+        # A single booking serialized on its own still resolves in two queries
+        if self.relations is None:
+            load_relations = self.context.get('load_relations', load_customer_relations)
+            self.relations = load_relations([instance])
+        return super().to_representation(instance)
     
     def get_id(self, obj):
         return str(obj._id) if obj._id else None
     
     def get_customer_name(self, obj):
         """Get customer name from user_id"""
-        try:
-            user = User.objects.get(id=obj.user_id)
-            return user.username
-        except User.DoesNotExist:
-            return "Unknown"
+        user = self.relations['users'].get(obj.user_id)
+        return user.username if user else "Unknown"
     
     def get_customer_phone(self, obj):
-        try:
-            profile = UserProfile.objects.get(user_id=obj.user_id)
-            return profile.phone_number
-        except:
-            return ""
+        profile = self.relations['profiles'].get(obj.user_id)
+        return profile.phone_number if profile else ""
     
     def get_customer_address(self, obj):
-        try:
-            profile = UserProfile.objects.get(user_id=obj.user_id)
-            return profile.address
-        except:
-            return ""
\ No newline at end of file
+        profile = self.relations['profiles'].get(obj.user_id)
+        return profile.address if profile else ""
+
+
+def group_provider_bookings(bookings_data):
+    """
+    Bucket already-serialized provider bookings by status
+    Each booking is rendered once and shared between 'all' and its bucket
+    """
+    grouped = {
+        'all': list(bookings_data),
+        'pending': [],
+        'accepted': [],
+        'completed': [],
+        'cancelled': [],
+    }
+    for booking in grouped['all']:
+        booking_status = booking['status']
+        if booking_status in ('cancelled', 'rejected'):
+            grouped['cancelled'].append(booking)
+        elif booking_status in grouped:
+            grouped[booking_status].append(booking)
+    return grouped
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Booking, Contact, Review, ServiceCategory, ServiceProvider
+from . import catalog, conditional, listing, provider_cache, social_proof
+
+
+@receiver([post_save, post_delete], sender=Contact)
+def contact_changed(sender, instance, **kwargs):
+    """A user's address book changed - their trusted_by results are stale"""
+    social_proof.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, instance, **kwargs):
+    """A review changed - stale for everyone who has the reviewer as a contact"""
+    social_proof.invalidate_reviewer(instance.user_id)
+    # The provider's cached review list
+    provider_cache.invalidate(instance.provider_id)
+
+
+@receiver([post_save, post_delete], sender=ServiceProvider)
+def provider_changed(sender, instance, **kwargs):
+    """A provider profile changed - drop the cached copies and listing pages"""
+    provider_cache.invalidate(instance._id, instance.user_id)
+    listing.invalidate(instance.category_key)
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    """A booking changed - its customer's and provider's booking lists are stale"""
+    conditional.invalidate_bookings(instance)
+
+
+@receiver([post_save, post_delete], sender=ServiceCategory)
+def category_changed(sender, instance, **kwargs):
+    """The category table changed - every process reloads its catalog"""
+    catalog.invalidate()
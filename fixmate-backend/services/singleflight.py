@@ -0,0 +1,144 @@
+"""
+Single-flight computation of shared cache entries
+
+cached() keeps one entry per key in Django's cache as (version, value).
+When the entry is missing or was built for another version, only one caller
+rebuilds it:
+- within a process, concurrent callers for the same key and version wait
+  on the caller already computing and share its result;
+- across processes, the caller that takes the lock in the cache backend
+  (cache.add) computes, and the others poll for its result
+  (SINGLEFLIGHT_DISTRIBUTED; a no-op with a per-process backend).
+
+While an entry is being rebuilt, callers that find an older version
+(stale-while-revalidate) get it straight away instead of waiting. A caller
+that waits longer than SINGLEFLIGHT_WAIT seconds, or whose leader failed,
+computes the value itself, so a crashed process can't block a key for more
+than SINGLEFLIGHT_LOCK_TIMEOUT seconds.
+
+served_stale() tells the current request whether it got an older value, so
+that no ETag (services.conditional) is sent with a stale body.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_TIMEOUT = getattr(settings, 'SINGLEFLIGHT_LOCK_TIMEOUT', 30)
+WAIT = getattr(settings, 'SINGLEFLIGHT_WAIT', 5)
+DISTRIBUTED = getattr(settings, 'SINGLEFLIGHT_DISTRIBUTED', True)
+POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _MISSING
+        # The leader was handed an older version (another process is rebuilding)
+        self.stale = False
+
+
+_flights = {}
+_lock = threading.Lock()
+_metrics = Counter()
+_local = threading.local()
+
+
+def reset_stale():
+    _local.stale = False
+
+
+def served_stale():
+    """Whether this thread was handed a stale value since reset_stale()"""
+    return getattr(_local, 'stale', False)
+
+
+def _stale(value):
+    _local.stale = True
+    _metrics['stale'] += 1
+    return value
+
+
+def cached(key, version, compute, timeout):
+    """compute() cached under key for this version, computed at most once at a time"""
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version:
+        _metrics['hits'] += 1
+        return entry[1]
+    stale = entry[1] if entry is not None else _MISSING
+
+    flight_key = (key, version)
+    with _lock:
+        flight = _flights.get(flight_key)
+        leader = flight is None
+        if leader:
+            flight = _flights[flight_key] = _Flight()
+
+    if not leader:
+        if stale is not _MISSING:
+            return _stale(stale)
+        _metrics['coalesced'] += 1
+        flight.done.wait(WAIT)
+        if flight.value is not _MISSING:
+            return _stale(flight.value) if flight.stale else flight.value
+        # The leader failed or is stuck
+        return _compute(key, version, compute, timeout)
+
+    try:
+        value, flight.stale = _shared_flight(key, version, compute, timeout, stale)
+        flight.value = value
+        return _stale(value) if flight.stale else value
+    finally:
+        with _lock:
+            _flights.pop(flight_key, None)
+        flight.done.set()
+
+
+def _compute(key, version, compute, timeout):
+    _metrics['computed'] += 1
+    value = compute()
+    cache.set(key, (version, value), timeout)
+    return value
+
+
+def _shared_flight(key, version, compute, timeout, stale):
+    """(value, whether it's the older version)"""
+    if not DISTRIBUTED:
+        return _compute(key, version, compute, timeout), False
+
+    lock_key = f'singleflight:{key}:{version}'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return _compute(key, version, compute, timeout), False
+        finally:
+            cache.delete(lock_key)
+
+    # Another process is computing it
+    if stale is not _MISSING:
+        return stale, True
+    _metrics['lock_waits'] += 1
+    deadline = time.monotonic() + WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1], False
+        if cache.get(lock_key) is None:
+            # Released without a result: the other process failed
+            break
+    return _compute(key, version, compute, timeout), False
+
+
+def stats():
+    return {
+        'in_flight': len(_flights),
+        'hits': _metrics['hits'],
+        'computed': _metrics['computed'],
+        'coalesced': _metrics['coalesced'],
+        'lock_waits': _metrics['lock_waits'],
+        'stale': _metrics['stale'],
+    }
@@ -0,0 +1,168 @@
+"""
+Social proof ("trusted by") for provider listings and detail pages
+
+Contact reviews come from the user's real address book: their Contact
+entries are matched to registered users by phone number and crossed with
+those users' reviews. Users without any contacts get the deterministic demo
+set the app has always shown.
+
+Results are cached per user and provider, and invalidated (through a per-user
+version) when the user's contacts change or when one of their contacts
+reviews a provider.
+"""
+import random
+import threading
+import zlib
+
+from django.core.cache import cache
+
+from .models import Contact, Review, UserProfile
+from . import versions
+
+CACHE_TIMEOUT = 60 * 60
+
+DEMO_CONTACTS = ['Harshita', 'Lakshit', 'Rohan', 'Priya']
+
+REVIEW_TEMPLATES = [
+    {'rating': 5, 'comment': 'Excellent service! Very professional and punctual.', 'is_trusted': True},
+    {'rating': 4, 'comment': 'Good work, satisfied with the service.', 'is_trusted': True},
+    {'rating': 3, 'comment': 'Average service, nothing special.', 'is_trusted': False},
+    {'rating': 2, 'comment': 'Not good. Had to call them multiple times.', 'is_trusted': False},
+    {'rating': 1, 'comment': 'Very disappointed. Poor quality work.', 'is_trusted': False},
+    {'rating': 4, 'comment': 'Reliable and affordable. Would recommend.', 'is_trusted': True},
+    {'rating': 5, 'comment': 'Best in the area! Very skilled and honest.', 'is_trusted': True},
+    {'rating': 2, 'comment': 'Overpriced and slow service.', 'is_trusted': False},
+]
+
+_local = threading.local()
+
+
+def seeded_rng(seed_text):
+    """
+    Thread-local RNG reseeded from seed_text
+    Never touches the global random module, so concurrent threads can't
+    reseed each other. crc32 keeps the seed identical across worker processes.
+    """
+    rng = getattr(_local, 'rng', None)
+    if rng is None:
+        rng = _local.rng = random.Random()
+    rng.seed(zlib.crc32(seed_text.encode('utf-8')))
+    return rng
+
+
+def summarize_trusted(names):
+    """Build the trusted_by payload from the names of contacts who trust a provider"""
+    count = len(names)
+    if count == 0:
+        return {
+            'count': 0,
+            'message': 'No friends have used this service yet',
+            'names': []
+        }
+    elif count == 1:
+        message = f'Trusted by {names[0]}'
+    elif count == 2:
+        message = f'Trusted by {names[0]} and {names[1]}'
+    else:
+        message = f'Trusted by {names[0]} and {count-1} others'
+
+    return {
+        'count': count,
+        'message': message,
+        'names': list(names)
+    }
+
+
+def _demo_contact_reviews(user_id, provider_id):
+    """Deterministic placeholder reviews for users who have no contacts yet"""
+    rng = seeded_rng(f"{user_id}-{provider_id}")
+
+    num_contact_reviews = rng.randint(1, 3)
+    contact_reviews = []
+    for contact_name in rng.sample(DEMO_CONTACTS, num_contact_reviews):
+        review_template = rng.choice(REVIEW_TEMPLATES)
+        contact_reviews.append({
+            'user': contact_name,
+            'rating': review_template['rating'],
+            'comment': review_template['comment'],
+            'is_trusted': review_template['is_trusted'],
+        })
+    return contact_reviews
+
+
+def _load_contact_reviews(user_id, provider_ids):
+    """
+    Contact reviews for a batch of providers in at most three queries
+    Returns None when the user has no contacts at all
+    """
+    contacts = list(Contact.objects.filter(user_id=user_id))
+    if not contacts:
+        return None
+
+    names_by_phone = {contact.phone_number: contact.name for contact in contacts}
+    profiles = UserProfile.objects.filter(phone_number__in=list(names_by_phone))
+    names_by_user = {profile.user_id: names_by_phone[profile.phone_number] for profile in profiles}
+
+    contact_reviews = {provider_id: [] for provider_id in provider_ids}
+    if names_by_user:
+        reviews = Review.objects.filter(user_id__in=list(names_by_user), provider_id__in=list(provider_ids))
+        for review in reviews:
+            contact_reviews[review.provider_id].append({
+                'user': names_by_user[review.user_id],
+                'rating': review.rating,
+                'comment': review.comment,
+                'is_trusted': review.is_trusted,
+            })
+    return contact_reviews
+
+
+def _cache_keys(user_id, provider_ids):
+    # One entry per (user, provider): concurrent requests for different
+    # providers never rewrite each other's entries
+    prefix = f"social_proof:{user_id}:{versions.get_version('social_proof', user_id)}"
+    return {f"{prefix}:{provider_id}": provider_id for provider_id in provider_ids}
+
+
+def contact_reviews_for_providers(user_id, provider_ids):
+    """Map each provider_id to the reviews left by the user's contacts"""
+    provider_ids = [str(provider_id) for provider_id in provider_ids]
+    keys = _cache_keys(user_id, provider_ids)
+    cached = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+
+    missing = [provider_id for provider_id in provider_ids if provider_id not in cached]
+    if missing:
+        loaded = _load_contact_reviews(user_id, missing)
+        fresh = {}
+        for provider_id in missing:
+            if loaded is None:
+                fresh[provider_id] = _demo_contact_reviews(user_id, provider_id)
+            else:
+                fresh[provider_id] = loaded[provider_id]
+        cache.set_many({key: fresh[provider_id] for key, provider_id in keys.items() if provider_id in fresh},
+                       CACHE_TIMEOUT)
+        cached.update(fresh)
+
+    return {provider_id: cached[provider_id] for provider_id in provider_ids}
+
+
+def trusted_by_for_providers(user_id, provider_ids):
+    """Map each provider_id to its trusted_by payload for this user"""
+    return {
+        provider_id: summarize_trusted([review['user'] for review in reviews if review['is_trusted']])
+        for provider_id, reviews in contact_reviews_for_providers(user_id, provider_ids).items()
+    }
+
+
+def invalidate_user(user_id):
+    """Drop everything cached for this user (their contacts changed)"""
+    versions.bump_version('social_proof', user_id)
+
+
+def invalidate_reviewer(user_id):
+    """Drop the cache of every user who has this reviewer in their contacts"""
+    phone_numbers = [profile.phone_number for profile in UserProfile.objects.filter(user_id=user_id)]
+    if not phone_numbers:
+        return
+    owner_ids = {contact.user_id for contact in Contact.objects.filter(phone_number__in=phone_numbers)}
+    for owner_id in owner_ids:
+        invalidate_user(owner_id)
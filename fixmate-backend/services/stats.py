@@ -0,0 +1,70 @@
+"""
+Provider dashboard statistics read from the daily rollups
+
+Everything here reads provider_daily_stats (see services.rollups), one
+document per provider per booking day, so cost grows with the number of
+days covered rather than the number of bookings.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import ProviderDailyStats
+from .rollups import STATUSES, as_stored
+
+
+def _sum_if(condition, field):
+    return {'$sum': {'$cond': [condition, f'${field}', 0]}}
+
+
+def booking_statistics(provider_id, today=None):
+    """total/today/week/month/pending booking counts for one provider"""
+    today = today or timezone.localdate()
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+
+    pipeline = [
+        {'$match': {'provider_id': str(provider_id)}},
+        {'$group': {
+            '_id': None,
+            'total': {'$sum': '$total'},
+            'today': _sum_if({'$eq': ['$day', as_stored(today)]}, 'total'),
+            'week': _sum_if({'$gte': ['$day', as_stored(week_start)]}, 'total'),
+            'month': _sum_if({'$and': [
+                {'$gte': ['$day', as_stored(month_start)]},
+                {'$lt': ['$day', as_stored(next_month_start)]},
+            ]}, 'total'),
+            'pending': {'$sum': '$pending'},
+        }},
+    ]
+    totals = next(ProviderDailyStats.objects.mongo_aggregate(pipeline), {})
+
+    return {
+        'total_bookings': totals.get('total', 0),
+        'today_bookings': totals.get('today', 0),
+        'week_bookings': totals.get('week', 0),
+        'month_bookings': totals.get('month', 0),
+        'pending_requests': totals.get('pending', 0),
+    }
+
+
+def daily_booking_series(provider_id, days, today=None):
+    """Bookings per day for the last `days` days (oldest first, gaps filled with zeros)"""
+    today = today or timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+
+    rollups = ProviderDailyStats.objects.mongo_find({
+        'provider_id': str(provider_id),
+        'day': {'$gte': as_stored(first_day), '$lte': as_stored(today)},
+    })
+    by_day = {rollup['day'].date(): rollup for rollup in rollups}
+
+    series = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        rollup = by_day.get(day, {})
+        point = {'date': day.isoformat(), 'total': rollup.get('total', 0)}
+        point.update({status: rollup.get(status, 0) for status in STATUSES})
+        series.append(point)
+    return series
@@ -1,3 +1,1631 @@
-from django.test import TestCase
+"""
+Behaviour tests and the endpoint benchmark
 
-# Create your tests here.
+The tests run against an in-process mongomock client by default
+(pip install mongomock), or against the server in MONGO_URI with
+TEST_MONGO=mongod, where a test_ database is created and dropped:
+
+    python manage.py test services
+
+The benchmark seeds a dataset at a configurable scale, drives every route in
+services/urls.py through the Django test client and writes p50/p95 latency,
+queries per request and bytes per response for each route to a JSON file,
+so runs from two commits can be diffed. GET routes that send an ETag are
+driven a second time with If-None-Match, reported as "<route> (revalidated)".
+
+    BENCHMARK=1 python manage.py test services
+
+Configured through environment variables:
+
+    TEST_MONGO            mongomock (default) or mongod, as for the tests
+                          (BENCHMARK_MONGO is still accepted)
+    BENCHMARK_PROVIDERS   providers to seed (default 200)
+    BENCHMARK_BOOKINGS    bookings to seed (default 1000)
+    BENCHMARK_REVIEWS     reviews to seed (default 1000)
+    BENCHMARK_ITERATIONS  requests per route (default 20)
+    BENCHMARK_OUTPUT      results file (default benchmark-results.json)
+
+Query counts come from the Server-Timing header added by
+services.instrumentation. Latencies under mongomock measure the Python side
+of each request only; compare them with runs on the same backend.
+"""
+import base64
+import csv
+import importlib
+import io
+import itertools
+import json
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from datetime import date, time as dtime, timedelta
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    authentication, booking_state, catalog, checks, exports, identity, instrumentation, listing, provider_cache,
+    ratings, rollups, singleflight, social_proof, translation_cache,
+)
+from .authentication import IdentityRefreshToken
+from .models import (
+    ServiceCategory, ServiceProvider, Review, UserIdentity, UserProfile, Contact, Booking, ProviderDailyStats,
+    TokenRevocation, normalize_key, reserve_ids, to_document,
+)
+from .urls import urlpatterns
+
+BENCHMARK = bool(os.environ.get('BENCHMARK'))
+BACKEND = os.environ.get('TEST_MONGO', os.environ.get('BENCHMARK_MONGO', 'mongomock'))
+
+PROVIDERS = int(os.environ.get('BENCHMARK_PROVIDERS', 200))
+BOOKINGS = int(os.environ.get('BENCHMARK_BOOKINGS', 1000))
+REVIEWS = int(os.environ.get('BENCHMARK_REVIEWS', 1000))
+ITERATIONS = int(os.environ.get('BENCHMARK_ITERATIONS', 20))
+OUTPUT = os.environ.get('BENCHMARK_OUTPUT', 'benchmark-results.json')
+
+CATEGORIES = ['Plumber', 'Barber', 'Carpenter', 'Electrician', 'AC Service', 'Appliance Repair']
+CITIES = ['Patiala', 'Chandigarh', 'Ludhiana', 'Mohali']
+CUSTOMERS = 50
+
+# Routes the suite deliberately doesn't drive
+EXCLUDED_ROUTES = {}
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def _use_mongomock():
+    """
+    Point djongo at one shared in-process mongomock client
+    Also teaches mongomock the $round expression, which the rating updates use.
+    """
+    import mongomock
+    from djongo import database
+    from mongomock import aggregate
+
+    client = mongomock.MongoClient()
+    database.MongoClient = lambda **kwargs: client
+
+    aggregate.arithmetic_operators.add('$round')
+    handle_arithmetic = aggregate._Parser._handle_arithmetic_operator
+
+    def handle_arithmetic_with_round(parser, operator, values):
+        if operator == '$round':
+            number, places = parser.parse_many(values)
+            return None if number is None else round(number, places)
+        return handle_arithmetic(parser, operator, values)
+
+    aggregate._Parser._handle_arithmetic_operator = handle_arithmetic_with_round
+
+    # mongomock publishes no command events; report its calls directly
+    depth = threading.local()
+
+    def instrumented(method_name, method):
+        def wrapper(collection, *args, **kwargs):
+            if getattr(depth, 'value', 0):
+                return method(collection, *args, **kwargs)
+            depth.value = 1
+            started = time.perf_counter()
+            try:
+                return method(collection, *args, **kwargs)
+            finally:
+                depth.value = 0
+                instrumentation.record(
+                    f'{method_name} {collection.name}', (time.perf_counter() - started) * 1000.0
+                )
+        return wrapper
+
+    for method_name in ('find', 'find_one', 'aggregate', 'insert_one', 'insert_many', 'update_one',
+                        'update_many', 'replace_one', 'find_one_and_update', 'delete_one',
+                        'delete_many', 'bulk_write', 'count_documents'):
+        setattr(mongomock.Collection, method_name,
+                instrumented(method_name, getattr(mongomock.Collection, method_name)))
+
+
+MONGOMOCK_MISSING = False
+if BACKEND == 'mongomock':
+    # Before the test runner creates the test database
+    try:
+        _use_mongomock()
+    except ImportError:
+        MONGOMOCK_MISSING = True
+
+_phone_numbers = itertools.count(1)
+
+requires_mongo = unittest.skipIf(MONGOMOCK_MISSING, 'pip install mongomock, or set TEST_MONGO=mongod')
+
+
+@requires_mongo
+class MongoTestCase(TransactionTestCase):
+    """Runs against the test database with every cache emptied"""
+
+    databases = {'default'}
+
+    def setUp(self):
+        cache.clear()
+        provider_cache.clear()
+        catalog.clear()
+
+    def make_category(self, name):
+        return ServiceCategory.objects.create(name=name, description=f'{name} services', icon='')
+
+    def make_user(self, username, phone_number=None, **fields):
+        user = User.objects.create(username=username, password=make_password('test-pass'), **fields)
+        if phone_number:
+            UserProfile.objects.create(user_id=identity.user_id_for(user), phone_number=phone_number)
+        return user
+
+    def make_provider(self, name, category='Plumber', city='Patiala', **fields):
+        defaults = dict(
+            phone_number=f'+91-9{next(_phone_numbers):09d}', email='', category_name=category,
+            experience_years=5, address=city, service_area=city, city=city,
+            description='', availability='Mon-Sat', rating=4.0, original_rating=4.0, total_reviews=10,
+        )
+        defaults.update(fields)
+        return ServiceProvider.objects.create(name=name, **defaults)
+
+    def token(self, user, **claims):
+        return str(IdentityRefreshToken.for_user(user, **claims).access_token)
+
+    def auth(self, user, **claims):
+        return {'HTTP_AUTHORIZATION': f'Bearer {self.token(user, **claims)}'}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+@unittest.skipUnless(BENCHMARK, 'set BENCHMARK=1 to run the endpoint benchmark')
+# One process, so its local-memory version stamps are consistent
+@override_settings(CONDITIONAL_ETAGS=True)
+class EndpointBenchmark(TransactionTestCase):
+    """Latency, queries and response size for every route"""
+
+    # Keeps a plain `manage.py test` from creating a test database for a skipped class
+    databases = {'default'} if BENCHMARK else set()
+
+    def setUp(self):
+        self.rng = random.Random(503)
+        self.today = timezone.localdate()
+        self.seed()
+
+    # Seeding
+
+    def seed(self):
+        for name in CATEGORIES:
+            ServiceCategory.objects.create(name=name, description=f'{name} services', icon='')
+
+        password = make_password('benchmark-pass')
+        self.customer = User.objects.create(username='bench_customer', password=password)
+        self.customer_id = identity.user_id_for(self.customer)
+        UserProfile.objects.create(user_id=self.customer_id, phone_number='+91-7000000000')
+
+        customer_ids = []
+        for index in range(CUSTOMERS):
+            user = User.objects.create(username=f'customer{index}', password=password)
+            user_id = identity.user_id_for(user)
+            customer_ids.append(user_id)
+            UserProfile.objects.create(user_id=user_id, phone_number=f'+91-71{index:08d}')
+            if index < 5:
+                Contact.objects.create(user_id=self.customer_id, name=f'Friend {index}', phone_number=f'+91-71{index:08d}')
+        customer_ids.append(self.customer_id)
+
+        self.staff = User.objects.create(username='bench_staff', password=password, is_staff=True)
+
+        self.provider_user = User.objects.create(username='bench_provider', password=password)
+        provider_user_id = identity.user_id_for(self.provider_user)
+        UserProfile.objects.create(user_id=provider_user_id, phone_number='+91-7200000000',
+                                   user_type='provider', is_provider=True)
+
+        # Provider 0 belongs to bench_provider and gets a tenth of all bookings and reviews
+        provider_ids = [ObjectId() for _ in range(max(PROVIDERS, 1))]
+        self.provider_id = provider_ids[0]
+        heavy_share = 10
+
+        def pick_provider(index):
+            return provider_ids[0] if index % heavy_share == 0 else self.rng.choice(provider_ids)
+
+        reviews = []
+        reviewed = set()
+        counters = {provider_id: {'sum': 0, 'count': 0, 'histogram': {}} for provider_id in provider_ids}
+        for index, review_id in enumerate(reserve_ids(Review, REVIEWS)):
+            provider_id = pick_provider(index)
+            user_id = self.rng.choice(customer_ids)
+            if (user_id, provider_id) in reviewed:
+                # One review per user and provider: repeats go to reviewers without an account
+                user_id = 10 ** 6 + index
+            reviewed.add((user_id, provider_id))
+            rating = self.rng.randint(1, 5)
+            counter = counters[provider_id]
+            counter['sum'] += rating
+            counter['count'] += 1
+            counter['histogram'][str(rating)] = counter['histogram'].get(str(rating), 0) + 1
+            reviews.append(to_document(Review(
+                id=review_id, user_id=user_id, provider_id=str(provider_id),
+                rating=rating, comment='Seeded review', is_trusted=rating >= 4,
+            ), add=True))
+
+        providers = []
+        for index, provider_id in enumerate(provider_ids):
+            counter = counters[provider_id]
+            original_rating = round(self.rng.uniform(3.0, 5.0), 1)
+            total = 10 + counter['count']
+            category = CATEGORIES[index % len(CATEGORIES)]
+            city = CITIES[index % len(CITIES)]
+            providers.append(to_document(ServiceProvider(
+                _id=provider_id,
+                user_id=provider_user_id if index == 0 else None,
+                name=f'Provider {index}',
+                phone_number=f'+91-73{index:08d}',
+                email=f'provider{index}@example.com',
+                category_name=category,
+                category_key=normalize_key(category),
+                experience_years=self.rng.randint(1, 20),
+                address=f'Sector {index % 60}, {city}',
+                service_area=city,
+                city=city,
+                city_key=normalize_key(city),
+                description='Seeded provider',
+                availability='Mon-Sat, 9AM-6PM',
+                original_rating=original_rating,
+                rating=round((original_rating * 10 + counter['sum']) / total, 1) if counter['count'] else original_rating,
+                total_reviews=total,
+                rating_sum=counter['sum'],
+                rating_count=counter['count'],
+                rating_histogram=counter['histogram'],
+            ), add=True))
+
+        bookings = []
+        for index in range(BOOKINGS):
+            bookings.append(self.booking_document(
+                self.rng.choice(customer_ids), pick_provider(index),
+                self.rng.choice(rollups.STATUSES), self.today + timedelta(days=self.rng.randint(-60, 30)),
+            ))
+
+        # Fresh pending bookings for the routes that move bookings between states
+        self.cancellable = []
+        for _ in range(ITERATIONS):
+            bookings.append(self.booking_document(self.customer_id, self.rng.choice(provider_ids), 'pending'))
+            self.cancellable.append(str(bookings[-1]['_id']))
+        self.actionable = {'accept': [], 'reject': [], 'complete': []}
+        for action, booking_ids in self.actionable.items():
+            for _ in range(ITERATIONS):
+                bookings.append(self.booking_document(self.rng.choice(customer_ids), self.provider_id, 'pending'))
+                booking_ids.append(str(bookings[-1]['_id']))
+
+        for model, documents in ((ServiceProvider, providers), (Review, reviews), (Booking, bookings)):
+            if documents:
+                model.objects.mongo_insert_many(documents, ordered=False)
+        rollups.rebuild()
+
+    def booking_document(self, user_id, provider_id, status, booking_date=None):
+        return to_document(Booking(
+            _id=ObjectId(), user_id=user_id, provider_id=str(provider_id),
+            booking_date=booking_date or self.today + timedelta(days=7),
+            booking_time=dtime(self.rng.randint(8, 18), 0), status=status, notes='',
+        ), add=True)
+
+    # Requests
+
+    def token_for(self, user, **claims):
+        return IdentityRefreshToken.for_user(user, user_id=identity.user_id_for(user), **claims)
+
+    def routes(self):
+        """(url name, method, path for iteration i, body for iteration i, token for iteration i)"""
+        customer = self.token_for(self.customer)
+        provider = self.token_for(self.provider_user, user_type='provider', is_provider=True,
+                                  provider_id=self.provider_id)
+        customer_access = str(customer.access_token)
+        provider_access = str(provider.access_token)
+        staff_access = str(self.token_for(self.staff).access_token)
+        provider_id = str(self.provider_id)
+        booking_date = (self.today + timedelta(days=3)).isoformat()
+        logout_tokens = [self.token_for(self.customer) for _ in range(ITERATIONS)]
+
+        def fixed(value):
+            return lambda i: value
+
+        def registration(i, prefix, phone_block):
+            return {
+                'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com',
+                'password': 'Bench-pass-123', 'password2': 'Bench-pass-123',
+                'first_name': 'Bench', 'last_name': str(i), 'phone_number': f'+91-{phone_block}{i:07d}',
+            }
+
+        return [
+            ('home', 'get', fixed(reverse('home')), fixed(None), fixed(None)),
+            ('register', 'post', fixed(reverse('register')),
+             lambda i: registration(i, 'newcustomer', 740), fixed(None)),
+            ('login', 'post', fixed(reverse('login')),
+             fixed({'username': 'bench_customer', 'password': 'benchmark-pass'}), fixed(None)),
+            ('token_refresh', 'post', fixed(reverse('token_refresh')),
+             fixed({'refresh': str(customer)}), fixed(None)),
+            ('user_profile', 'get', fixed(reverse('user_profile')), fixed(None), fixed(customer_access)),
+            ('service_providers', 'get',
+             lambda i: reverse('service_providers', args=[CATEGORIES[i % len(CATEGORIES)]]),
+             fixed(None), fixed(customer_access)),
+            ('provider_detail', 'get', fixed(reverse('provider_detail', args=[provider_id])),
+             fixed(None), fixed(customer_access)),
+            ('create_booking', 'post', fixed(reverse('create_booking')),
+             fixed({'provider_id': provider_id, 'booking_date': booking_date, 'booking_time': '10:00'}),
+             fixed(customer_access)),
+            ('user_bookings', 'get', fixed(reverse('user_bookings')), fixed(None), fixed(customer_access)),
+            ('cancel_booking', 'put', lambda i: reverse('cancel_booking', args=[self.cancellable[i]]),
+             fixed(None), fixed(customer_access)),
+            ('submit_review', 'post', fixed(reverse('submit_review', args=[provider_id])),
+             lambda i: {'rating': i % 5 + 1, 'comment': 'Benchmark review'}, fixed(customer_access)),
+            ('provider_register', 'post', fixed(reverse('provider_register')),
+             lambda i: dict(registration(i, 'newprovider', 750), category_name='Plumber',
+                            experience_years=3, service_area='Patiala', city='Patiala'),
+             fixed(None)),
+            ('provider_dashboard', 'get', fixed(reverse('provider_dashboard')), fixed(None), fixed(provider_access)),
+            ('provider_profile', 'get', fixed(reverse('provider_profile')), fixed(None), fixed(provider_access)),
+            ('provider_profile', 'put', fixed(reverse('provider_profile')),
+             lambda i: {'description': f'Updated {i}'}, fixed(provider_access)),
+            ('provider_daily_stats', 'get', fixed(reverse('provider_daily_stats')), fixed(None),
+             fixed(provider_access)),
+            ('provider_bookings', 'get', fixed(reverse('provider_bookings')), fixed(None), fixed(provider_access)),
+            ('provider_accept_booking', 'put',
+             lambda i: reverse('provider_accept_booking', args=[self.actionable['accept'][i]]),
+             fixed(None), fixed(provider_access)),
+            ('provider_reject_booking', 'put',
+             lambda i: reverse('provider_reject_booking', args=[self.actionable['reject'][i]]),
+             fixed(None), fixed(provider_access)),
+            ('provider_complete_booking', 'put',
+             lambda i: reverse('provider_complete_booking', args=[self.actionable['complete'][i]]),
+             fixed({'completion_notes': 'Done'}), fixed(provider_access)),
+            ('provider_reviews', 'get', fixed(reverse('provider_reviews')), fixed(None), fixed(provider_access)),
+            ('cache_stats', 'get', fixed(reverse('cache_stats')), fixed(None), fixed(staff_access)),
+            ('export_data', 'get', fixed(reverse('export_data', args=['bookings'])), fixed(None),
+             fixed(staff_access)),
+            ('debug_user_info', 'get', fixed(reverse('debug_user_info')), fixed(None), fixed(provider_access)),
+            ('logout', 'post', fixed(reverse('logout')),
+             lambda i: {'refresh': str(logout_tokens[i])},
+             lambda i: str(logout_tokens[i].access_token)),
+        ]
+
+    def request(self, method, path, body, token, etag=None):
+        headers = {}
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        started = time.perf_counter()
+        response = getattr(self.client, method)(path, data=body, content_type='application/json', **headers)
+        if response.streaming:
+            # Streamed bodies are produced while they're read
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        elapsed = (time.perf_counter() - started) * 1000.0
+        match = SERVER_TIMING_QUERIES.search(response.get('Server-Timing', ''))
+        return response.status_code, elapsed, int(match.group(1)) if match else None, size, response.get('ETag')
+
+    def test_endpoints(self):
+        routes = self.routes()
+
+        route_names = {pattern.name for pattern in urlpatterns}
+        driven = {name for name, *_ in routes}
+        self.assertEqual(route_names - driven - set(EXCLUDED_ROUTES), set(), 'routes missing from the benchmark')
+
+        results = {}
+        failures = []
+
+        def drive(label, method, path_for, body_for, token_for, etags=None):
+            latencies, queries, sizes = [], [], []
+            seen = {}
+            for i in range(ITERATIONS):
+                path = path_for(i)
+                status_code, elapsed, query_count, size, etag = self.request(
+                    method, path, body_for(i), token_for(i), etags.get(path) if etags else None,
+                )
+                if status_code >= 400:
+                    failures.append(f'{label} #{i}: HTTP {status_code}')
+                if etags and status_code != 304:
+                    failures.append(f'{label} #{i}: HTTP {status_code}, expected 304')
+                latencies.append(elapsed)
+                sizes.append(size)
+                if query_count is not None:
+                    queries.append(query_count)
+                if etag:
+                    seen[path] = etag
+            results[label] = {
+                'requests': ITERATIONS,
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'queries_per_request': statistics.median(queries) if queries else None,
+                'max_queries': max(queries) if queries else None,
+                'bytes_per_response': int(statistics.median(sizes)),
+            }
+            return seen
+
+        for name, method, path_for, body_for, token_for in routes:
+            label = f'{method.upper()} {name}'
+            etags = drive(label, method, path_for, body_for, token_for)
+            if method == 'get' and etags:
+                drive(f'{label} (revalidated)', method, path_for, body_for, token_for, etags)
+
+        report = {
+            'backend': BACKEND,
+            'scale': {
+                'providers': PROVIDERS,
+                'bookings': BOOKINGS,
+                'reviews': REVIEWS,
+                'iterations': ITERATIONS,
+            },
+            'routes': results,
+        }
+        with open(OUTPUT, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+
+        print(f'\n{"route":<40} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8} {"bytes":>9}')
+        for route, row in sorted(results.items()):
+            print(f'{route:<40} {row["p50_ms"]:>9} {row["p95_ms"]:>9} '
+                  f'{str(row["queries_per_request"]):>8} {row["bytes_per_response"]:>9}')
+        print(f'Results written to {OUTPUT}')
+
+        self.assertEqual(failures, [])
+
+
+class TranslationCacheTests(MongoTestCase):
+    """Cached SELECT templates are re-run with each call's own parameters"""
+
+    def setUp(self):
+        super().setUp()
+        self.assertIsNotNone(translation_cache.cache, 'DJONGO_TRANSLATION_CACHE_SIZE is 0')
+        translation_cache.cache.clear()
+
+    def test_parameters_are_substituted_per_call(self):
+        self.make_provider('Ravi Plumbing', city='Patiala')
+        self.make_provider('Hair Studio', category='Barber', city='Mohali')
+
+        def names(**filters):
+            return sorted(provider.name for provider in ServiceProvider.objects.filter(**filters))
+
+        self.assertEqual(names(category_key='plumber'), ['Ravi Plumbing'])
+        misses = translation_cache.stats()['misses']
+        self.assertEqual(names(category_key='barber'), ['Hair Studio'])
+        self.assertEqual(names(category_key='carpenter'), [])
+        stats = translation_cache.stats()
+        self.assertEqual(stats['misses'], misses)
+        self.assertGreaterEqual(stats['hits'], 2)
+
+    def test_transformed_parameters_are_not_cached(self):
+        self.make_provider('Ravi Plumbing')
+        self.make_provider('Hair Studio', category='Barber')
+
+        self.assertEqual([p.name for p in ServiceProvider.objects.filter(name__icontains='ravi')], ['Ravi Plumbing'])
+        self.assertEqual([p.name for p in ServiceProvider.objects.filter(name__icontains='hair')], ['Hair Studio'])
+        self.assertGreaterEqual(translation_cache.stats()['uncacheable'], 1)
+
+    def test_substitute_reaches_nested_values(self):
+        spec = {'filter': {'$and': [{'a': translation_cache._Param(0)}, {'b': {'$in': [translation_cache._Param(1)]}}]}}
+        self.assertEqual(
+            translation_cache._substitute(spec, ('x', 2)),
+            {'filter': {'$and': [{'a': 'x'}, {'b': {'$in': [2]}}]}},
+        )
+
+
+class ListingPaginationTests(MongoTestCase):
+    """Keyset pages cover every provider exactly once, in sort order"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        ratings = [4.5, 4.5, 4.5, 3.9, 4.8, 2.0, 4.5]
+        for index, rating in enumerate(ratings):
+            self.make_provider(f'Provider {index}', rating=rating, experience_years=index % 3,
+                               city='Patiala' if index % 2 else 'Mohali')
+
+    def walk(self, **params):
+        seen, cursor = [], None
+        for _ in range(10):
+            sort = params.get('sort', 'rating')
+            documents, cursor = listing.fetch_provider_page('plumber', cursor=cursor and listing.decode_cursor(cursor, sort),
+                                                            **params)
+            seen.extend(documents)
+            if cursor is None:
+                return seen
+        self.fail('pagination did not end')
+
+    def test_pages_follow_sort_order_without_gaps_or_repeats(self):
+        for sort, field in listing.SORT_FIELDS.items():
+            with self.subTest(sort=sort):
+                seen = self.walk(sort=sort, limit=2)
+                keys = [(document[field], document['_id']) for document in seen]
+                self.assertEqual(len({document['_id'] for document in seen}), 7)
+                self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_documents_missing_the_sort_field_come_last(self):
+        for index in range(3):
+            provider = self.make_provider(f'Imported {index}')
+            ServiceProvider.objects.mongo_update_one({'_id': provider._id}, {'$unset': {'experience_years': ''}})
+        seen = self.walk(sort='experience', limit=2)
+        self.assertEqual(len({document['_id'] for document in seen}), 10)
+        self.assertEqual([document.get('experience_years') for document in seen[-3:]], [None] * 3)
+
+    def test_city_filter(self):
+        seen = self.walk(city_key='patiala', limit=2)
+        self.assertEqual({document['city'] for document in seen}, {'Patiala'})
+        self.assertEqual(len(seen), 3)
+
+    def test_view_pages_and_rejects_bad_cursor(self):
+        response = self.client.get('/service/plumber/', {'limit': 4})
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        self.assertTrue(first['has_more'])
+        response = self.client.get('/service/plumber/', {'limit': 4, 'cursor': first['next_cursor']})
+        second = response.json()
+        self.assertFalse(second['has_more'])
+        ids = [p['id'] for p in first['providers'] + second['providers']]
+        self.assertEqual(len(set(ids)), 7)
+
+        self.assertEqual(self.client.get('/service/plumber/', {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get('/service/plumber/', {'sort': 'price'}).status_code, 400)
+
+    def test_rejects_crafted_and_mismatched_cursors(self):
+        provider_id = str(ServiceProvider.objects.mongo_find_one({}, {'_id': 1})['_id'])
+        for sort_value in [{'$ne': None}, [1], 'x', True]:
+            with self.subTest(sort_value=sort_value):
+                cursor = base64.urlsafe_b64encode(json.dumps(['rating', sort_value, provider_id]).encode()).decode()
+                self.assertEqual(self.client.get('/service/plumber/', {'cursor': cursor}).status_code, 400)
+
+        next_cursor = self.client.get('/service/plumber/', {'limit': 2, 'sort': 'experience'}).json()['next_cursor']
+        response = self.client.get('/service/plumber/', {'limit': 2, 'cursor': next_cursor})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'cursor was issued for another sort')
+
+
+class ProviderImportTests(MongoTestCase):
+    """import_providers: duplicates, invalid rows and resuming from a checkpoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.make_user('customer', phone_number='+91-8000000001')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, rows):
+        path = os.path.join(self.directory, 'providers.jsonl')
+        with open(path, 'w') as f:
+            for row in rows:
+                f.write((row if isinstance(row, str) else json.dumps(row)) + '\n')
+        return path
+
+    def row(self, name, phone, **fields):
+        row = dict(name=name, phone_number=phone, category_name='plumber', experience_years=3,
+                   service_area='Patiala', city='Patiala')
+        row.update(fields)
+        return row
+
+    def errors(self, path):
+        with open(f'{path}.errors.jsonl') as f:
+            return {entry['record']: entry['errors'] for entry in map(json.loads, f)}
+
+    def test_duplicates_and_invalid_rows_are_reported(self):
+        self.make_provider('Existing', phone_number='+91-8000000002')
+        path = self.write([
+            self.row('New One', '+91-8000000010'),
+            self.row('Same Phone', '+91-8000000010'),
+            self.row('Customer Phone', '+91-8000000001'),
+            self.row('Provider Phone', '+91-8000000002'),
+            self.row('Bad Category', '+91-8000000011', category_name='Astrology'),
+            'not json',
+            self.row('New Two', '+91-8000000012'),
+        ])
+        call_command('import_providers', path, batch_size=3, stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(p.name for p in ServiceProvider.objects.filter(category_key='plumber')),
+            ['Existing', 'New One', 'New Two'],
+        )
+        self.assertEqual(
+            ServiceProvider.objects.mongo_find_one({'name': 'New One'})['category_name'], 'Plumber'
+        )
+        self.assertEqual(sorted(self.errors(path)), [2, 3, 4, 5, 6])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_resumes_after_checkpoint(self):
+        path = self.write([self.row(f'Provider {i}', f'+91-80000001{i:02d}') for i in range(5)])
+        with open(f'{path}.checkpoint', 'w') as f:
+            json.dump({'source': os.path.abspath(path), 'records': 3, 'counts': {'inserted': 3}}, f)
+
+        out = io.StringIO()
+        call_command('import_providers', path, batch_size=2, stdout=out)
+
+        self.assertEqual(sorted(p.name for p in ServiceProvider.objects.all()), ['Provider 3', 'Provider 4'])
+        self.assertIn('Resuming after record 3', out.getvalue())
+        self.assertIn('Imported 5 provider(s)', out.getvalue())
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_checkpoint_from_another_file_is_refused(self):
+        path = self.write([self.row('Provider', '+91-8000000200')])
+        with open(f'{path}.checkpoint', 'w') as f:
+            json.dump({'source': '/elsewhere.jsonl', 'records': 1, 'counts': {}}, f)
+        with self.assertRaises(CommandError):
+            call_command('import_providers', path, stdout=io.StringIO())
+        call_command('import_providers', path, restart=True, stdout=io.StringIO())
+        self.assertEqual([p.name for p in ServiceProvider.objects.all()], ['Provider'])
+
+
+class SocialProofTests(MongoTestCase):
+    """Contact reviews are cached per (user, provider) and dropped on writes"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.viewer = self.make_user('viewer', phone_number='+91-8100000001')
+        self.viewer_id = identity.user_id_for(self.viewer)
+        self.friend = self.make_user('friend', phone_number='+91-8100000002')
+        self.friend_id = identity.user_id_for(self.friend)
+        Contact.objects.create(user_id=self.viewer_id, name='Asha', phone_number='+91-8100000002')
+        self.first = str(self.make_provider('First')._id)
+        self.second = str(self.make_provider('Second')._id)
+
+    def test_entries_are_per_provider(self):
+        Review.objects.create(user_id=self.friend_id, provider_id=self.first, rating=5, is_trusted=True)
+
+        first = social_proof.trusted_by_for_providers(self.viewer_id, [self.first])
+        second = social_proof.trusted_by_for_providers(self.viewer_id, [self.second])
+        self.assertEqual(first[self.first]['names'], ['Asha'])
+        self.assertEqual(second[self.second]['count'], 0)
+
+        # The second call added its own entry without rewriting the first
+        keys = social_proof._cache_keys(self.viewer_id, [self.first, self.second])
+        self.assertEqual(len(cache.get_many(list(keys))), 2)
+
+        with mock.patch.object(social_proof, '_load_contact_reviews') as load:
+            both = social_proof.contact_reviews_for_providers(self.viewer_id, [self.first, self.second])
+        load.assert_not_called()
+        self.assertEqual([review['user'] for review in both[self.first]], ['Asha'])
+
+    def test_contact_review_invalidates(self):
+        self.assertEqual(social_proof.trusted_by_for_providers(self.viewer_id, [self.second])[self.second]['count'], 0)
+        Review.objects.create(user_id=self.friend_id, provider_id=self.second, rating=4, is_trusted=True)
+        self.assertEqual(social_proof.trusted_by_for_providers(self.viewer_id, [self.second])[self.second]['names'],
+                         ['Asha'])
+
+
+class RatingAggregateTests(MongoTestCase):
+    """Review submits keep the provider's counters and weighted rating exact"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.provider_id = str(self.make_provider('Rated', rating=4.0, original_rating=4.0, total_reviews=10)._id)
+        self.first = self.make_user('first', phone_number='+91-8200000001')
+        self.second = self.make_user('second', phone_number='+91-8200000002')
+
+    def submit(self, user, rating):
+        return self.client.post(f'/api/provider/{self.provider_id}/review/', {'rating': rating},
+                                content_type='application/json', **self.auth(user))
+
+    def counters(self):
+        document = ServiceProvider.objects.mongo_find_one({'_id': ObjectId(self.provider_id)})
+        histogram = {star: count for star, count in document['rating_histogram'].items() if count}
+        return document['rating'], document['total_reviews'], document['rating_sum'], histogram
+
+    def test_submits_and_resubmits(self):
+        response = self.submit(self.first, 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['message'], 'Review submitted successfully!')
+        # (4.0 * 10 + 5) / 11
+        self.assertEqual(self.counters(), (4.1, 11, 5, {'5': 1}))
+
+        response = self.submit(self.first, 3)
+        self.assertEqual(response.json()['message'], 'Review updated successfully!')
+        self.assertEqual(self.counters(), (3.9, 11, 3, {'3': 1}))
+        self.assertEqual(Review.objects.mongo_count_documents({'provider_id': self.provider_id}), 1)
+
+        self.submit(self.second, 1)
+        # (40 + 3 + 1) / 12
+        self.assertEqual(self.counters(), (3.7, 12, 4, {'3': 1, '1': 1}))
+        self.assertEqual(self.submit(self.second, 6).status_code, 400)
+
+        # Recomputing from the reviews agrees with the running counters
+        incremental = self.counters()
+        ratings.rebuild_aggregates([self.provider_id])
+        self.assertEqual(self.counters(), incremental)
+
+    def test_one_review_per_user_and_provider(self):
+        ratings.save_review(identity.user_id_for(self.first), self.provider_id, 4)
+        with self.assertRaises(DuplicateKeyError):
+            Review.objects.mongo_insert_one({'user_id': identity.user_id_for(self.first),
+                                             'provider_id': self.provider_id, 'rating': 2})
+
+    def test_concurrent_first_submit_becomes_an_update(self):
+        user_id = identity.user_id_for(self.first)
+        ratings.save_review(user_id, self.provider_id, 2)
+        find_one_and_update = Review.objects.mongo_find_one_and_update
+        # The other request's insert lands between this one's update and insert
+        calls = iter([lambda *args, **kwargs: None, find_one_and_update])
+        with mock.patch.object(Review.objects, 'mongo_find_one_and_update',
+                               side_effect=lambda *args, **kwargs: next(calls)(*args, **kwargs)):
+            created, _ = ratings.save_review(user_id, self.provider_id, 5)
+        self.assertFalse(created)
+        self.assertEqual(self.counters()[2:], (5, {'5': 1}))
+
+    def test_provider_deleted_after_lookup_leaves_no_review(self):
+        # Cached by an earlier page view, then deleted without signals
+        provider_cache.provider_by_id(self.provider_id)
+        ServiceProvider.objects.mongo_delete_one({'_id': ObjectId(self.provider_id)})
+
+        response = self.submit(self.first, 5)
+        self.assertEqual((response.status_code, response.json()), (404, {'error': 'Provider not found'}))
+        self.assertEqual(Review.objects.mongo_count_documents({'provider_id': self.provider_id}), 0)
+
+
+class BookingRollupTests(MongoTestCase):
+    """rebuild() replaces each day's rollup in place and drops days without bookings"""
+
+    def setUp(self):
+        super().setUp()
+        self.provider_id = str(ObjectId())
+        self.day = timezone.now().date()
+
+    def insert_bookings(self, *statuses_by_day):
+        documents = []
+        for offset, statuses in enumerate(statuses_by_day):
+            for status in statuses:
+                documents.append(to_document(Booking(
+                    _id=ObjectId(), user_id=1, provider_id=self.provider_id, status=status,
+                    booking_date=self.day + timedelta(days=offset), booking_time=dtime(10, 0),
+                ), add=True))
+        Booking.objects.mongo_insert_many(documents)
+
+    def rollups(self):
+        return {
+            doc['_id']: {status: doc[status] for status in ['total'] + rollups.STATUSES if doc[status]}
+            for doc in ProviderDailyStats.objects.mongo_find({'provider_id': self.provider_id})
+        }
+
+    def test_rebuild(self):
+        self.insert_bookings(['pending', 'pending', 'accepted'], ['completed'])
+        first, second, gone = (rollups.rollup_id(self.provider_id, self.day + timedelta(days=offset))
+                               for offset in range(3))
+        ProviderDailyStats.objects.mongo_insert_many([
+            {'_id': first, 'provider_id': self.provider_id, 'day': rollups.as_stored(self.day), 'total': 9, 'pending': 9},
+            {'_id': gone, 'provider_id': self.provider_id, 'day': rollups.as_stored(self.day), 'total': 1, 'pending': 1},
+        ])
+
+        self.assertEqual(rollups.rebuild(self.provider_id), 2)
+        expected = {
+            first: {'total': 3, 'pending': 2, 'accepted': 1},
+            second: {'total': 1, 'completed': 1},
+        }
+        self.assertEqual(self.rollups(), expected)
+
+        # Populating from scratch (migration 0005) gives the same rollups
+        ProviderDailyStats.objects.mongo_delete_many({})
+        module = importlib.import_module('services.migrations.0005_provider_daily_stats')
+        connection.ensure_connection()
+        module.populate_rollups(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(self.rollups(), expected)
+
+
+class BookingStateTests(MongoTestCase):
+    """Transitions only apply from their allowed statuses and within the caller's scope"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.customer = self.make_user('customer', phone_number='+91-8300000001')
+        self.customer_id = identity.user_id_for(self.customer)
+        self.stranger = self.make_user('stranger', phone_number='+91-8300000002')
+        self.provider_user = self.make_user('provider', phone_number='+91-8300000003')
+        self.provider = self.make_provider('Owner', user_id=identity.user_id_for(self.provider_user))
+        self.other_provider = self.make_provider('Other')
+
+    def booking(self, status='pending', provider=None):
+        booking = Booking.objects.create(
+            user_id=self.customer_id, provider_id=str((provider or self.provider)._id), status=status,
+            booking_date=timezone.now().date() + timedelta(days=1), booking_time=dtime(10, 0),
+        )
+        return str(booking._id)
+
+    def status(self, booking_id):
+        return Booking.objects.mongo_find_one({'_id': ObjectId(booking_id)})['status']
+
+    def test_allowed_transitions(self):
+        booking_id = self.booking()
+        self.assertEqual(booking_state.accept(booking_id, self.provider._id).status, 'accepted')
+        booking = booking_state.complete(booking_id, self.provider._id, completion_notes='Fixed')
+        self.assertEqual((booking.status, booking.completion_notes), ('completed', 'Fixed'))
+        self.assertIsNotNone(booking.completed_at)
+        self.assertEqual(self.status(booking_id), 'completed')
+
+        booking_id = self.booking()
+        self.assertEqual(booking_state.cancel(booking_id, self.customer_id).status, 'cancelled')
+
+    def test_rejected_transitions_leave_the_booking_alone(self):
+        for status, action in (('accepted', 'accept'), ('accepted', 'reject'), ('completed', 'complete'),
+                               ('completed', 'cancel'), ('rejected', 'accept'), ('cancelled', 'complete')):
+            with self.subTest(status=status, action=action):
+                booking_id = self.booking(status)
+                owner = self.customer_id if action == 'cancel' else self.provider._id
+                with self.assertRaises(booking_state.InvalidTransition) as raised:
+                    getattr(booking_state, action)(booking_id, owner)
+                self.assertEqual(raised.exception.current_status, status)
+                self.assertEqual(self.status(booking_id), status)
+
+    def test_other_owners_cannot_see_the_booking(self):
+        booking_id = self.booking()
+        with self.assertRaises(booking_state.BookingNotFound):
+            booking_state.accept(booking_id, self.other_provider._id)
+        with self.assertRaises(booking_state.BookingNotFound):
+            booking_state.cancel(booking_id, identity.user_id_for(self.stranger))
+        self.assertEqual(self.status(booking_id), 'pending')
+
+    def test_only_one_of_two_conflicting_actions_applies(self):
+        booking_id = self.booking()
+        booking_state.reject(booking_id, self.provider._id)
+        with self.assertRaises(booking_state.InvalidTransition):
+            booking_state.accept(booking_id, self.provider._id)
+        self.assertEqual(self.status(booking_id), 'rejected')
+
+    def test_view_responses(self):
+        provider = self.auth(self.provider_user, user_type='provider', is_provider=True,
+                             provider_id=self.provider._id)
+        booking_id = self.booking()
+
+        response = self.client.put(f'/api/provider/bookings/{booking_id}/accept/', **provider)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['booking']['status'], 'accepted')
+
+        response = self.client.put(f'/api/provider/bookings/{booking_id}/reject/', **provider)
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Booking is not pending'}))
+
+        response = self.client.put(f'/api/provider/bookings/{self.booking(provider=self.other_provider)}/accept/',
+                                   **provider)
+        self.assertEqual((response.status_code, response.json()), (404, {'error': 'Booking not found'}))
+        response = self.client.put('/api/provider/bookings/not-an-id/complete/', **provider)
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid booking ID'}))
+        response = self.client.put(f'/api/provider/bookings/{booking_id}/accept/', **self.auth(self.customer))
+        self.assertEqual((response.status_code, response.json()), (404, {'error': 'Provider profile not found'}))
+
+        response = self.client.put(f'/api/bookings/{booking_id}/cancel/', **self.auth(self.stranger))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.put(f'/api/bookings/{booking_id}/cancel/', **self.auth(self.customer))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put(f'/api/bookings/{booking_id}/cancel/', **self.auth(self.customer))
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Booking cannot be cancelled'}))
+
+
+class UserIdentityTests(MongoTestCase):
+    """Each user pk gets one user_id, distinct from every other user's"""
+
+    def setUp(self):
+        super().setUp()
+        identity._stored_user_id.cache_clear()
+        self.addCleanup(identity._stored_user_id.cache_clear)
+
+    def test_collision_takes_the_next_candidate(self):
+        UserIdentity.objects.create(user_pk='imported', user_id=42)
+        user_id = identity.user_id_for_pk(42)
+        self.assertNotEqual(user_id, 42)
+        self.assertEqual(UserIdentity.objects.get(user_pk='42').user_id, user_id)
+        identity._stored_user_id.cache_clear()
+        self.assertEqual(identity.user_id_for_pk(42), user_id)
+
+    def test_no_free_candidate(self):
+        for index, user_id in enumerate(identity._candidate_user_ids(43)):
+            UserIdentity.objects.create(user_pk=f'imported-{index}', user_id=user_id)
+        with self.assertRaises(identity.UserIdUnavailable):
+            identity.user_id_for_pk(43)
+
+    def test_concurrent_store_wins(self):
+        create = UserIdentity.objects.create
+
+        def stored_by_another_worker(**fields):
+            create(user_pk=fields['user_pk'], user_id=7)
+            return create(**fields)
+
+        with mock.patch.object(UserIdentity.objects, 'create', side_effect=stored_by_another_worker):
+            self.assertEqual(identity.user_id_for_pk(44), 7)
+
+    def test_names_resolve_for_an_alternate_user_id(self):
+        self.make_category('Plumber')
+        user = User.objects.create(username='alternate', password=make_password('test-pass'))
+        # The id derived from the pk is taken, so this user gets an alternate that is no User.id
+        UserIdentity.objects.create(user_pk='imported', user_id=user.pk)
+        user_id = identity.user_id_for(user)
+        self.assertNotEqual(user_id, user.pk)
+        UserProfile.objects.create(user_id=user_id, phone_number='+91-8800000001')
+        owner = self.make_user('owner', phone_number='+91-8800000002')
+        provider = self.make_provider('Owner', user_id=identity.user_id_for(owner))
+        Booking.objects.create(user_id=user_id, provider_id=str(provider._id), status='pending',
+                               booking_date=timezone.now().date(), booking_time=dtime(10, 0))
+        Review.objects.create(user_id=user_id, provider_id=str(provider._id), rating=5, comment='Great')
+        headers = self.auth(owner, user_type='provider', is_provider=True, provider_id=provider._id)
+
+        self.assertEqual(identity.users_by_user_id([user_id, user.pk]), {user_id: user})
+        for views in (settings.REPOSITORY_VIEWS, set()):
+            with self.subTest(repository_views=views), self.settings(REPOSITORY_VIEWS=views):
+                cache.clear()
+                provider_cache.clear()
+                response = self.client.get('/api/bookings/', **self.auth(user))
+                self.assertEqual(response.json()['bookings'][0]['user_name'], 'alternate')
+                response = self.client.get('/api/provider/bookings/', **headers)
+                self.assertEqual(response.json()['all'][0]['customer_name'], 'alternate')
+                response = self.client.get(f'/provider/{provider._id}/')
+                self.assertIn('alternate', [review['user'] for review in response.json()['reviews']['from_others']])
+                response = self.client.get('/api/provider/reviews/', **headers)
+                self.assertEqual(response.json()['reviews'][0]['customer'], 'alternate')
+                response = self.client.get('/api/profile/', **self.auth(user))
+                self.assertEqual(response.json()['username'], 'alternate')
+
+
+class TokenRevocationTests(MongoTestCase):
+    """Logouts are stored in MongoDB, so every worker sees them"""
+
+    def setUp(self):
+        super().setUp()
+        authentication._revocation_memo.clear()
+        self.addCleanup(authentication._revocation_memo.clear)
+        self.user = self.make_user('customer', phone_number='+91-8400000001')
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        refresh = IdentityRefreshToken.for_user(self.user)
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {refresh.access_token}'}
+        self.assertEqual(self.client.get('/api/bookings/', **headers).status_code, 200)
+
+        response = self.client.post('/api/logout/', {'refresh': str(refresh)}, content_type='application/json',
+                                    **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/bookings/', **headers).status_code, 401)
+        response = self.client.post('/api/token/refresh/', {'refresh': str(refresh)}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_workers_see_a_revocation_within_the_memo_delay(self):
+        token = IdentityRefreshToken.for_user(self.user).access_token
+        self.assertFalse(authentication.is_revoked(token))
+
+        # Another worker logs the user out everywhere; this one's memo still says no
+        TokenRevocation.objects.mongo_insert_one({
+            '_id': authentication._user_key(self.user.username),
+            'revoked_before': int(time.time()), 'expires_at': authentication._expires_at(60),
+        })
+        self.assertFalse(authentication.is_revoked(token))
+
+        later = time.monotonic() + authentication.REVOCATION_MEMO_SECONDS
+        with mock.patch('time.monotonic', return_value=later):
+            self.assertTrue(authentication.is_revoked(token))
+
+    def test_entries_expire_with_their_tokens(self):
+        indexes = TokenRevocation.objects.mongo_index_information()
+        self.assertEqual(indexes['token_revocation_expiry']['expireAfterSeconds'], 0)
+
+
+class RequestProviderTests(MongoTestCase):
+    """request.provider comes from the token's claims when it has them"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.user = self.make_user('provider', phone_number='+91-8500000001')
+        self.user_id = identity.user_id_for(self.user)
+        self.provider = self.make_provider('Owner', user_id=self.user_id)
+
+    def request_provider(self, **claims):
+        token = IdentityRefreshToken.for_user(self.user, user_id=self.user_id, **claims).access_token
+        request = mock.Mock(user=authentication.ClaimsUser(token))
+        with mock.patch.object(provider_cache, '_provider_id_for_user',
+                               wraps=provider_cache._provider_id_for_user) as lookup:
+            try:
+                return provider_cache.request_provider(request), lookup.call_count
+            except ServiceProvider.DoesNotExist:
+                return None, lookup.call_count
+
+    def test_customer_claims_skip_the_lookup(self):
+        self.assertEqual(self.request_provider(), (None, 0))
+
+    def test_provider_id_claim_is_loaded_directly(self):
+        provider, lookups = self.request_provider(user_type='provider', is_provider=True,
+                                                  provider_id=self.provider._id)
+        self.assertEqual((provider._id, lookups), (self.provider._id, 0))
+
+    def test_stale_provider_id_claim_falls_back_to_the_lookup(self):
+        other = self.make_provider('Transferred', user_id=self.user_id + 1)
+        provider, lookups = self.request_provider(user_type='provider', is_provider=True, provider_id=other._id)
+        self.assertEqual((provider._id, lookups), (self.provider._id, 1))
+        provider, lookups = self.request_provider(user_type='provider', is_provider=True)
+        self.assertEqual((provider._id, lookups), (self.provider._id, 1))
+
+
+class ProviderProfileTests(MongoTestCase):
+    """PUT provider/profile/ writes only the edited fields, through request.provider"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.user = self.make_user('provider', phone_number='+91-8600000001')
+        self.provider = self.make_provider('Before', user_id=identity.user_id_for(self.user), rating=4.4)
+        self.headers = self.auth(self.user, user_type='provider', is_provider=True, provider_id=self.provider._id)
+
+    def test_put_updates_the_profile(self):
+        for views in ({'provider_profile'}, set()):
+            with self.subTest(repository_views=views), self.settings(REPOSITORY_VIEWS=views):
+                name = f'After {len(views)}'
+                response = self.client.put('/api/provider/profile/', {'name': name, 'availability': 'Sundays'},
+                                           content_type='application/json', **self.headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['provider']['name'], name)
+
+                document = ServiceProvider.objects.mongo_find_one({'_id': self.provider._id})
+                self.assertEqual((document['name'], document['availability'], document['rating']),
+                                 (name, 'Sundays', 4.4))
+                response = self.client.get('/api/provider/profile/', **self.headers)
+                self.assertEqual(response.json()['name'], name)
+
+
+class GenerateDatasetTests(MongoTestCase):
+    """generate_dataset at a tiny scale, in this process"""
+
+    def generate(self, *args, **options):
+        options = dict(dict(customers=5, providers=2, reviews=40, bookings=10, workers=1), **options)
+        call_command('generate_dataset', *args, stdout=io.StringIO(), **options)
+
+    def test_reviews_stay_unique_per_user_and_provider(self):
+        self.generate()
+        pairs = [(doc['user_id'], doc['provider_id']) for doc in Review.objects.mongo_find()]
+        # 5 customers x 2 providers
+        self.assertGreater(len(pairs), 0)
+        self.assertLessEqual(len(pairs), 10)
+        self.assertEqual(len(pairs), len(set(pairs)))
+
+
+    def test_flush_drops_cached_copies(self):
+        self.make_category('Plumber')
+        viewer = self.make_user('viewer', phone_number='+91-8700000001', is_superuser=True)
+        viewer_id = identity.user_id_for(viewer)
+        reviewer = self.make_user('reviewer', phone_number='+91-8700000002')
+        owner = self.make_user('owner', phone_number='+91-8700000003')
+        provider = self.make_provider('Flushed', user_id=identity.user_id_for(owner))
+        provider_id = str(provider._id)
+        Contact.objects.create(user_id=viewer_id, name='Asha', phone_number='+91-8700000002')
+        Review.objects.create(user_id=identity.user_id_for(reviewer), provider_id=provider_id, rating=5, is_trusted=True)
+
+        # Warm the caches the flush has to invalidate
+        self.assertEqual(provider_cache.provider_for_user_id(identity.user_id_for(owner))._id, provider._id)
+        self.assertEqual(social_proof.trusted_by_for_providers(viewer_id, [provider_id])[provider_id]['count'], 1)
+        self.assertEqual(len(listing.shared_page('plumber')[0]), 1)
+
+        self.generate('--flush', customers=1, providers=1, reviews=0, bookings=0)
+
+        with self.assertRaises(ServiceProvider.DoesNotExist):
+            provider_cache.provider_by_id(provider_id)
+        with self.assertRaises(ServiceProvider.DoesNotExist):
+            provider_cache.provider_for_user_id(identity.user_id_for(owner))
+        self.assertEqual(social_proof.trusted_by_for_providers(viewer_id, [provider_id])[provider_id]['count'], 0)
+        self.assertNotIn(provider_id, [item['id'] for item in listing.shared_page('plumber')[0]])
+
+
+class SharedCacheCheckTests(unittest.TestCase):
+    """services.W003: version stamps in a per-process cache"""
+
+    def check(self, backend, debug=False):
+        caches = {'default': {'BACKEND': backend}}
+        with override_settings(CACHES=caches, DEBUG=debug):
+            return [warning.id for warning in checks.check_shared_cache(None)]
+
+    def test_per_process_backends_warn_outside_debug(self):
+        self.assertEqual(self.check('django.core.cache.backends.locmem.LocMemCache'), ['services.W003'])
+        self.assertEqual(self.check('django.core.cache.backends.locmem.LocMemCache', debug=True), [])
+        self.assertEqual(self.check('django.core.cache.backends.redis.RedisCache'), [])
+
+
+@override_settings(CONDITIONAL_ETAGS=True)
+class ConditionalGetTests(MongoTestCase):
+    """Repeated reads are answered 304 until something they show changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.provider = self.make_provider('Ravi Plumbing')
+        self.customer = self.make_user('customer', phone_number='+91-8800000001')
+        self.headers = self.auth(self.customer)
+
+    def revalidate(self, path, response, **headers):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'], **headers).status_code
+
+    def test_home(self):
+        response = self.client.get('/')
+        self.assertEqual(self.revalidate('/', response), 304)
+        self.make_category('Carpenter')
+        self.assertEqual(self.revalidate('/', response), 200)
+
+    def test_listing_and_provider_detail(self):
+        listing_page = self.client.get('/service/plumber/')
+        detail = self.client.get(f'/provider/{self.provider._id}/')
+        self.assertEqual(self.revalidate('/service/plumber/', listing_page), 304)
+        self.assertEqual(self.revalidate(f'/provider/{self.provider._id}/', detail), 304)
+
+        self.provider.description = 'Now with emergency call-outs'
+        self.provider.save()
+        self.assertEqual(self.revalidate('/service/plumber/', listing_page), 200)
+        self.assertEqual(self.revalidate(f'/provider/{self.provider._id}/', detail), 200)
+
+    def test_personalized_responses(self):
+        anonymous = self.client.get('/service/plumber/')
+        personal = self.client.get('/service/plumber/', **self.headers)
+        self.assertNotEqual(anonymous['ETag'], personal['ETag'])
+        self.assertIn('private', personal['Cache-Control'])
+        self.assertEqual(self.revalidate('/service/plumber/', personal, **self.headers), 304)
+
+        # A new contact changes who the customer sees as trusted
+        Contact.objects.create(user_id=identity.user_id_for(self.customer), name='Asha', phone_number='+91-8800000002')
+        self.assertEqual(self.revalidate('/service/plumber/', personal, **self.headers), 200)
+        self.assertEqual(self.revalidate('/service/plumber/', anonymous), 304)
+
+    def test_bookings(self):
+        booking = Booking.objects.create(
+            user_id=identity.user_id_for(self.customer), provider_id=str(self.provider._id), status='pending',
+            booking_date=timezone.now().date() + timedelta(days=1), booking_time=dtime(10, 0),
+        )
+        response = self.client.get('/api/bookings/', **self.headers)
+        self.assertEqual(self.revalidate('/api/bookings/', response, **self.headers), 304)
+
+        self.client.put(f'/api/bookings/{booking._id}/cancel/', **self.headers)
+        self.assertEqual(self.revalidate('/api/bookings/', response, **self.headers), 200)
+
+    def test_stale_listing_goes_out_without_an_etag(self):
+        response = self.client.get('/service/plumber/')
+        self.provider.name = 'Renamed'
+        self.provider.save()
+
+        # Another process holds the rebuild lock: the previous page is served meanwhile
+        key = listing._page_key('plumber', '', 'rating', listing.DEFAULT_LIMIT, None)
+        cache.add(f"singleflight:{key}:{listing.listing_version('plumber')}", 1)
+        stale = self.client.get('/service/plumber/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(stale.status_code, 200)
+        self.assertFalse(stale.has_header('ETag'))
+        self.assertEqual(stale.json()['providers'][0]['name'], 'Ravi Plumbing')
+
+    @override_settings(CONDITIONAL_ETAGS=None)
+    def test_no_etags_with_a_per_process_cache(self):
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH='"anything"').status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class SingleFlightTests(unittest.TestCase):
+    """One rebuild per key and version; older values are handed out meanwhile, flagged stale"""
+
+    def setUp(self):
+        cache.clear()
+        self.release = threading.Event()
+        self.computed = []
+
+    def compute(self, value='fresh'):
+        def build():
+            self.computed.append(value)
+            self.release.wait(5)
+            return value
+        return build
+
+    def call(self, results, version=2, compute=None):
+        singleflight.reset_stale()
+        try:
+            value = singleflight.cached('key', version, compute or self.compute(), 60)
+        except RuntimeError as e:
+            value = e
+        results.append((value, singleflight.served_stale()))
+
+    def start(self, results, **kwargs):
+        thread = threading.Thread(target=self.call, args=(results,), kwargs=kwargs)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread
+
+    def wait_for_leader(self):
+        for _ in range(100):
+            if singleflight.stats()['in_flight']:
+                return
+            time.sleep(0.01)
+        self.fail('no leader')
+
+    def test_concurrent_callers_share_one_computation(self):
+        results = []
+        leader = self.start(results)
+        self.wait_for_leader()
+        followers = [self.start(results) for _ in range(4)]
+        self.release.set()
+        for thread in [leader] + followers:
+            thread.join()
+        self.assertEqual(self.computed, ['fresh'])
+        self.assertEqual(results, [('fresh', False)] * 5)
+        self.assertEqual(cache.get('key'), (2, 'fresh'))
+
+    def test_older_version_is_served_stale_during_the_rebuild(self):
+        cache.set('key', (1, 'old'))
+        results = []
+        leader = self.start(results)
+        self.wait_for_leader()
+        self.call(results)
+        self.assertEqual(results, [('old', True)])
+        self.release.set()
+        leader.join()
+        self.assertEqual(results[1], ('fresh', False))
+
+    def test_followers_of_a_stale_leader_are_flagged(self):
+        # The leader finds another process rebuilding and takes the older value
+        def shared_flight(*args):
+            self.release.wait(5)
+            return 'old', True
+
+        results = []
+        with mock.patch.object(singleflight, '_shared_flight', side_effect=shared_flight):
+            leader = self.start(results)
+            self.wait_for_leader()
+            follower = self.start(results)
+            time.sleep(0.05)
+            self.release.set()
+            leader.join()
+            follower.join()
+        self.assertEqual(results, [('old', True)] * 2)
+
+    def test_followers_compute_when_the_leader_fails(self):
+        def failing():
+            self.release.wait(5)
+            raise RuntimeError('build failed')
+
+        results = []
+        leader = self.start(results, compute=failing)
+        self.wait_for_leader()
+        follower = self.start(results, compute=self.compute('retried'))
+        time.sleep(0.05)
+        self.release.set()
+        leader.join()
+        follower.join()
+        self.assertIn(('retried', False), results)
+        self.assertEqual([str(value) for value, _ in results if isinstance(value, RuntimeError)], ['build failed'])
+
+
+class QueryInstrumentationTests(MongoTestCase):
+    """Server-Timing counts every query and repeated query shapes are flagged"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.provider_ids = [self.make_provider(f'Provider {index}')._id for index in range(8)]
+
+    def serve(self, view):
+        middleware = instrumentation.QueryInstrumentationMiddleware(view)
+        return middleware(RequestFactory().get('/providers/'))
+
+    def queries(self, response):
+        return int(SERVER_TIMING_QUERIES.search(response['Server-Timing']).group(1))
+
+    def test_per_row_query_is_flagged(self):
+        def view(request):
+            for provider_id in self.provider_ids:
+                ServiceProvider.objects.mongo_find_one({'_id': provider_id})
+            return HttpResponse()
+
+        with self.assertLogs('services.instrumentation', 'INFO') as logs:
+            response = self.serve(view)
+        self.assertEqual(self.queries(response), 8)
+        warnings = [record for record in logs.records if record.levelname == 'WARNING']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('Possible N+1 on GET /providers/: 8x', warnings[0].getMessage())
+        stats = next(record.query_stats for record in logs.records if hasattr(record, 'query_stats'))
+        self.assertEqual((stats['queries'], stats['repeated_shapes']), (8, 1))
+
+    def test_batched_query_is_not_flagged(self):
+        def view(request):
+            list(ServiceProvider.objects.mongo_find({'_id': {'$in': self.provider_ids}}))
+            return HttpResponse()
+
+        with self.assertNoLogs('services.instrumentation', 'WARNING'):
+            response = self.serve(view)
+        self.assertEqual(self.queries(response), 1)
+
+        with self.assertNoLogs('services.instrumentation', 'WARNING'):
+            response = self.client.get('/service/plumber/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(self.queries(response), settings.QUERY_REPEAT_THRESHOLD)
+
+    def test_query_shape_ignores_values(self):
+        self.assertEqual(
+            instrumentation.query_shape('find', {'find': 'booking', 'filter': {'user_id': 1, 'status': {'$in': [1]}}}),
+            instrumentation.query_shape('find', {'find': 'booking', 'filter': {'user_id': 2, 'status': {'$in': [2, 3]}}}),
+        )
+
+class ExportTests(MongoTestCase):
+    """export_data streams bookings and reviews to staff only"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.staff = self.make_user('staff', is_staff=True)
+        self.customer = self.make_user('customer', phone_number='+91-8400000001')
+        customer_id = identity.user_id_for(self.customer)
+        providers = [str(self.make_provider(f'Provider {index}')._id) for index in range(3)]
+        for provider_id in providers:
+            Booking.objects.create(user_id=customer_id, provider_id=provider_id, status='pending',
+                                   booking_date=timezone.now().date(), booking_time=dtime(10, 0))
+        for provider_id in providers[:2]:
+            Review.objects.create(user_id=customer_id, provider_id=provider_id, rating=4, comment='Good')
+
+    def export(self, dataset, user=None, **params):
+        return self.client.get(f'/api/admin/export/{dataset}/', params, **self.auth(user or self.staff))
+
+    def body(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_and_csv(self):
+        for dataset, model, count in (('bookings', Booking, 3), ('reviews', Review, 2)):
+            field_names = exports.DATASETS[dataset][1]
+            with self.subTest(dataset=dataset, output='ndjson'):
+                response = self.export(dataset)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+                rows = [json.loads(line) for line in self.body(response).splitlines()]
+                self.assertEqual(len(rows), count)
+                self.assertEqual(list(rows[0]), field_names)
+
+            with self.subTest(dataset=dataset, output='csv'):
+                response = self.export(dataset, output='csv', batch_size=1)
+                self.assertEqual(response['Content-Type'], 'text/csv')
+                rows = list(csv.reader(io.StringIO(self.body(response))))
+                self.assertEqual(rows[0], field_names)
+                self.assertEqual(len(rows), count + 1)
+
+    def test_unknown_dataset_and_non_staff(self):
+        response = self.export('contacts')
+        self.assertEqual((response.status_code, response.json()), (404, {'error': "Unknown export 'contacts'"}))
+        self.assertEqual(self.export('bookings', user=self.customer).status_code, 403)
+        self.assertEqual(self.export('bookings', output='xml').status_code, 400)
+
+class BookingListQueryTests(MongoTestCase):
+    """Booking lists cost the same number of queries however many bookings they show"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.customer = self.make_user('customer', phone_number='+91-8500000001')
+        self.customer_id = identity.user_id_for(self.customer)
+        self.provider_user = self.make_user('owner', phone_number='+91-8500000002')
+        self.provider = self.make_provider('Owner', user_id=identity.user_id_for(self.provider_user))
+        self.added = 0
+
+    def add_bookings(self, count):
+        """count bookings by the customer with new providers, and count for the owner from new customers"""
+        for index in range(self.added, self.added + count):
+            provider = self.make_provider(f'Provider {index}')
+            other = self.make_user(f'customer{index}', phone_number=f'+91-85100{index:05d}')
+            for user_id, provider_id in ((self.customer_id, provider._id),
+                                         (identity.user_id_for(other), self.provider._id)):
+                Booking.objects.create(user_id=user_id, provider_id=str(provider_id), status='pending',
+                                       booking_date=timezone.now().date(), booking_time=dtime(10, 0))
+        self.added += count
+
+    def get(self, path, headers):
+        """(queries, body) of a GET with every cache emptied"""
+        cache.clear()
+        provider_cache.clear()
+        response = self.client.get(path, **headers)
+        self.assertEqual(response.status_code, 200)
+        return int(SERVER_TIMING_QUERIES.search(response['Server-Timing']).group(1)), response.json()
+
+    def assert_constant_queries(self, path, headers, check):
+        for views in (settings.REPOSITORY_VIEWS, set()):
+            with self.subTest(repository_views=views), self.settings(REPOSITORY_VIEWS=views):
+                self.add_bookings(2)
+                # Warm up the per-worker revocation memo, which isn't a per-request cost
+                self.get(path, headers)
+                few, body = self.get(path, headers)
+                check(body, self.added)
+                self.add_bookings(6)
+                many, body = self.get(path, headers)
+                check(body, self.added)
+                self.assertEqual(many, few)
+
+    def test_customer_bookings(self):
+        def check(body, count):
+            self.assertEqual(body['count'], count)
+            for booking in body['bookings']:
+                self.assertEqual(booking['user_name'], 'customer')
+                self.assertTrue(booking['provider_name'].startswith('Provider '))
+                self.assertEqual(booking['provider_category'], 'Plumber')
+                self.assertTrue(booking['provider_phone'])
+
+        self.assert_constant_queries('/api/bookings/', self.auth(self.customer), check)
+
+    def test_provider_bookings(self):
+        def check(body, count):
+            self.assertEqual(len(body['all']), count)
+            self.assertEqual([booking['id'] for booking in body['pending']], [booking['id'] for booking in body['all']])
+            for booking in body['all']:
+                self.assertTrue(booking['customer_name'].startswith('customer'))
+                self.assertTrue(booking['customer_phone'].startswith('+91-85100'))
+
+        headers = self.auth(self.provider_user, user_type='provider', is_provider=True, provider_id=self.provider._id)
+        self.assert_constant_queries('/api/provider/bookings/', headers, check)
+
+class ProviderStatsTests(MongoTestCase):
+    """Dashboard and daily stats, kept by the rollups, agree with counting the bookings"""
+
+    # (days from today, status) for each booking
+    BOOKINGS = [(0, 'pending'), (0, 'accepted'), (0, 'completed'), (-1, 'rejected'), (-3, 'cancelled'),
+                (-3, 'pending'), (-12, 'completed'), (-40, 'accepted'), (2, 'pending')]
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.today = timezone.localdate()
+        self.customer = self.make_user('customer', phone_number='+91-8700000001')
+        self.provider_user = self.make_user('owner', phone_number='+91-8700000002')
+        self.provider = self.make_provider('Owner', user_id=identity.user_id_for(self.provider_user))
+        self.headers = self.auth(self.provider_user, user_type='provider', is_provider=True,
+                                 provider_id=self.provider._id)
+        # Booked and moved through their statuses over the API, as the rollups are kept in production
+        for offset, booking_status in self.BOOKINGS:
+            response = self.client.post('/api/bookings/create/', {
+                'provider_id': str(self.provider._id),
+                'booking_date': (self.today + timedelta(days=offset)).isoformat(),
+                'booking_time': '10:00',
+            }, content_type='application/json', **self.auth(self.customer))
+            booking_id = response.json()['booking']['id']
+            if booking_status == 'cancelled':
+                self.client.put(f'/api/bookings/{booking_id}/cancel/', **self.auth(self.customer))
+            elif booking_status == 'rejected':
+                self.client.put(f'/api/provider/bookings/{booking_id}/reject/', **self.headers)
+            elif booking_status in ('accepted', 'completed'):
+                self.client.put(f'/api/provider/bookings/{booking_id}/accept/', **self.headers)
+                if booking_status == 'completed':
+                    self.client.put(f'/api/provider/bookings/{booking_id}/complete/', **self.headers)
+
+    def bookings(self):
+        """(booking day, status) of every booking of the provider, straight from the collection"""
+        documents = Booking.objects.mongo_find({'provider_id': str(self.provider._id)})
+        bookings = [(document['booking_date'].date(), document['status']) for document in documents]
+        self.assertEqual(sorted(status for _, status in bookings), sorted(status for _, status in self.BOOKINGS))
+        return bookings
+
+    def test_dashboard_matches_the_bookings(self):
+        bookings = self.bookings()
+        week_start = self.today - timedelta(days=self.today.weekday())
+        expected = {
+            'total_bookings': len(bookings),
+            'today_bookings': sum(1 for day, _ in bookings if day == self.today),
+            'week_bookings': sum(1 for day, _ in bookings if day >= week_start),
+            'month_bookings': sum(1 for day, _ in bookings
+                                  if (day.year, day.month) == (self.today.year, self.today.month)),
+            'pending_requests': sum(1 for _, booking_status in bookings if booking_status == 'pending'),
+        }
+        response = self.client.get('/api/provider/dashboard/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        statistics = response.json()['statistics']
+        self.assertEqual({key: statistics[key] for key in expected}, expected)
+
+    def test_daily_stats_match_the_bookings(self):
+        bookings = self.bookings()
+        response = self.client.get('/api/provider/stats/daily/', {'days': 60}, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        series = response.json()['series']
+        self.assertEqual(len(series), 60)
+        self.assertEqual(series[-1]['date'], self.today.isoformat())
+        for point in series:
+            day = date.fromisoformat(point['date'])
+            expected = {'date': point['date'], 'total': sum(1 for booked, _ in bookings if booked == day)}
+            expected.update({
+                booking_status: sum(1 for booked, status in bookings if booked == day and status == booking_status)
+                for booking_status in rollups.STATUSES
+            })
+            self.assertEqual(point, expected)
+        # The booking two days ahead is outside the window
+        self.assertEqual(sum(point['total'] for point in series), len(bookings) - 1)
+
+class CategoryCatalogTests(MongoTestCase):
+    """Categories are served from memory and reloaded after a category write"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_category('Plumber')
+        self.make_category('Barber')
+
+    def home(self):
+        """(queries, category names) of the homepage"""
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        queries = int(SERVER_TIMING_QUERIES.search(response['Server-Timing']).group(1))
+        return queries, [category['name'] for category in response.json()['categories']]
+
+    def test_second_call_is_served_from_memory(self):
+        self.assertEqual(self.home(), (1, ['Plumber', 'Barber']))
+        with mock.patch.object(catalog, '_load', wraps=catalog._load) as load:
+            self.assertEqual(self.home(), (0, ['Plumber', 'Barber']))
+            self.assertEqual(catalog.get('plumber').name, 'Plumber')
+        load.assert_not_called()
+
+    def test_reloads_after_save_and_delete(self):
+        self.home()
+        electrician = self.make_category('Electrician')
+        self.assertEqual(self.home()[1], ['Plumber', 'Barber', 'Electrician'])
+
+        electrician.description = 'Wiring'
+        electrician.save()
+        self.assertEqual(catalog.get('electrician').description, 'Wiring')
+
+        electrician.delete()
+        self.assertEqual(self.home()[1], ['Plumber', 'Barber'])
+        with self.assertRaises(ServiceCategory.DoesNotExist):
+            catalog.get('electrician')
+
+class DataMigrationTests(MongoTestCase):
+    """The RunPython steps fill in what their schema changes add"""
+
+    def migrate(self, migration, function):
+        module = importlib.import_module(f'services.migrations.{migration}')
+        connection.ensure_connection()
+        getattr(module, function)(django_apps, mock.Mock(connection=connection))
+
+    def test_0003_backfills_lookup_keys(self):
+        category = self.make_category('Home  Cleaning')
+        provider = self.make_provider('Old Row', category='Home  Cleaning', city=' New Delhi')
+        ServiceCategory.objects.mongo_update_one({'id': category.id}, {'$unset': {'category_key': ''}})
+        ServiceProvider.objects.mongo_update_one({'_id': provider._id}, {'$unset': {'category_key': '', 'city_key': ''}})
+
+        self.migrate('0003_lookup_keys', 'backfill_lookup_keys')
+
+        self.assertEqual(ServiceCategory.objects.mongo_find_one({'id': category.id})['category_key'], 'home cleaning')
+        document = ServiceProvider.objects.mongo_find_one({'_id': provider._id})
+        self.assertEqual((document['category_key'], document['city_key']), ('home cleaning', 'new delhi'))
+
+    def test_0004_backfills_rating_counters(self):
+        self.make_category('Plumber')
+        provider_id = str(self.make_provider('Old Row', rating=4.0, original_rating=4.0)._id)
+        for user_id, rating in ((1, 5), (2, 4), (3, 4)):
+            Review.objects.create(user_id=user_id, provider_id=provider_id, rating=rating)
+        ServiceProvider.objects.mongo_update_one({'_id': ObjectId(provider_id)},
+                                                 {'$unset': {'rating_sum': '', 'rating_count': '', 'rating_histogram': ''}})
+
+        self.migrate('0004_rating_aggregates', 'backfill_rating_counters')
+
+        document = ServiceProvider.objects.mongo_find_one({'_id': ObjectId(provider_id)})
+        self.assertEqual((document['rating_sum'], document['rating_count'], document['rating_histogram']),
+                         (13, 3, {'5': 1, '4': 2}))
+        # (40 + 13) / 13
+        self.assertEqual((document['rating'], document['total_reviews']), (4.1, 13))
+
+    def test_0004_keeps_the_latest_review_per_user(self):
+        module = importlib.import_module('services.migrations.0004_rating_aggregates')
+        connection.ensure_connection()
+        reviews = connection.connection['review_dedupe']
+        self.addCleanup(reviews.drop)
+        now = timezone.now().replace(tzinfo=None)
+        reviews.insert_many([
+            {'id': 1, 'user_id': 1, 'provider_id': 'a', 'rating': 2, 'created_at': now - timedelta(days=2)},
+            {'id': 2, 'user_id': 1, 'provider_id': 'a', 'rating': 5, 'created_at': now},
+            {'id': 3, 'user_id': 1, 'provider_id': 'a', 'rating': 3, 'created_at': now - timedelta(days=1)},
+            {'id': 4, 'user_id': 1, 'provider_id': 'b', 'rating': 1, 'created_at': now},
+            {'id': 5, 'user_id': 2, 'provider_id': 'a', 'rating': 4, 'created_at': now},
+        ])
+        module.dedupe_reviews(reviews)
+        self.assertEqual(sorted(doc['id'] for doc in reviews.find()), [2, 4, 5])
@@ -0,0 +1,199 @@
+"""
+Memoized djongo SQL-to-Mongo translation
+
+djongo turns every ORM query into SQL, parses it with sqlparse and converts
+the parse tree into a find() or aggregate() call, all over again on every
+execution. For SELECTs this module does that work once per SQL template:
+the template is translated with placeholder parameters and the resulting
+find/aggregate arguments are kept in an LRU. Later executions copy them
+with the real parameters substituted.
+
+A template is only cached when each parameter comes through the translation
+unchanged as a plain value; otherwise (LIKE patterns, JSON lookups with dict
+parameters, ...) the outcome is remembered and djongo translates as usual.
+
+install() is called from ServicesConfig.ready() when
+settings.DJONGO_TRANSLATION_CACHE_SIZE is above zero.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from djongo.sql2mongo import query as sql2mongo
+from sqlparse import parse as sqlparse
+
+logger = logging.getLogger(__name__)
+
+_UNCACHEABLE = object()
+
+
+class _Param:
+    """Stands in for the parameter at `index` while a template is translated"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f'%({self.index})s'
+
+
+class _Compiled:
+    def __init__(self, template, operation, spec):
+        self.left_table = template.left_table
+        self.distinct = template.distinct
+        self.selected_columns = template.selected_columns
+        self.operation = operation
+        self.spec = spec
+
+
+class _CachedSelectQuery(sql2mongo.SelectQuery):
+    """SelectQuery for a cached template; only _get_cursor differs"""
+
+    def __init__(self, db, connection_properties, compiled, params):
+        self.db = db
+        self.connection_properties = connection_properties
+        self.params = params
+        self.left_table = compiled.left_table
+        self.distinct = compiled.distinct
+        self.selected_columns = compiled.selected_columns
+        self._operation = compiled.operation
+        self._spec = _substitute(compiled.spec, params)
+        self._cursor = None
+
+    def _get_cursor(self):
+        collection = self.db[self.left_table]
+        if self._operation == 'aggregate':
+            return collection.aggregate(self._spec)
+        return collection.find(**self._spec)
+
+
+class TranslationCache:
+    """Bounded LRU of compiled SELECT templates with hit/miss counters"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+    def get(self, key):
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if compiled is _UNCACHEABLE:
+                self.uncacheable += 1
+            else:
+                self.hits += 1
+            return compiled
+
+    def put(self, key, compiled):
+        with self._lock:
+            self._entries[key] = compiled
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.uncacheable = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncacheable': self.uncacheable,
+            }
+
+
+cache = None
+_original_parse = sql2mongo.Query.parse
+
+
+def _substitute(spec, params):
+    if isinstance(spec, _Param):
+        return params[spec.index]
+    if isinstance(spec, dict):
+        return {key: _substitute(value, params) for key, value in spec.items()}
+    if isinstance(spec, (list, tuple)):
+        return type(spec)(_substitute(value, params) for value in spec)
+    return spec
+
+
+def _placeholders_in(spec, found):
+    if isinstance(spec, _Param):
+        found.add(spec.index)
+    elif isinstance(spec, dict):
+        for value in spec.values():
+            _placeholders_in(value, found)
+    elif isinstance(spec, (list, tuple)):
+        for value in spec:
+            _placeholders_in(value, found)
+    return found
+
+
+def _is_plain(params):
+    # dict parameters change the shape of the translation (JSON lookups)
+    return all(not isinstance(param, (dict, list, tuple, set)) for param in params)
+
+
+def _compile(query):
+    """Translate query's SQL with placeholder parameters; None if that isn't safe"""
+    placeholders = tuple(_Param(index) for index in range(len(query._params or ())))
+    try:
+        template = sql2mongo.SelectQuery(
+            query.db, query.connection_properties, sqlparse(query._sql)[0], placeholders
+        )
+        # Same choice SelectQuery._get_cursor makes
+        if template._needs_aggregation():
+            operation, spec = 'aggregate', template._make_pipeline()
+        else:
+            operation, spec = 'find', {}
+            for converter in (template.where, template.selected_columns, template.limit,
+                              template.order, template.offset):
+                if converter:
+                    spec.update(converter.to_mongo())
+    except Exception:
+        return None
+
+    if _placeholders_in(spec, set()) != set(range(len(placeholders))):
+        # A parameter was transformed or dropped (e.g. LIKE -> $regex)
+        return None
+    return _Compiled(template, operation, spec)
+
+
+def _parse(query):
+    """Replacement for djongo's Query.parse"""
+    params = query._params or ()
+    if not query._sql.lstrip()[:6].upper() == 'SELECT' or not _is_plain(params):
+        return _original_parse(query)
+
+    key = (query.db.name, query._sql)
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = _compile(query) or _UNCACHEABLE
+        cache.put(key, compiled)
+    if compiled is _UNCACHEABLE:
+        return _original_parse(query)
+    return _CachedSelectQuery(query.db, query.connection_properties, compiled, params)
+
+
+def install(max_entries):
+    global cache
+    if cache is not None:
+        return
+    cache = TranslationCache(max_entries)
+    sql2mongo.Query.parse = _parse
+    logger.info(f"✅ djongo translation cache installed ({max_entries} templates)")
+
+
+def stats():
+    return cache.stats() if cache is not None else None
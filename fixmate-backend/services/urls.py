@@ -9,6 +9,7 @@ urlpatterns = [
     # Auth routes - /api/...
     path('api/register/', views.register, name='register'),
     path('api/login/', views.login, name='login'),
+    path('api/logout/', views.logout, name='logout'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/profile/', views.get_user_profile, name='user_profile'),
     
@@ -30,6 +31,7 @@ urlpatterns = [
     # Provider Dashboard & Profile - /api/provider/...
     path('api/provider/dashboard/', views.provider_dashboard, name='provider_dashboard'),
     path('api/provider/profile/', views.provider_profile, name='provider_profile'),
+    path('api/provider/stats/daily/', views.provider_daily_stats, name='provider_daily_stats'),
     
     # Provider Bookings Management - /api/provider/bookings/...
     path('api/provider/bookings/', views.provider_bookings, name='provider_bookings'),
@@ -40,8 +42,9 @@ urlpatterns = [
     # Provider Reviews - /api/provider/reviews/
     path('api/provider/reviews/', views.provider_reviews, name='provider_reviews'),
     
-    # Test data - /populate-data/
-    path('populate-data/', views.populate_fake_data, name='populate_data'),
+    # Exports (staff only) - /api/admin/export/bookings/, /api/admin/export/reviews/
+    path('api/admin/export/<str:dataset>/', views.export_data, name='export_data'),
+    path('api/admin/cache-stats/', views.cache_stats, name='cache_stats'),
 
     path('api/debug/user-info/', views.debug_user_info, name='debug_user_info'),
 ]
\ No newline at end of file
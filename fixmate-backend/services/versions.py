@@ -0,0 +1,72 @@
+"""
+Version stamps kept in Django's cache
+
+Cache entries embed the current version of whatever they were built from in
+their key. Bumping the version makes every older entry unreachable, so
+invalidation never has to know which keys exist.
+
+The stamps are only shared between workers when the cache backend is; with
+a per-process backend (shared() is False) a bump is only seen by the
+process that made it.
+"""
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Backends that keep their data in each process's own memory
+PER_PROCESS_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def shared():
+    """Whether every worker process reads the same version stamps"""
+    return settings.CACHES['default']['BACKEND'] not in PER_PROCESS_BACKENDS
+
+
+def _version_key(namespace, ident):
+    # Idents such as category keys may contain spaces, which memcached rejects
+    return f"version:{namespace}:{quote(str(ident))}"
+
+
+def _fresh_version():
+    # Seeded from the clock so a version that was evicted from the cache
+    # never comes back with a value an old entry was stored under
+    return int(time.time() * 1000)
+
+
+def get_version(namespace, ident=''):
+    """Current version for (namespace, ident), created on first use"""
+    key = _version_key(namespace, ident)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, ident=''):
+    """Invalidate everything cached under the current version"""
+    key = _version_key(namespace, ident)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Not in the cache (never used or evicted)
+        version = _fresh_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_versions(namespace, idents):
+    """{ident: current version} for many idents in one cache round trip"""
+    keys = {_version_key(namespace, ident): ident for ident in idents}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        cache.add(key, _fresh_version(), timeout=None)
+    if missing:
+        found.update(cache.get_many(missing))
+    return {ident: found.get(key) for key, ident in keys.items()}
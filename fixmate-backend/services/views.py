@@ -1,16 +1,18 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.http import JsonResponse, Http404, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.contrib.auth import authenticate
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework_simplejwt.exceptions import TokenError
 from bson import ObjectId
 from bson.errors import InvalidId
-from .models import ServiceCategory, ServiceProvider, Review, UserProfile, Contact, Booking
-from .serializers import RegisterSerializer, UserSerializer, UserProfileSerializer, BookingSerializer, ProviderRegisterSerializer, ServiceProviderSerializer, ProviderBookingSerializer
+from .models import ServiceCategory, ServiceProvider, Review, UserProfile, Contact, Booking, normalize_key
+from . import authentication, booking_state, catalog, conditional, exports, identity, listing, provider_cache, repositories, ratings, rollups, singleflight, social_proof, stats, translation_cache
+from .serializers import RegisterSerializer, UserSerializer, UserProfileSerializer, BookingSerializer, ProviderRegisterSerializer, ServiceProviderSerializer, ProviderBookingSerializer, group_provider_bookings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,8 +27,6 @@ def register(request):
     if serializer.is_valid():
         user = serializer.save()
         
-        refresh = RefreshToken.for_user(user)
-        
         # Get the user_id that was actually stored in UserProfile
         try:
             # Query by username to find the profile
@@ -40,6 +40,10 @@ def register(request):
             user_type = 'customer'
             is_provider = False
         
+        refresh = authentication.IdentityRefreshToken.for_user(
+            user, user_id=user_id, user_type=user_type, is_provider=is_provider
+        )
+        
         return Response({
             'user': {
                 'id': str(user_id),
@@ -73,20 +77,20 @@ def login(request):
     user = authenticate(username=username, password=password)
     
     if user:
-        refresh = RefreshToken.for_user(user)
-        
         # Convert user.pk to safe integer ID
         user_id = get_safe_user_id(user)
         
         # Check if user is a service provider by looking in ServiceProvider table
         try:
             # First try to find ServiceProvider entry
-            provider = ServiceProvider.objects.get(user_id=user_id)
+            provider = provider_cache.provider_for_user_id(user_id)
+            provider_id = provider._id
             is_provider = True
             user_type = 'provider'
             logger.info(f"✅ Found ServiceProvider for user_id {user_id}")
         except ServiceProvider.DoesNotExist:
             # Not a provider, check UserProfile
+            provider_id = None
             is_provider = False
             user_type = 'customer'
             logger.info(f"ℹ️ No ServiceProvider found for user_id {user_id}, treating as customer")
@@ -101,6 +105,11 @@ def login(request):
         except UserProfile.DoesNotExist:
             logger.warning(f"⚠️ No UserProfile found for user_id {user_id}")
         
+        # Identity goes into the token so later requests don't look it up again
+        refresh = authentication.IdentityRefreshToken.for_user(
+            user, user_id=user_id, user_type=user_type, is_provider=is_provider, provider_id=provider_id
+        )
+        
         return Response({
             'user': {
                 'id': str(user_id),
@@ -120,51 +129,29 @@ def login(request):
     
     return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-
-def get_safe_user_id(user):
-    """Convert user.pk to a safe integer ID for MongoDB compatibility"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    user_pk = user.pk
-    logger.info(f"Converting user.pk: {user_pk} (type: {type(user_pk)})")
-    
-    # If it's already an integer, return it
-    if isinstance(user_pk, int):
-        logger.info(f"Already int: {user_pk}")
-        return user_pk
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    """Revoke the current tokens, or every token of the user with all_devices=true"""
+    if request.data.get('all_devices') in (True, 'true', '1'):
+        authentication.revoke_user_tokens(request.user.username)
+        return Response({'message': 'Logged out on all devices'}, status=status.HTTP_200_OK)
     
-    # If it's an ObjectId, convert it
-    from bson import ObjectId
-    if isinstance(user_pk, ObjectId):
-        # Convert ObjectId to consistent integer
-        user_id = int(str(user_pk)[-9:], 16)
-        logger.info(f"Converted ObjectId {user_pk} to int {user_id}")
-        return user_id
+    authentication.revoke_token(request.auth)
     
-    # If it's a string
-    if isinstance(user_pk, str):
-        # Try to parse as ObjectId first
+    refresh = request.data.get('refresh')
+    if refresh:
         try:
-            oid = ObjectId(user_pk)
-            user_id = int(str(oid)[-9:], 16)
-            logger.info(f"Converted string ObjectId {user_pk} to int {user_id}")
-            return user_id
-        except:
-            pass
-        
-        # Try direct int conversion
-        try:
-            user_id = int(user_pk)
-            logger.info(f"Converted string to int: {user_id}")
-            return user_id
-        except:
-            pass
+            authentication.revoke_token(authentication.IdentityRefreshToken(refresh))
+        except TokenError:
+            return Response({'error': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Last resort: hash it
-    user_id = abs(hash(str(user_pk))) % (10 ** 10)  # Increased to 10 digits
-    logger.warning(f"Used hash for {user_pk}: {user_id}")
-    return user_id
+    return Response({'message': 'Logged out'}, status=status.HTTP_200_OK)
+
+
+def get_safe_user_id(user):
+    """Canonical integer user_id for a user (see services.identity)"""
+    return identity.user_id_for(user)
 
 
 @api_view(['GET'])
@@ -172,8 +159,11 @@ def get_safe_user_id(user):
 def get_user_profile(request):
     """Get current user profile"""
     try:
-        user_id = get_safe_user_id(request.user)
-        profile = UserProfile.objects.get(user_id=user_id)
+        user_id = identity.request_user_id(request)
+        if repositories.enabled('get_user_profile'):
+            profile = repositories.get_profile(user_id)
+        else:
+            profile = UserProfile.objects.get(user_id=user_id)
         serializer = UserProfileSerializer(profile)
         return Response(serializer.data)
     except UserProfile.DoesNotExist:
@@ -182,9 +172,10 @@ def get_user_profile(request):
 # Service Views
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional.revalidated(conditional.home_etag)
 def home(request):
     """Homepage showing service categories"""
-    categories = ServiceCategory.objects.all()
+    categories = catalog.categories()
     return JsonResponse({
         'message': 'FixMate API - Service Categories',
         'categories': [
@@ -200,152 +191,73 @@ def home(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional.revalidated(conditional.service_providers_etag)
 def service_providers(request, category_name):
     """Show providers for a specific service category with social proof"""
     try:
-        category = ServiceCategory.objects.get(name__iexact=category_name)
+        category = catalog.get(category_name)
         city_filter = request.GET.get('city', None)
-        providers = ServiceProvider.objects.filter(category_name=category_name)
-        if city_filter:
-            providers = providers.filter(city__iexact=city_filter)
-
-        providers_data = []
-        for provider in providers:
-            trusted_friends = get_trusted_friends(provider, request)
-            
-            providers_data.append({
-                'id': str(provider._id),
-                'name': provider.name,
-                'phone': provider.phone_number,
-                'email': provider.email,
-                'rating': provider.rating,
-                'total_reviews': provider.total_reviews,
-                'experience_years': provider.experience_years,
-                'address': provider.address,
-                'city': provider.city,
-                'service_area': provider.service_area,
-                'trusted_by': trusted_friends
-            })
         
-        return Response({
+        try:
+            sort, limit, cursor = listing.parse_listing_params(request.GET)
+        except listing.InvalidListingQuery as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Keyset-paginated, projected page, shared by every visitor
+        providers_data, next_cursor = listing.shared_page(
+            category.category_key, city_key=normalize_key(city_filter), sort=sort, limit=limit, cursor=cursor
+        )
+        
+        # Per-user overlay: social proof for the whole page in one batched pass
+        if request.user.is_authenticated:
+            user_id = identity.request_user_id(request)
+            trusted_by = social_proof.trusted_by_for_providers(user_id, [p['id'] for p in providers_data])
+            providers_data = [
+                dict(provider, trusted_by=trusted_by.get(provider['id']) or provider['trusted_by'])
+                for provider in providers_data
+            ]
+        
+        response = Response({
             'category': category.name,
             'city': city_filter,
+            'sort': sort,
+            'limit': limit,
             'providers_count': len(providers_data),
-            'providers': providers_data
+            'providers': providers_data,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
         })
+        # Anonymous pages are the same for everyone; personalized ones stay private
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        elif singleflight.served_stale():
+            # The page from before the latest write, served while it's rebuilt
+            patch_cache_control(response, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.LISTING_MAX_AGE)
+        patch_vary_headers(response, ['Authorization'])
+        return response
         
     except ServiceCategory.DoesNotExist:
         return Response({'error': f'Service category "{category_name}" not found'}, status=404)
 
-def generate_contact_reviews_for_provider(provider_id, user_id):
-    """Generate consistent contact reviews for a provider-user combination"""
-    import random
-    
-    seed_value = hash(f"{user_id}-{str(provider_id)}")
-    random.seed(seed_value)
-    
-    fake_contacts = ['Harshita', 'Lakshit', 'Rohan', 'Priya']
-    
-    review_templates = [
-        {'rating': 5, 'comment': 'Excellent service! Very professional and punctual.', 'is_trusted': True},
-        {'rating': 4, 'comment': 'Good work, satisfied with the service.', 'is_trusted': True},
-        {'rating': 3, 'comment': 'Average service, nothing special.', 'is_trusted': False},
-        {'rating': 2, 'comment': 'Not good. Had to call them multiple times.', 'is_trusted': False},
-        {'rating': 1, 'comment': 'Very disappointed. Poor quality work.', 'is_trusted': False},
-        {'rating': 4, 'comment': 'Reliable and affordable. Would recommend.', 'is_trusted': True},
-        {'rating': 5, 'comment': 'Best in the area! Very skilled and honest.', 'is_trusted': True},
-        {'rating': 2, 'comment': 'Overpriced and slow service.', 'is_trusted': False},
-    ]
-    
-    num_contact_reviews = random.randint(1, 3)
-    contact_reviews = []
-    
-    if num_contact_reviews > 0:
-        selected_contacts = random.sample(fake_contacts, num_contact_reviews)
-        for contact_name in selected_contacts:
-            review_template = random.choice(review_templates)
-            contact_reviews.append({
-                'user': contact_name,
-                'rating': review_template['rating'],
-                'comment': review_template['comment'],
-                'is_trusted': review_template['is_trusted'],
-            })
-    
-    random.seed()
-    return contact_reviews
-
 
-def get_trusted_friends(provider, request):
-    """Get list of friends who trusted this provider - consistent with detail page"""
-    
-    # Auth check first
-    if not request.user.is_authenticated:
-        return {
-            'count': 0,
-            'message': 'No friends have used this service yet',
-            'names': []
-        }
-    
-    # FIXED: Use get_safe_user_id instead of request.user.id
-    user_id = get_safe_user_id(request.user)
-    
-    # Generate the same contact reviews as provider_detail will
-    contact_reviews = generate_contact_reviews_for_provider(str(provider._id), user_id)
-    
-    # Filter only trusted contacts (those who recommended)
-    trusted_contacts = [review['user'] for review in contact_reviews if review['is_trusted']]
-    trusted_count = len(trusted_contacts)
-    
-    if trusted_count == 0:
-        return {
-            'count': 0,
-            'message': 'No friends have used this service yet',
-            'names': []
-        }
-    elif trusted_count == 1:
-        return {
-            'count': 1,
-            'message': f'Trusted by {trusted_contacts[0]}',
-            'names': [trusted_contacts[0]]
-        }
-    elif trusted_count == 2:
-        return {
-            'count': 2,
-            'message': f'Trusted by {trusted_contacts[0]} and {trusted_contacts[1]}',
-            'names': trusted_contacts
-        }
+def provider_review_list(provider_id):
+    """A provider's reviews, newest first, as the detail page shows them"""
+    # Reviewers' usernames are resolved in one batch, not one query per review
+    if repositories.enabled('provider_detail'):
+        db_reviews = repositories.reviews_for_provider(provider_id)
+        users = repositories.users_by_id({review.user_id for review in db_reviews})
     else:
-        return {
-            'count': trusted_count,
-            'message': f'Trusted by {trusted_contacts[0]} and {trusted_count-1} others',
-            'names': trusted_contacts
-        }
-
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def provider_detail(request, provider_id):
-    """Get detailed info about a specific provider with reviews"""
-    import random
-    
-    try:
-        object_id = ObjectId(provider_id)
-        provider = get_object_or_404(ServiceProvider, _id=object_id)
-    except (InvalidId, ValueError):
-        return Response({'error': 'Invalid provider ID'}, status=400)
-    
-    db_reviews = Review.objects.filter(provider_id=provider_id).order_by('-created_at')
+        db_reviews = list(Review.objects.filter(provider_id=provider_id).order_by('-created_at'))
+        users = identity.users_by_user_id({review.user_id for review in db_reviews})
     
     actual_reviews = []
     for review in db_reviews:
-        # FIXED: Get username from user_id instead of review.user.username
-        try:
-            user = User.objects.get(id=review.user_id)
-            username = user.username
-        except User.DoesNotExist:
-            username = "Unknown"
+        user = users.get(review.user_id)
         
         actual_reviews.append({
-            'user': username,
+            'user': user.username if user else "Unknown",
             'is_contact': False,
             'rating': review.rating,
             'comment': review.comment,
@@ -353,14 +265,32 @@ def provider_detail(request, provider_id):
             'service_date': str(review.service_date) if review.service_date else None,
             'created_at': review.created_at.strftime('%B %d, %Y')
         })
+    return actual_reviews
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@conditional.revalidated(conditional.provider_detail_etag)
+def provider_detail(request, provider_id):
+    """Get detailed info about a specific provider with reviews"""
+    try:
+        provider = provider_cache.provider_by_id(provider_id)
+    except (InvalidId, ValueError):
+        return Response({'error': 'Invalid provider ID'}, status=400)
+    except ServiceProvider.DoesNotExist:
+        raise Http404
+    
+    # Kept with the cached provider; any review write bumps its version
+    actual_reviews = provider_cache.cached_for_provider(
+        provider._id, 'reviews', lambda: provider_review_list(provider_id)
+    )
     
-    # Generate contact reviews ONLY if authenticated
+    # Contact reviews ONLY if authenticated
     contact_reviews = []
     if request.user.is_authenticated:
-        # FIXED: Use get_safe_user_id instead of request.user.id
-        user_id = get_safe_user_id(request.user)
-        # Use the helper function for consistency with list page
-        contact_reviews_data = generate_contact_reviews_for_provider(str(provider._id), user_id)
+        user_id = identity.request_user_id(request)
+        # Same engine as the list page, so trusted_by matches between the two
+        contact_reviews_data = social_proof.contact_reviews_for_providers(user_id, [provider._id])[str(provider._id)]
         
         # Convert to frontend format
         for review_data in contact_reviews_data:
@@ -375,73 +305,28 @@ def provider_detail(request, provider_id):
             })
     
     # Generate other random reviews (always show these, even when logged out)
-    random.seed(hash(f"other-{str(provider._id)}"))
+    rng = social_proof.seeded_rng(f"other-{str(provider._id)}")
     
     random_names = ['Amit K.', 'Sneha P.', 'Rajesh M.', 'Pooja S.', 'Vikram T.', 'Anita R.']
     other_reviews = []
-    num_other_reviews = random.randint(2, 5)
-    
-    review_templates = [
-        {'rating': 5, 'comment': 'Excellent service! Very professional and punctual.', 'is_trusted': True},
-        {'rating': 4, 'comment': 'Good work, satisfied with the service.', 'is_trusted': True},
-        {'rating': 3, 'comment': 'Average service, nothing special.', 'is_trusted': False},
-        {'rating': 2, 'comment': 'Not good. Had to call them multiple times.', 'is_trusted': False},
-        {'rating': 1, 'comment': 'Very disappointed. Poor quality work.', 'is_trusted': False},
-        {'rating': 4, 'comment': 'Reliable and affordable. Would recommend.', 'is_trusted': True},
-        {'rating': 5, 'comment': 'Best in the area! Very skilled and honest.', 'is_trusted': True},
-        {'rating': 2, 'comment': 'Overpriced and slow service.', 'is_trusted': False},
-    ]
+    num_other_reviews = rng.randint(2, 5)
     
     for _ in range(num_other_reviews):
-        review_template = random.choice(review_templates)
+        review_template = rng.choice(social_proof.REVIEW_TEMPLATES)
         other_reviews.append({
-            'user': random.choice(random_names),
+            'user': rng.choice(random_names),
             'is_contact': False,
             'rating': review_template['rating'],
             'comment': review_template['comment'],
             'is_trusted': review_template['is_trusted'],
             'service_date': None,
-            'created_at': f'{random.randint(1, 30)} days ago'
+            'created_at': f'{rng.randint(1, 30)} days ago'
         })
     
-    random.seed()
-    
-    # Calculate trusted_by ONLY if authenticated
-    if request.user.is_authenticated:
-        trusted_contacts = [review for review in contact_reviews if review['is_trusted']]
-        trusted_count = len(trusted_contacts)
-        
-        if trusted_count == 0:
-            trusted_friends = {
-                'count': 0,
-                'message': 'No friends have used this service yet',
-                'names': []
-            }
-        elif trusted_count == 1:
-            trusted_friends = {
-                'count': 1,
-                'message': f'Trusted by {trusted_contacts[0]["user"]}',
-                'names': [trusted_contacts[0]["user"]]
-            }
-        elif trusted_count == 2:
-            trusted_friends = {
-                'count': 2,
-                'message': f'Trusted by {trusted_contacts[0]["user"]} and {trusted_contacts[1]["user"]}',
-                'names': [c["user"] for c in trusted_contacts]
-            }
-        else:
-            trusted_friends = {
-                'count': trusted_count,
-                'message': f'Trusted by {trusted_contacts[0]["user"]} and {trusted_count-1} others',
-                'names': [c["user"] for c in trusted_contacts]
-            }
-    else:
-        # Not authenticated - no trusted friends shown
-        trusted_friends = {
-            'count': 0,
-            'message': 'No friends have used this service yet',
-            'names': []
-        }
+    # Not authenticated - no contact reviews, so no trusted friends shown
+    trusted_friends = social_proof.summarize_trusted(
+        [review['user'] for review in contact_reviews if review['is_trusted']]
+    )
     
     # Combine all reviews
     all_reviews_combined = actual_reviews + contact_reviews + other_reviews
@@ -478,7 +363,7 @@ def create_booking(request):
     serializer = BookingSerializer(data=request.data)
     
     if serializer.is_valid():
-        user_id = get_safe_user_id(request.user)
+        user_id = identity.request_user_id(request)
         
         # Create booking
         booking = Booking(
@@ -489,22 +374,33 @@ def create_booking(request):
             notes=serializer.validated_data.get('notes', ''),
             status='pending'
         )
-        booking.save()
+        context = {}
+        if repositories.enabled('create_booking'):
+            repositories.insert_booking(booking)
+            context['load_relations'] = repositories.booking_relations
+        else:
+            booking.save()
+        rollups.record_booking_created(booking)
         
         return Response({
             'message': 'Booking created successfully!',
-            'booking': BookingSerializer(booking).data
+            'booking': BookingSerializer(booking, context=context).data
         }, status=status.HTTP_201_CREATED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional.revalidated(conditional.user_bookings_etag)
 def get_user_bookings(request):
     """Get all bookings for current user"""
-    user_id = get_safe_user_id(request.user)
-    bookings_list = list(Booking.objects.filter(user_id=user_id))
-    serializer = BookingSerializer(bookings_list, many=True)
+    user_id = identity.request_user_id(request)
+    if repositories.enabled('get_user_bookings'):
+        bookings_list = repositories.bookings_for_user(user_id)
+        serializer = BookingSerializer(bookings_list, many=True, context={'load_relations': repositories.booking_relations})
+    else:
+        bookings_list = list(Booking.objects.filter(user_id=user_id))
+        serializer = BookingSerializer(bookings_list, many=True)
     
     return Response({
         'count': len(bookings_list),
@@ -516,14 +412,8 @@ def get_user_bookings(request):
 def cancel_booking(request, booking_id):
     """Cancel a booking"""
     try:
-        from bson import ObjectId
-        from bson.errors import InvalidId
-        
-        user_id = get_safe_user_id(request.user)
-        object_id = ObjectId(booking_id)
-        booking = Booking.objects.get(_id=object_id, user_id=user_id)
-        booking.status = 'cancelled'
-        booking.save()
+        user_id = identity.request_user_id(request)
+        booking = booking_state.cancel(booking_id, user_id)
         
         serializer = BookingSerializer(booking)
         return Response({
@@ -532,8 +422,10 @@ def cancel_booking(request, booking_id):
         })
     except (InvalidId, ValueError):
         return Response({'error': 'Invalid booking ID'}, status=status.HTTP_400_BAD_REQUEST)
-    except Booking.DoesNotExist:
+    except booking_state.BookingNotFound:
         return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+    except booking_state.InvalidTransition:
+        return Response({'error': 'Booking cannot be cancelled'}, status=status.HTTP_400_BAD_REQUEST)
 
     
     
@@ -542,21 +434,13 @@ def cancel_booking(request, booking_id):
 def submit_review(request, provider_id):
     """Submit a review for a service provider"""
     try:
-        from bson import ObjectId
-        from bson.errors import InvalidId
-        
-        object_id = ObjectId(provider_id)
-        provider = ServiceProvider.objects.get(_id=object_id)
+        provider = provider_cache.provider_by_id(provider_id)
     except (InvalidId, ValueError):
         return Response({'error': 'Invalid provider ID'}, status=status.HTTP_400_BAD_REQUEST)
     except ServiceProvider.DoesNotExist:
         return Response({'error': 'Provider not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    user_id = get_safe_user_id(request.user)
-    
-    # Check if user already reviewed
-    existing_reviews = list(Review.objects.filter(user_id=user_id, provider_id=str(provider_id)))
-    existing_review = existing_reviews[0] if existing_reviews else None
+    user_id = identity.request_user_id(request)
     
     rating = request.data.get('rating')
     comment = request.data.get('comment', '')
@@ -565,49 +449,20 @@ def submit_review(request, provider_id):
     if not rating or int(rating) < 1 or int(rating) > 5:
         return Response({'error': 'Rating must be between 1 and 5'}, status=status.HTTP_400_BAD_REQUEST)
     
-    if existing_review:
-        existing_review.rating = int(rating)
-        existing_review.comment = comment
-        existing_review.is_trusted = is_trusted
-        existing_review.save()
-        message = 'Review updated successfully!'
-    else:
-        review = Review(
-            user_id=user_id,
-            provider_id=str(provider_id),
-            rating=int(rating),
-            comment=comment,
-            is_trusted=is_trusted
-        )
-        review.save()
-        message = 'Review submitted successfully!'
-    
-    # Calculate weighted average
-    real_reviews_list = list(Review.objects.filter(provider_id=str(provider_id)))
-    fake_count = 10
-    fake_rating = provider.original_rating
-    
-    if len(real_reviews_list) > 0:
-        avg_real = sum(r.rating for r in real_reviews_list) / len(real_reviews_list)
-        real_count = len(real_reviews_list)
-        
-        provider.rating = round(
-            (fake_rating * fake_count + avg_real * real_count) / (fake_count + real_count), 
-            1
-        )
-        provider.total_reviews = fake_count + real_count
-    else:
-        provider.total_reviews = fake_count
-    
-    provider.save()
+    # One review per user: a resubmit replaces it, and the provider's running
+    # aggregates take the difference
+    created, updated = ratings.save_review(user_id, provider_id, int(rating), comment, is_trusted)
+    if updated is None:
+        return Response({'error': 'Provider not found'}, status=status.HTTP_404_NOT_FOUND)
+    message = 'Review submitted successfully!' if created else 'Review updated successfully!'
     
     return Response({
         'message': message,
         'provider': {
             'id': str(provider._id),
             'name': provider.name,
-            'rating': provider.rating,
-            'total_reviews': provider.total_reviews
+            'rating': updated['rating'],
+            'total_reviews': updated['total_reviews']
         }
     }, status=status.HTTP_200_OK)
 
@@ -620,14 +475,13 @@ def provider_register(request):
     if serializer.is_valid():
         user = serializer.save()
         
-        refresh = RefreshToken.for_user(user)
+        # The serializer keeps the provider it created
+        provider = serializer.provider
+        user_id = provider.user_id
         
-        # Get user_id from the created profile
-        try:
-            profile = UserProfile.objects.get(phone_number=request.data.get('phone_number'))
-            user_id = profile.user_id
-        except UserProfile.DoesNotExist:
-            user_id = get_safe_user_id(user)
+        refresh = authentication.IdentityRefreshToken.for_user(
+            user, user_id=user_id, user_type='provider', is_provider=True, provider_id=provider._id
+        )
         
         return Response({
             'user': {
@@ -651,44 +505,20 @@ def provider_register(request):
 def provider_dashboard(request):
     """Get provider dashboard statistics"""
     try:
-        from datetime import datetime, timedelta
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        user_id = get_safe_user_id(request.user)
+        user_id = identity.request_user_id(request)
         logger.info(f"🔍 Looking for provider with user_id: {user_id}")
         
-        # Debug: List all providers
-        all_providers = list(ServiceProvider.objects.all())
-        logger.info(f"📋 All providers in DB: {[(p.name, p.user_id) for p in all_providers]}")
-        
-        provider = ServiceProvider.objects.get(user_id=user_id)
+        provider = request.provider
         logger.info(f"✅ Found provider: {provider.name}")
         
-        # Get all bookings for this provider
-        all_bookings = list(Booking.objects.filter(provider_id=str(provider._id)))
-        
-        # Calculate statistics
-        today = datetime.now().date()
-        
-        today_bookings = [b for b in all_bookings if b.booking_date == today]
-        week_start = today - timedelta(days=today.weekday())
-        week_bookings = [b for b in all_bookings if b.booking_date >= week_start]
-        month_bookings = [b for b in all_bookings if b.booking_date.month == today.month]
-        
-        pending_count = len([b for b in all_bookings if b.status == 'pending'])
+        # All counters come from one aggregation instead of the full booking history
+        statistics = stats.booking_statistics(provider._id)
+        statistics['average_rating'] = provider.rating
+        statistics['total_reviews'] = provider.total_reviews
         
         return Response({
             'provider': ServiceProviderSerializer(provider).data,
-            'statistics': {
-                'total_bookings': len(all_bookings),
-                'today_bookings': len(today_bookings),
-                'week_bookings': len(week_bookings),
-                'month_bookings': len(month_bookings),
-                'pending_requests': pending_count,
-                'average_rating': provider.rating,
-                'total_reviews': provider.total_reviews,
-            }
+            'statistics': statistics
         })
     except ServiceProvider.DoesNotExist:
         logger.error(f"❌ Provider profile not found for user_id: {user_id}")
@@ -698,10 +528,30 @@ def provider_dashboard(request):
             'debug_info': {
                 'user_id_used': user_id,
                 'username': request.user.username,
-                'available_providers': [p.user_id for p in ServiceProvider.objects.all()]
             }
         }, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def provider_daily_stats(request):
+    """Bookings per day over the last N days (?days=, default 30, max 365)"""
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return Response({'error': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    if days < 1 or days > 365:
+        return Response({'error': 'days must be between 1 and 365'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        provider = request.provider
+    except ServiceProvider.DoesNotExist:
+        return Response({'error': 'Provider profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'days': days,
+        'series': stats.daily_booking_series(provider._id, days)
+    })
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def debug_user_info(request):
@@ -710,7 +560,7 @@ def debug_user_info(request):
     logger = logging.getLogger(__name__)
     
     user = request.user
-    user_id = get_safe_user_id(user)
+    user_id = identity.request_user_id(request)
     
     # Check UserProfile
     try:
@@ -727,7 +577,7 @@ def debug_user_info(request):
     
     # Check ServiceProvider
     try:
-        provider = ServiceProvider.objects.get(user_id=user_id)
+        provider = request.provider
         provider_data = {
             'found': True,
             'id': str(provider._id),
@@ -761,27 +611,21 @@ def debug_user_info(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional.revalidated(conditional.provider_bookings_etag)
 def provider_bookings(request):
     """Get all bookings for the provider"""
     try:
-        # FIXED: Use get_safe_user_id instead of request.user.id
-        user_id = get_safe_user_id(request.user)
-        provider = ServiceProvider.objects.get(user_id=user_id)
-        bookings = list(Booking.objects.filter(provider_id=str(provider._id)))
-        
-        # Group by status
-        pending = [b for b in bookings if b.status == 'pending']
-        accepted = [b for b in bookings if b.status == 'accepted']
-        completed = [b for b in bookings if b.status == 'completed']
-        cancelled = [b for b in bookings if b.status in ['cancelled', 'rejected']]
+        provider = request.provider
+        context = {}
+        if repositories.enabled('provider_bookings'):
+            bookings = repositories.bookings_for_provider(provider._id)
+            context['load_relations'] = repositories.customer_relations
+        else:
+            bookings = list(Booking.objects.filter(provider_id=str(provider._id)))
         
-        return Response({
-            'all': ProviderBookingSerializer(bookings, many=True).data,
-            'pending': ProviderBookingSerializer(pending, many=True).data,
-            'accepted': ProviderBookingSerializer(accepted, many=True).data,
-            'completed': ProviderBookingSerializer(completed, many=True).data,
-            'cancelled': ProviderBookingSerializer(cancelled, many=True).data,
-        })
+        # Serialize once, then group the rendered bookings by status
+        bookings_data = ProviderBookingSerializer(bookings, many=True, context=context).data
+        return Response(group_provider_bookings(bookings_data))
     except ServiceProvider.DoesNotExist:
         return Response({'error': 'Provider profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -792,26 +636,21 @@ def provider_bookings(request):
 def provider_accept_booking(request, booking_id):
     """Accept a booking request"""
     try:
-        # FIXED: Use get_safe_user_id instead of request.user.id
-        user_id = get_safe_user_id(request.user)
-        provider = ServiceProvider.objects.get(user_id=user_id)
-        booking = Booking.objects.get(_id=ObjectId(booking_id), provider_id=str(provider._id))
-        
-        if booking.status != 'pending':
-            return Response({'error': 'Booking is not pending'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        booking.status = 'accepted'
-        booking.provider_status = 'accepted'
-        booking.save()
+        provider = request.provider
+        booking = booking_state.accept(booking_id, provider._id)
         
         return Response({
             'message': 'Booking accepted successfully!',
             'booking': ProviderBookingSerializer(booking).data
         })
+    except (InvalidId, ValueError):
+        return Response({'error': 'Invalid booking ID'}, status=status.HTTP_400_BAD_REQUEST)
     except ServiceProvider.DoesNotExist:
         return Response({'error': 'Provider profile not found'}, status=status.HTTP_404_NOT_FOUND)
-    except Booking.DoesNotExist:
+    except booking_state.BookingNotFound:
         return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+    except booking_state.InvalidTransition:
+        return Response({'error': 'Booking is not pending'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 
@@ -821,26 +660,21 @@ def provider_accept_booking(request, booking_id):
 def provider_reject_booking(request, booking_id):
     """Reject a booking request"""
     try:
-        # FIXED: Use get_safe_user_id instead of request.user.id
-        user_id = get_safe_user_id(request.user)
-        provider = ServiceProvider.objects.get(user_id=user_id)
-        booking = Booking.objects.get(_id=ObjectId(booking_id), provider_id=str(provider._id))
-        
-        if booking.status != 'pending':
-            return Response({'error': 'Booking is not pending'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        booking.status = 'rejected'
-        booking.provider_status = 'rejected'
-        booking.save()
+        provider = request.provider
+        booking = booking_state.reject(booking_id, provider._id)
         
         return Response({
             'message': 'Booking rejected',
             'booking': ProviderBookingSerializer(booking).data
         })
+    except (InvalidId, ValueError):
+        return Response({'error': 'Invalid booking ID'}, status=status.HTTP_400_BAD_REQUEST)
     except ServiceProvider.DoesNotExist:
         return Response({'error': 'Provider profile not found'}, status=status.HTTP_404_NOT_FOUND)
-    except Booking.DoesNotExist:
+    except booking_state.BookingNotFound:
         return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+    except booking_state.InvalidTransition:
+        return Response({'error': 'Booking is not pending'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 
@@ -849,30 +683,24 @@ def provider_reject_booking(request, booking_id):
 def provider_complete_booking(request, booking_id):
     """Mark booking as completed"""
     try:
-        from datetime import datetime
-        
-        # FIXED: Use get_safe_user_id instead of request.user.id
-        user_id = get_safe_user_id(request.user)
-        provider = ServiceProvider.objects.get(user_id=user_id)
-        booking = Booking.objects.get(_id=ObjectId(booking_id), provider_id=str(provider._id))
-        
-        if booking.status not in ['pending', 'accepted']:
-            return Response({'error': 'Booking cannot be marked as completed'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        booking.status = 'completed'
-        booking.provider_status = 'completed'
-        booking.completion_notes = request.data.get('completion_notes', '')
-        booking.completed_at = datetime.now()
-        booking.save()
+        provider = request.provider
+        booking = booking_state.complete(
+            booking_id, provider._id,
+            completion_notes=request.data.get('completion_notes', '')
+        )
         
         return Response({
             'message': 'Booking marked as completed!',
             'booking': ProviderBookingSerializer(booking).data
         })
+    except (InvalidId, ValueError):
+        return Response({'error': 'Invalid booking ID'}, status=status.HTTP_400_BAD_REQUEST)
     except ServiceProvider.DoesNotExist:
         return Response({'error': 'Provider profile not found'}, status=status.HTTP_404_NOT_FOUND)
-    except Booking.DoesNotExist:
+    except booking_state.BookingNotFound:
         return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+    except booking_state.InvalidTransition:
+        return Response({'error': 'Booking cannot be marked as completed'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 
@@ -882,32 +710,24 @@ def provider_complete_booking(request, booking_id):
 def provider_reviews(request):
     """Get all reviews for the provider"""
     try:
-        # FIXED: Use get_safe_user_id instead of request.user.id
-        user_id = get_safe_user_id(request.user)
-        provider = ServiceProvider.objects.get(user_id=user_id)
-        reviews = list(Review.objects.filter(provider_id=str(provider._id)))
+        provider = request.provider
+        if repositories.enabled('provider_reviews'):
+            reviews = repositories.reviews_for_provider(provider._id)
+            users = repositories.users_by_id({r.user_id for r in reviews})
+        else:
+            reviews = list(Review.objects.filter(provider_id=str(provider._id)))
+            users = identity.users_by_user_id({r.user_id for r in reviews})
         
-        # Group by rating
-        reviews_by_rating = {
-            5: len([r for r in reviews if r.rating == 5]),
-            4: len([r for r in reviews if r.rating == 4]),
-            3: len([r for r in reviews if r.rating == 3]),
-            2: len([r for r in reviews if r.rating == 2]),
-            1: len([r for r in reviews if r.rating == 1]),
-        }
+        # Per-star counts come from the provider's running histogram
+        reviews_by_rating = ratings.rating_breakdown(provider)
         
         reviews_data = []
         for r in reviews:
-            # Get username from user_id
-            try:
-                user = User.objects.get(id=r.user_id)
-                username = user.username
-            except:
-                username = "Unknown"
+            user = users.get(r.user_id)
             
             reviews_data.append({
                 'id': r.id,
-                'customer': username,
+                'customer': user.username if user else "Unknown",
                 'rating': r.rating,
                 'comment': r.comment,
                 'is_trusted': r.is_trusted,
@@ -948,9 +768,7 @@ def list_urls(request):
 def provider_profile(request):
     """Get or update provider profile"""
     try:
-        # FIXED: Use get_safe_user_id instead of request.user.id
-        user_id = get_safe_user_id(request.user)
-        provider = ServiceProvider.objects.get(user_id=user_id)
+        provider = request.provider
         
         if request.method == 'GET':
             return Response(ServiceProviderSerializer(provider).data)
@@ -964,7 +782,15 @@ def provider_profile(request):
             provider.availability = request.data.get('availability', provider.availability)
             provider.service_area = request.data.get('service_area', provider.service_area)
             provider.address = request.data.get('address', provider.address)
-            provider.save()
+            # Only write the edited fields so concurrent rating updates aren't overwritten
+            edited_fields = [
+                'name', 'phone_number', 'email', 'description',
+                'availability', 'service_area', 'address',
+            ]
+            if repositories.enabled('provider_profile'):
+                repositories.update_provider_fields(provider, edited_fields)
+            else:
+                provider.save(update_fields=edited_fields)
             
             return Response({
                 'message': 'Profile updated successfully!',
@@ -974,105 +800,43 @@ def provider_profile(request):
         return Response({'error': 'Provider profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
-def populate_fake_data(request):
-    """Populate database with fake data for testing"""
-    
-    # Clear existing data
-    ServiceProvider.objects.all().delete()
-    ServiceCategory.objects.all().delete()
-    
-    categories_data = [
-        {'name': 'Plumber', 'description': 'Expert plumbing services for leaks, installations, and repairs.'},
-        {'name': 'Barber', 'description': 'Professional hairstyling and grooming services at your convenience.'},
-        {'name': 'Carpenter', 'description': 'Skilled carpenters for furniture, repairs, and custom projects.'},
-        {'name': 'Electrician', 'description': 'Certified electricians for installations, repairs, and maintenance.'},
-        {'name': 'AC Service', 'description': 'Professional AC maintenance, servicing, and repair solutions.'},
-        {'name': 'Appliance Repair', 'description': 'Expert repair services for all your home appliances.'}
-    ]
-    
-    # Create categories
-    for cat_data in categories_data:
-        ServiceCategory.objects.create(
-            name=cat_data['name'],
-            description=cat_data['description'],
-            icon=''
-        )
-    
-    providers_data = [
-        # Plumbers (7 providers)
-        {'name': 'Raj Kumar', 'phone': '+91-9876543210', 'category': 'Plumber', 'rating': 4.5, 'experience': 5, 'address': 'Sector 22, Patiala', 'city': 'Patiala'},
-        {'name': 'Suresh Singh', 'phone': '+91-9876543211', 'category': 'Plumber', 'rating': 4.2, 'experience': 3, 'address': 'Urban Estate, Patiala', 'city': 'Patiala'},
-        {'name': 'Amit Plumbing Services', 'phone': '+91-9876543216', 'category': 'Plumber', 'rating': 4.7, 'experience': 8, 'address': 'Model Town, Patiala', 'city': 'Patiala'},
-        {'name': 'Quick Fix Plumbers', 'phone': '+91-9876543217', 'category': 'Plumber', 'rating': 4.3, 'experience': 4, 'address': 'Rajpura Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Expert Plumbing Co.', 'phone': '+91-9876543218', 'category': 'Plumber', 'rating': 4.6, 'experience': 6, 'address': 'Tripuri Town, Patiala', 'city': 'Patiala'},
-        {'name': 'Singh Plumbing Works', 'phone': '+91-9876543219', 'category': 'Plumber', 'rating': 4.4, 'experience': 7, 'address': 'Leela Bhawan, Patiala', 'city': 'Patiala'},
-        {'name': 'Modern Plumbers', 'phone': '+91-9876543220', 'category': 'Plumber', 'rating': 4.8, 'experience': 10, 'address': 'Mall Road, Patiala', 'city': 'Patiala'},
-        
-        # Barbers (7 providers)
-        {'name': 'Hair Studio - Amit', 'phone': '+91-9876543212', 'category': 'Barber', 'rating': 4.8, 'experience': 7, 'address': 'Mall Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Style Cut - Rohit', 'phone': '+91-9876543213', 'category': 'Barber', 'rating': 4.3, 'experience': 4, 'address': 'Leela Bhawan, Patiala', 'city': 'Patiala'},
-        {'name': 'Gents Salon - Rakesh', 'phone': '+91-9876543221', 'category': 'Barber', 'rating': 4.5, 'experience': 5, 'address': 'Sector 22, Patiala', 'city': 'Patiala'},
-        {'name': 'Royal Cuts', 'phone': '+91-9876543222', 'category': 'Barber', 'rating': 4.6, 'experience': 6, 'address': 'Urban Estate, Patiala', 'city': 'Patiala'},
-        {'name': 'Modern Hair Studio', 'phone': '+91-9876543223', 'category': 'Barber', 'rating': 4.7, 'experience': 8, 'address': 'Model Town, Patiala', 'city': 'Patiala'},
-        {'name': 'Trim & Style Salon', 'phone': '+91-9876543224', 'category': 'Barber', 'rating': 4.4, 'experience': 3, 'address': 'Rajpura Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Elite Barber Shop', 'phone': '+91-9876543225', 'category': 'Barber', 'rating': 4.9, 'experience': 12, 'address': 'Tripuri Town, Patiala', 'city': 'Patiala'},
-        
-        # Carpenters (7 providers)
-        {'name': 'Wood Works - Ramesh', 'phone': '+91-9876543214', 'category': 'Carpenter', 'rating': 4.6, 'experience': 8, 'address': 'Bahadurgarh Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Master Carpenter - Vijay', 'phone': '+91-9876543226', 'category': 'Carpenter', 'rating': 4.5, 'experience': 6, 'address': 'Sector 22, Patiala', 'city': 'Patiala'},
-        {'name': 'Furniture Experts', 'phone': '+91-9876543227', 'category': 'Carpenter', 'rating': 4.7, 'experience': 9, 'address': 'Mall Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Custom Wood Works', 'phone': '+91-9876543228', 'category': 'Carpenter', 'rating': 4.4, 'experience': 5, 'address': 'Urban Estate, Patiala', 'city': 'Patiala'},
-        {'name': 'Singh Carpentry', 'phone': '+91-9876543229', 'category': 'Carpenter', 'rating': 4.8, 'experience': 10, 'address': 'Model Town, Patiala', 'city': 'Patiala'},
-        {'name': 'Precision Carpenters', 'phone': '+91-9876543230', 'category': 'Carpenter', 'rating': 4.3, 'experience': 4, 'address': 'Leela Bhawan, Patiala', 'city': 'Patiala'},
-        {'name': 'Elite Furniture Makers', 'phone': '+91-9876543231', 'category': 'Carpenter', 'rating': 4.9, 'experience': 15, 'address': 'Tripuri Town, Patiala', 'city': 'Patiala'},
-        
-        # Electricians (7 providers)
-        {'name': 'Power Solutions - Ankit', 'phone': '+91-9876543232', 'category': 'Electrician', 'rating': 4.6, 'experience': 7, 'address': 'Sector 22, Patiala', 'city': 'Patiala'},
-        {'name': 'Safe Electric Works', 'phone': '+91-9876543233', 'category': 'Electrician', 'rating': 4.4, 'experience': 5, 'address': 'Mall Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Quick Fix Electricians', 'phone': '+91-9876543234', 'category': 'Electrician', 'rating': 4.7, 'experience': 8, 'address': 'Urban Estate, Patiala', 'city': 'Patiala'},
-        {'name': 'Expert Electrical Services', 'phone': '+91-9876543235', 'category': 'Electrician', 'rating': 4.5, 'experience': 6, 'address': 'Model Town, Patiala', 'city': 'Patiala'},
-        {'name': 'Modern Electricians', 'phone': '+91-9876543236', 'category': 'Electrician', 'rating': 4.8, 'experience': 10, 'address': 'Rajpura Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Reliable Electric Co.', 'phone': '+91-9876543237', 'category': 'Electrician', 'rating': 4.3, 'experience': 4, 'address': 'Leela Bhawan, Patiala', 'city': 'Patiala'},
-        {'name': 'Lightning Electric Works', 'phone': '+91-9876543238', 'category': 'Electrician', 'rating': 4.9, 'experience': 12, 'address': 'Tripuri Town, Patiala', 'city': 'Patiala'},
-        
-        # AC Service (7 providers)
-        {'name': 'AC Master - Vikram', 'phone': '+91-9876543215', 'category': 'AC Service', 'rating': 4.4, 'experience': 6, 'address': 'Sirhind Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Cool Care AC Services', 'phone': '+91-9876543239', 'category': 'AC Service', 'rating': 4.6, 'experience': 7, 'address': 'Sector 22, Patiala', 'city': 'Patiala'},
-        {'name': 'Expert AC Repair', 'phone': '+91-9876543240', 'category': 'AC Service', 'rating': 4.5, 'experience': 5, 'address': 'Mall Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Quick Cool Services', 'phone': '+91-9876543241', 'category': 'AC Service', 'rating': 4.7, 'experience': 8, 'address': 'Urban Estate, Patiala', 'city': 'Patiala'},
-        {'name': 'Arctic AC Solutions', 'phone': '+91-9876543242', 'category': 'AC Service', 'rating': 4.8, 'experience': 9, 'address': 'Model Town, Patiala', 'city': 'Patiala'},
-        {'name': 'Chill Point AC Repair', 'phone': '+91-9876543243', 'category': 'AC Service', 'rating': 4.3, 'experience': 4, 'address': 'Rajpura Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Pro AC Technicians', 'phone': '+91-9876543244', 'category': 'AC Service', 'rating': 4.9, 'experience': 11, 'address': 'Tripuri Town, Patiala', 'city': 'Patiala'},
-        
-        # Appliance Repair (7 providers)
-        {'name': 'Home Appliance Experts', 'phone': '+91-9876543245', 'category': 'Appliance Repair', 'rating': 4.5, 'experience': 6, 'address': 'Sector 22, Patiala', 'city': 'Patiala'},
-        {'name': 'Fix All Appliances', 'phone': '+91-9876543246', 'category': 'Appliance Repair', 'rating': 4.4, 'experience': 5, 'address': 'Mall Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Smart Repair Services', 'phone': '+91-9876543247', 'category': 'Appliance Repair', 'rating': 4.7, 'experience': 8, 'address': 'Urban Estate, Patiala', 'city': 'Patiala'},
-        {'name': 'Quick Fix Appliances', 'phone': '+91-9876543248', 'category': 'Appliance Repair', 'rating': 4.6, 'experience': 7, 'address': 'Model Town, Patiala', 'city': 'Patiala'},
-        {'name': 'Modern Appliance Care', 'phone': '+91-9876543249', 'category': 'Appliance Repair', 'rating': 4.8, 'experience': 9, 'address': 'Rajpura Road, Patiala', 'city': 'Patiala'},
-        {'name': 'Expert Appliance Solutions', 'phone': '+91-9876543250', 'category': 'Appliance Repair', 'rating': 4.3, 'experience': 4, 'address': 'Leela Bhawan, Patiala', 'city': 'Patiala'},
-        {'name': 'Reliable Repairs Hub', 'phone': '+91-9876543251', 'category': 'Appliance Repair', 'rating': 4.9, 'experience': 10, 'address': 'Tripuri Town, Patiala', 'city': 'Patiala'},
-    ]
-    
-    # Create providers
-    created = 0
-    for prov in providers_data:
-        ServiceProvider.objects.create(
-            name=prov['name'],
-            phone_number=prov['phone'],
-            category_name=prov['category'],
-            rating=prov['rating'],
-            original_rating=prov['rating'],
-            experience_years=prov['experience'],
-            total_reviews=10,
-            address=prov['address'],
-            city=prov.get('city', 'Patiala'),
-            email=''
-        )
-        created += 1
-    
-    return JsonResponse({
-        'message': 'Fake data populated successfully!',
-        'categories': ServiceCategory.objects.count(),
-        'providers': created
-    })
\ No newline at end of file
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, dataset):
+    """
+    Stream all bookings or reviews as NDJSON or CSV
+    Query params: output (ndjson|csv), gzip, from/to (created_at dates),
+    status, provider_id, batch_size.
+    """
+    if dataset not in exports.DATASETS:
+        return Response({'error': f"Unknown export '{dataset}'"}, status=status.HTTP_404_NOT_FOUND)
+    params = request.query_params
+    export_format = params.get('output', 'ndjson')
+    if export_format not in exports.FORMATS:
+        return Response({'error': f"output must be one of {', '.join(exports.FORMATS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    gzip = params.get('gzip', '').lower() in ('1', 'true', 'yes')
+    try:
+        query = exports.build_query(dataset, params)
+        batch_size = exports.parse_batch_size(params.get('batch_size'))
+    except exports.ExportError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    logger.info(f"📤 Export of {dataset} as {export_format} by {request.user.username}: {query}")
+    response = StreamingHttpResponse(
+        exports.stream(dataset, query, export_format, batch_size=batch_size, gzip=gzip),
+        content_type='application/gzip' if gzip else exports.CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(dataset, export_format, gzip)}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """Hit/miss counters of this worker's in-process caches"""
+    return Response({
+        'provider_cache': provider_cache.stats(),
+        'singleflight': singleflight.stats(),
+        'translation_cache': translation_cache.stats(),
+    })
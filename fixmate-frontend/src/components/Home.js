@@ -51,19 +51,6 @@ const Home = () => {
     navigate(`/service/${categoryName}`);
   };
 
-  const handlePopulateData = async () => {
-    try {
-      setLoading(true);
-      await apiService.populateData();
-      await fetchCategories(); // Refresh categories
-      alert('Test data populated successfully!');
-    } catch (err) {
-      alert('Failed to populate data. Make sure Django server is running.');
-    } finally {
-      setLoading(false);
-    }
-  };
-
   if (loading) {
     return (
       <div className="loading">
@@ -94,9 +81,6 @@ const Home = () => {
         {categories.length === 0 && (
           <div className="no-data">
             <p>No services available yet.</p>
-            <button onClick={handlePopulateData} className="populate-btn">
-              Load Test Data
-            </button>
           </div>
         )}
       </div>
@@ -24,6 +24,8 @@ const ServiceProviders = () => {
   const [categoryInfo, setCategoryInfo] = useState('');
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchProviders();
@@ -35,6 +37,7 @@ const ServiceProviders = () => {
       setLoading(true);
       const data = await apiService.getProviders(categoryName, selectedCity);
       setProviders(data.providers || []);
+      setNextCursor(data.has_more ? data.next_cursor : null);
       setCategoryInfo(data.category || categoryName);
       setError(null);
     } catch (err) {
@@ -45,6 +48,19 @@ const ServiceProviders = () => {
     }
   };
 
+  const loadMoreProviders = async () => {
+    try {
+      setLoadingMore(true);
+      const data = await apiService.getProviders(categoryName, selectedCity, nextCursor);
+      setProviders((current) => [...current, ...(data.providers || [])]);
+      setNextCursor(data.has_more ? data.next_cursor : null);
+    } catch (err) {
+      console.error('Error loading more providers:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleProviderClick = (providerId) => {
     navigate(`/provider/${providerId}`);
   };
@@ -116,7 +132,7 @@ const ServiceProviders = () => {
           </div>
           
           <p className="providers-count">
-            {providers.length} provider{providers.length !== 1 ? 's' : ''} available
+            {providers.length}{nextCursor ? '+' : ''} provider{providers.length !== 1 ? 's' : ''} available
           </p>
         </div>
       </div>
@@ -201,6 +217,18 @@ const ServiceProviders = () => {
           ))}
         </div>
       )}
+
+      {nextCursor && (
+        <div className="load-more">
+          <button
+            onClick={loadMoreProviders}
+            className="retry-btn"
+            disabled={loadingMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load More Providers'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,6 +1,7 @@
 // src/context/AuthContext.js
 import React, { createContext, useState, useEffect } from 'react';
 import { jwtDecode } from 'jwt-decode';
+import { apiService } from '../services/api';
 
 export const AuthContext = createContext();
 
@@ -41,6 +42,11 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revoke the tokens server-side; local logout doesn't wait for it
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (localStorage.getItem('access_token')) {
+      apiService.logout(refreshToken).catch(() => {});
+    }
     localStorage.removeItem('access_token');
     localStorage.removeItem('refresh_token');
     localStorage.removeItem('user');
@@ -48,6 +48,16 @@ class ApiService {
     return this.handleResponse(response);
   }
 
+  async logout(refreshToken) {
+    const response = await fetch(`${API_BASE_URL}/api/logout/`, {
+      method: 'POST',
+      headers: this.getAuthHeaders(),
+      body: JSON.stringify({ refresh: refreshToken })
+    });
+
+    return this.handleResponse(response);
+  }
+
   async getUserProfile() {
     const response = await fetch(`${API_BASE_URL}/api/profile/`, {
       headers: this.getAuthHeaders()
@@ -62,10 +72,17 @@ class ApiService {
     return this.handleResponse(response);
   }
 
-  async getProviders(categoryName, city = null) {
-    let url = `${API_BASE_URL}/service/${categoryName}/`;
+  async getProviders(categoryName, city = null, cursor = null) {
+    const params = new URLSearchParams();
     if (city) {
-      url += `?city=${encodeURIComponent(city)}`;
+      params.append('city', city);
+    }
+    if (cursor) {
+      params.append('cursor', cursor);
+    }
+    let url = `${API_BASE_URL}/service/${categoryName}/`;
+    if (params.toString()) {
+      url += `?${params.toString()}`;
     }
     
     const response = await fetch(url, {
@@ -207,12 +224,6 @@ class ApiService {
 
     return this.handleResponse(response);
   }
-
-  // ==================== UTILITY ====================
-  async populateData() {
-    const response = await fetch(`${API_BASE_URL}/populate-data/`);
-    return this.handleResponse(response);
-  }
 }
 
 export const apiService = new ApiService();
\ No newline at end of file